@@ -0,0 +1,157 @@
+# =========================================================================
+# This is OPEN SOURCE SOFTWARE governed by the Gnu General Public
+# License (GPL) version 3, as described at www.opensource.org.
+# Copyright (C)2016 William H. Majoros (martiandna@gmail.com).
+# Author: Siyan Liu
+# =========================================================================
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals, generators, nested_scopes, with_statement)
+
+import collections
+
+import numpy as np
+
+
+class AlignabilityBlock:
+    """
+    This class holds the alignability intervals of one fixed-size block of a
+    chromosome as sorted arrays, plus a sparse table answering range-minimum
+    queries in O(1) after an O(n log n) build.
+
+    Attributes:
+        starts, ends : int32 arrays, sorted, non-overlapping intervals
+        values : float32 array
+        table : array of float32 arrays; table[k][i] = min(values[i:i+2^k])
+    Instance Methods:
+        block=AlignabilityBlock(intervals) # sequence of (start,end,value)
+        x=block.rangeMin(begin,end) # None if no interval overlaps
+        n=block.numBytes()
+    Class Methods:
+        none
+    """
+
+    def __init__(self, intervals):
+        n = len(intervals)
+        self.starts = np.fromiter((x[0] for x in intervals), np.int32, n)
+        self.ends = np.fromiter((x[1] for x in intervals), np.int32, n)
+        self.values = np.fromiter((x[2] for x in intervals), np.float32, n)
+        table = [self.values]
+        width = 1
+        while 2 * width <= n:
+            prev = table[-1]
+            table.append(np.minimum(prev[:-width], prev[width:]))
+            width *= 2
+        self.table = table
+
+    def rangeMin(self, begin, end):
+        i = int(np.searchsorted(self.ends, begin, side="right"))
+        j = int(np.searchsorted(self.starts, end, side="left")) - 1
+        if i > j:
+            return None
+        k = (j - i + 1).bit_length() - 1
+        row = self.table[k]
+        return float(min(row[i], row[j - (1 << k) + 1]))
+
+    def numBytes(self):
+        return self.starts.nbytes + self.ends.nbytes + \
+               sum(x.nbytes for x in self.table)
+
+
+class AlignabilityCache:
+    """
+    This class answers minimum-alignability queries for reference intervals
+    from in-memory copies of an alignability bigWig.  The track is split into
+    fixed-size blocks; blocks that are preloaded (the target windows, or whole
+    chromosomes) stay resident, and any other block is loaded on first use
+    and kept in an LRU cache holding at most maxBytes.
+
+    Attributes:
+        bigwig : pyBigWig file
+        blockSize : int
+        maxBytes : int
+        pinned : dict mapping (chrom,blockIndex) to AlignabilityBlock
+        lru : OrderedDict mapping (chrom,blockIndex) to AlignabilityBlock
+        lruBytes : int
+    Instance Methods:
+        cache=AlignabilityCache(bigwig,blockSize=1000000,maxBytes=256000000)
+        cache.preload(chrom,begin,end)
+        cache.preloadChrom(chrom)
+        x=cache.getMin(chrom,begin,end) # returns None if no data in range
+    Private Methods:
+        block=self.loadBlock(chrom,index)
+        block=self.getBlock(chrom,index)
+    Class Methods:
+        none
+    """
+
+    def __init__(self, bigwig, blockSize=1000000, maxBytes=256000000):
+        self.bigwig = bigwig
+        self.chromLengths = bigwig.chroms()
+        self.blockSize = blockSize
+        self.maxBytes = maxBytes
+        self.pinned = {}
+        self.lru = collections.OrderedDict()
+        self.lruBytes = 0
+
+    def loadBlock(self, chrom, index):
+        begin = index * self.blockSize
+        end = min(begin + self.blockSize, self.chromLengths[chrom])
+        intervals = self.bigwig.intervals(chrom, begin, end) or ()
+        clipped = [(max(s, begin), min(e, end), v) for (s, e, v) in intervals]
+        return AlignabilityBlock(clipped)
+
+    def preload(self, chrom, begin, end):
+        """
+        Loads and pins all blocks overlapping [begin,end) of chrom.
+        """
+        if chrom not in self.chromLengths:
+            return
+        end = min(end, self.chromLengths[chrom])
+        for index in range(begin // self.blockSize,
+                           (end - 1) // self.blockSize + 1):
+            key = (chrom, index)
+            if key in self.pinned:
+                continue
+            block = self.lru.pop(key, None)
+            if block is not None:
+                self.lruBytes -= block.numBytes()
+            else:
+                block = self.loadBlock(chrom, index)
+            self.pinned[key] = block
+
+    def preloadChrom(self, chrom):
+        if chrom in self.chromLengths:
+            self.preload(chrom, 0, self.chromLengths[chrom])
+
+    def getBlock(self, chrom, index):
+        key = (chrom, index)
+        block = self.pinned.get(key)
+        if block is not None:
+            return block
+        block = self.lru.pop(key, None)
+        if block is None:
+            block = self.loadBlock(chrom, index)
+            self.lruBytes += block.numBytes()
+        self.lru[key] = block
+        while self.lruBytes > self.maxBytes and len(self.lru) > 1:
+            (oldKey, old) = self.lru.popitem(last=False)
+            self.lruBytes -= old.numBytes()
+        return block
+
+    def getMin(self, chrom, begin, end):
+        """
+        Returns the minimum alignability over [begin,end) of chrom, ignoring
+        bases with no data, or None if there is no data at all.
+        """
+        if chrom not in self.chromLengths:
+            return None
+        end = min(end, self.chromLengths[chrom])
+        lowest = None
+        blockSize = self.blockSize
+        for index in range(begin // blockSize, (end - 1) // blockSize + 1):
+            blockBegin = index * blockSize
+            x = self.getBlock(chrom, index).rangeMin(
+                max(begin, blockBegin), min(end, blockBegin + blockSize))
+            if x is not None and (lowest is None or x < lowest):
+                lowest = x
+        return lowest
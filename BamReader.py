@@ -0,0 +1,56 @@
+# =========================================================================
+# This is OPEN SOURCE SOFTWARE governed by the Gnu General Public
+# License (GPL) version 3, as described at www.opensource.org.
+# Copyright (C)2016 William H. Majoros (martiandna@gmail.com).
+# Author: Siyan Liu
+# =========================================================================
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals, generators, nested_scopes, with_statement)
+
+import pysam
+
+from BamRecord import BamRecord
+
+
+class BamReader:
+    """
+    This class reads alignments from a BAM or CRAM file and returns them one
+    at a time as BamRecord objects, in file order, like SamReader does for
+    SAM files.  Decoding is done by htslib; when threads>1, BGZF blocks are
+    decompressed on a pool of that many threads.  CRAM files need the
+    reference FASTA they were compressed against.
+
+    Attributes:
+        file : pysam.AlignmentFile
+    Instance Methods:
+        reader=BamReader(filename,threads=1,reference=None)
+        rec=reader.nextSequence() # returns None at end of file
+        offset=reader.tell() # BGZF virtual offset of the next record
+        reader.seek(offset) # BAM only; htslib cannot seek in CRAM
+        reader.close()
+    Class Methods:
+        none
+    """
+
+    def __init__(self, filename, threads=1, reference=None):
+        mode = "rc" if filename.lower().endswith(".cram") else "rb"
+        self.file = pysam.AlignmentFile(filename, mode, threads=threads,
+                                        reference_filename=reference,
+                                        check_sq=False)
+        self.iterator = iter(self.file)
+
+    def nextSequence(self):
+        segment = next(self.iterator, None)
+        if segment is None:
+            return None
+        return BamRecord(segment)
+
+    def tell(self):
+        return self.file.tell()
+
+    def seek(self, offset):
+        self.file.seek(offset)
+        self.iterator = iter(self.file)
+
+    def close(self):
+        self.file.close()
@@ -0,0 +1,127 @@
+# =========================================================================
+# This is OPEN SOURCE SOFTWARE governed by the Gnu General Public
+# License (GPL) version 3, as described at www.opensource.org.
+# Copyright (C)2016 William H. Majoros (martiandna@gmail.com).
+# Author: Siyan Liu
+# =========================================================================
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals, generators, nested_scopes, with_statement)
+
+import re
+
+from CigarString import CigarString
+
+
+class BamRecord:
+    """
+    This class represents one alignment decoded from a BAM or CRAM file.  It
+    provides the subset of the SamRecord interface that the TRACER pipeline
+    uses, so that StreamSamReads can group BAM records exactly as it groups
+    SAM records.  Only plain Python values are stored (not the pysam object),
+    so records can be pickled and sent to worker processes.
+
+    Attributes:
+        ID : string
+        flags : int
+        refName : string
+        refPos : int (0-based)
+        cigarString : string
+        seq : string
+        tags : dict mapping tag name to value
+        mateRefName : string
+        matePos : int (0-based)
+    Instance Methods:
+        rec=BamRecord(segment) # segment is a pysam AlignedSegment
+        ID=rec.getID()
+        refName=rec.getRefName()
+        pos=rec.getRefPos()
+        cigar=rec.getCigar() # returns CigarString object
+        cigar=rec.getCigarString() # returns the CIGAR as text
+        seq=rec.getSequence()
+        L=rec.seqLength()
+        value=rec.getTag(tag) # returns None if tag is absent
+        n=rec.countMismatches()
+        boolean=rec.flag_unmapped()
+        boolean=rec.flag_PCRduplicate()
+        boolean=rec.flag_revComp()
+        boolean=rec.flag_firstOfPair()
+        boolean=rec.flag_secondOfPair()
+        boolean=rec.flag_secondary()
+        boolean=rec.flag_supplementary()
+    Class Methods:
+        none
+    """
+
+    MD_MISMATCH = re.compile(r"\^[A-Za-z]+|[A-Za-z]")
+
+    def __init__(self, segment):
+        self.ID = segment.query_name
+        self.flags = segment.flag
+        self.refName = segment.reference_name
+        self.refPos = segment.reference_start
+        self.cigarString = segment.cigarstring or "*"
+        self.seq = segment.query_sequence or "*"
+        self.tags = dict(segment.get_tags())
+        self.mateRefName = segment.next_reference_name
+        self.matePos = segment.next_reference_start
+        self.cigar = None
+
+    def getID(self):
+        return self.ID
+
+    def getRefName(self):
+        return self.refName
+
+    def getRefPos(self):
+        return self.refPos
+
+    def getCigar(self):
+        if self.cigar is None:
+            self.cigar = CigarString(self.cigarString)
+        return self.cigar
+
+    def getCigarString(self):
+        return self.cigarString
+
+    def getSequence(self):
+        return self.seq
+
+    def seqLength(self):
+        return len(self.seq)
+
+    def getTag(self, tag):
+        return self.tags.get(tag)
+
+    def countMismatches(self):
+        """
+        Counts mismatched bases, using the MD tag if present and otherwise the
+        edit distance in the NM tag minus the indel bases in the CIGAR.
+        """
+        MD = self.tags.get("MD")
+        if MD is not None:
+            return sum(1 for x in self.MD_MISMATCH.findall(MD) if x[0] != "^")
+        NM = self.tags.get("NM")
+        if NM is None:
+            return 0
+        return int(NM) - self.getCigar().countIndelBases()
+
+    def flag_unmapped(self):
+        return (self.flags & 0x4) != 0
+
+    def flag_PCRduplicate(self):
+        return (self.flags & 0x400) != 0
+
+    def flag_revComp(self):
+        return (self.flags & 0x10) != 0
+
+    def flag_firstOfPair(self):
+        return (self.flags & 0x40) != 0
+
+    def flag_secondOfPair(self):
+        return (self.flags & 0x80) != 0
+
+    def flag_secondary(self):
+        return (self.flags & 0x100) != 0
+
+    def flag_supplementary(self):
+        return (self.flags & 0x800) != 0
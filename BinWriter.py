@@ -0,0 +1,233 @@
+# =========================================================================
+# This is OPEN SOURCE SOFTWARE governed by the Gnu General Public
+# License (GPL) version 3, as described at www.opensource.org.
+# Copyright (C)2016 William H. Majoros (martiandna@gmail.com).
+# Author: Siyan Liu
+# =========================================================================
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals, generators, nested_scopes, with_statement)
+
+import atexit
+import gzip
+import os
+import struct
+import zlib
+
+
+class BgzfWriter:
+    """
+    This class writes BGZF (blocked gzip, as used for BAM), which any gzip
+    reader can decompress and which can be truncated at any block boundary.
+
+    Attributes:
+        raw : binary file object
+        pending : bytearray of uncompressed data not yet in a block
+    Instance Methods:
+        writer=BgzfWriter(raw)
+        writer.write(data) # data is bytes
+        writer.flush() # compresses pending data into blocks
+        writer.close() # also writes the BGZF end-of-file block
+    Class Methods:
+        none
+    """
+
+    BLOCK_SIZE = 65280
+    HEADER = struct.Struct("<4BI2BH2BHH")
+    EOF = bytes(bytearray.fromhex(
+        "1f8b08040000000000ff0600424302001b0003000000000000000000"))
+
+    def __init__(self, raw):
+        self.raw = raw
+        self.pending = bytearray()
+
+    def write(self, data):
+        self.pending.extend(data)
+        while len(self.pending) >= self.BLOCK_SIZE:
+            self.writeBlock(bytes(self.pending[:self.BLOCK_SIZE]))
+            del self.pending[:self.BLOCK_SIZE]
+
+    def writeBlock(self, data):
+        compressor = zlib.compressobj(6, zlib.DEFLATED, -15)
+        compressed = compressor.compress(data) + compressor.flush()
+        blockSize = self.HEADER.size + len(compressed) + 8
+        self.raw.write(self.HEADER.pack(31, 139, 8, 4, 0, 0, 255, 6,
+                                        66, 67, 2, blockSize - 1))
+        self.raw.write(compressed)
+        self.raw.write(struct.pack("<II", zlib.crc32(data) & 0xffffffff,
+                                   len(data)))
+
+    def flush(self):
+        if len(self.pending) > 0:
+            self.writeBlock(bytes(self.pending))
+            self.pending = bytearray()
+        self.raw.flush()
+
+    def close(self):
+        self.flush()
+        self.raw.write(self.EOF)
+        self.raw.close()
+
+
+class BinWriter:
+    """
+    This class is a buffered text writer for one bin or dump file.  Lines are
+    collected in memory and written with one system call per bufferSize
+    bytes, optionally through gzip or BGZF compression.  It has a write()
+    method, so it can be passed anywhere a file is expected (e.g., to
+    Tracer.bin() or print(file=...)).
+
+    checkpoint() commits everything written so far to disk and returns the
+    file's length; the file can be reopened later with resumeAt set to that
+    length, to truncate it there and append.  Compressed files end a gzip
+    member (or BGZF block) at each checkpoint, so they stay valid when
+    truncated; gzip headers carry no timestamp, so the bytes written are the
+    same whether or not a run was resumed.
+
+    Attributes:
+        filename : string
+        compression : None, "gzip" or "bgzf"
+        bufferSize : int
+        lines : array of string
+        size : int (bytes buffered in lines)
+    Instance Methods:
+        writer=BinWriter(filename,compression=None,bufferSize=4194304,
+                         resumeAt=None)
+        writer.write(text)
+        writer.flush()
+        length=writer.checkpoint()
+        writer.close()
+    Class Methods:
+        none
+    """
+
+    def __init__(self, filename, compression=None, bufferSize=4 << 20,
+                 resumeAt=None):
+        self.filename = filename
+        self.compression = compression
+        self.bufferSize = bufferSize
+        if resumeAt is None:
+            raw = open(filename, "wb")
+        else:
+            raw = open(filename, "r+b")
+            raw.truncate(resumeAt)
+            raw.seek(resumeAt)
+        self.output = raw
+        if compression == "gzip":
+            self.file = gzip.GzipFile(fileobj=raw, mode="wb", mtime=0)
+            self.raw = raw
+        elif compression == "bgzf":
+            self.file = BgzfWriter(raw)
+            self.raw = None
+        elif compression is None:
+            self.file = raw
+            self.raw = None
+        else:
+            raise Exception("Unknown compression: " + compression)
+        self.lines = []
+        self.size = 0
+        self.closed = False
+
+    def write(self, text):
+        self.lines.append(text)
+        self.size += len(text)
+        if self.size >= self.bufferSize:
+            self.drain()
+
+    def drain(self):
+        if len(self.lines) > 0:
+            self.file.write("".join(self.lines).encode("utf-8"))
+            self.lines = []
+            self.size = 0
+
+    def flush(self):
+        """
+        Writes all buffered lines through to the operating system.
+        """
+        self.drain()
+        self.file.flush()
+        if self.raw is not None:
+            self.raw.flush()
+
+    def checkpoint(self):
+        """
+        Writes out and syncs everything written so far, ending the current
+        gzip member; returns the length of the file.
+        """
+        self.drain()
+        if self.compression == "gzip":
+            self.file.close()
+        else:
+            self.file.flush()
+        self.output.flush()
+        os.fsync(self.output.fileno())
+        length = self.output.tell()
+        if self.compression == "gzip":
+            self.file = gzip.GzipFile(fileobj=self.output, mode="wb", mtime=0)
+        return length
+
+    def close(self):
+        if self.closed:
+            return
+        self.drain()
+        self.file.close()
+        if self.raw is not None:
+            self.raw.close()
+        self.closed = True
+
+
+class BinRouter:
+    """
+    This class owns one BinWriter per bin in an output directory and routes
+    binned reads to them, so that drivers never handle raw file handles.  The
+    writers are closed (and so flushed) by close(), on leaving a with-block,
+    or at interpreter exit, whichever comes first.
+
+    Attributes:
+        outDir : string
+        writers : dict mapping bin name to BinWriter
+    Instance Methods:
+        router=BinRouter(outDir,bins,compression=None,bufferSize=4194304,
+                         resumeAt=None) # resumeAt maps bin name to length
+        writer=router.getWriter(binName)
+        router.flush()
+        lengths=router.checkpoint() # dict mapping bin name to length
+        router.close()
+    Class Methods:
+        none
+    """
+
+    def __init__(self, outDir, bins, compression=None, bufferSize=4 << 20,
+                 resumeAt=None):
+        if not os.path.exists(outDir):
+            os.makedirs(outDir)
+        self.outDir = outDir
+        suffix = ".txt" if compression is None else ".txt.gz"
+        self.writers = {}
+        for binName in bins:
+            filename = os.path.join(outDir, binName + suffix)
+            self.writers[binName] = BinWriter(
+                filename, compression, bufferSize,
+                None if resumeAt is None else resumeAt[binName])
+        atexit.register(self.close)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, traceback):
+        self.close()
+
+    def getWriter(self, binName):
+        return self.writers[binName]
+
+    def flush(self):
+        for writer in self.writers.values():
+            writer.flush()
+
+    def checkpoint(self):
+        return dict((binName, writer.checkpoint())
+                    for (binName, writer) in self.writers.items())
+
+    def close(self):
+        atexit.unregister(self.close)
+        for writer in self.writers.values():
+            writer.close()
@@ -0,0 +1,131 @@
+# =========================================================================
+# This is OPEN SOURCE SOFTWARE governed by the Gnu General Public
+# License (GPL) version 3, as described at www.opensource.org.
+# Copyright (C)2016 William H. Majoros (martiandna@gmail.com).
+# Author: Siyan Liu
+# =========================================================================
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals, generators, nested_scopes, with_statement)
+
+import os
+import pickle
+import shutil
+
+
+class StreamSegment:
+    """
+    This class passes at most maxGroups read groups from a stream and then
+    reports the end of input, so that a run can be cut into segments with
+    nothing in flight between them.  atEnd tells whether the underlying
+    stream itself was exhausted.
+
+    Attributes:
+        stream : StreamSamReads
+        remaining : int
+        atEnd : boolean
+    Instance Methods:
+        segment=StreamSegment(stream,maxGroups)
+        groups=segment.nextBatch(n)
+    Class Methods:
+        none
+    """
+
+    def __init__(self, stream, maxGroups):
+        self.stream = stream
+        self.remaining = maxGroups
+        self.atEnd = False
+
+    def nextBatch(self, n):
+        if self.remaining <= 0 or self.atEnd:
+            return []
+        wanted = min(n, self.remaining)
+        groups = self.stream.nextBatch(wanted)
+        if len(groups) < wanted:
+            self.atEnd = True
+        self.remaining -= len(groups)
+        return groups
+
+
+class Checkpoint:
+    """
+    This class saves and restores the state of a bin-reads run in a
+    directory, so that a run that was killed can be resumed from the last
+    checkpoint and give the same output as a run that was not.  A checkpoint
+    is taken when nothing is in flight: every read group read so far has
+    been binned and written.  It holds the stream state (input offset and
+    buffered record), the Deduplicator's hashes, readsBinned, the Metrics
+    counters, the OutcomeAggregator, and the committed length of each bin
+    file (which are truncated to it on resuming).
+
+    Each checkpoint is written into a new numbered subdirectory, and
+    state.pkl, which names it, is replaced atomically, so a crash while
+    saving leaves the previous checkpoint intact.  The run's settings
+    (input, config, output options) are stored with it, and a checkpoint
+    made with different settings is refused.
+
+    Attributes:
+        directory : string
+        settings : dict
+        generation : int, number of the last checkpoint
+    Instance Methods:
+        checkpoint=Checkpoint(directory,settings)
+        state=checkpoint.load() # dict, or None if there is no checkpoint
+        checkpoint.save(state,deduplicator=None)
+        checkpoint.remove() # after the run has finished
+    Class Methods:
+        none
+    """
+
+    STATE_FILE = "state.pkl"
+
+    def __init__(self, directory, settings):
+        self.directory = directory
+        self.settings = settings
+        self.generation = 0
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+
+    def stateFile(self):
+        return os.path.join(self.directory, self.STATE_FILE)
+
+    def generationDir(self, generation):
+        return os.path.join(self.directory, str(generation))
+
+    def load(self):
+        """
+        Returns the saved state, with "dedupDir" set to the directory of the
+        Deduplicator's runs, or None if no checkpoint was saved.
+        """
+        if not os.path.exists(self.stateFile()):
+            return None
+        with open(self.stateFile(), "rb") as IN:
+            state = pickle.load(IN)
+        if state["settings"] != self.settings:
+            raise Exception("Checkpoint in " + self.directory +
+                            " was made by a run with different settings")
+        self.generation = state["generation"]
+        state["dedupDir"] = self.generationDir(self.generation)
+        return state
+
+    def save(self, state, deduplicator=None):
+        generation = self.generation + 1
+        directory = self.generationDir(generation)
+        if os.path.exists(directory):
+            shutil.rmtree(directory)
+        os.makedirs(directory)
+        state = dict(state)
+        state["settings"] = self.settings
+        state["generation"] = generation
+        if deduplicator is not None:
+            state["dedup"] = deduplicator.saveState(directory)
+        temp = self.stateFile() + ".tmp"
+        with open(temp, "wb") as OUT:
+            pickle.dump(state, OUT, pickle.HIGHEST_PROTOCOL)
+            OUT.flush()
+            os.fsync(OUT.fileno())
+        os.replace(temp, self.stateFile())
+        shutil.rmtree(self.generationDir(self.generation), ignore_errors=True)
+        self.generation = generation
+
+    def remove(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
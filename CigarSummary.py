@@ -0,0 +1,112 @@
+# =========================================================================
+# This is OPEN SOURCE SOFTWARE governed by the Gnu General Public
+# License (GPL) version 3, as described at www.opensource.org.
+# Copyright (C)2016 William H. Majoros (martiandna@gmail.com).
+# Author: Siyan Liu
+# =========================================================================
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals, generators, nested_scopes, with_statement)
+
+import re
+
+
+class CigarSummary:
+    """
+    This class holds, as plain integers, everything the HSP pipeline needs
+    from a processed CIGAR string (one restricted to the ops in keepOps):
+    the read and reference intervals spanned by the kept ops, the aligned
+    length (M, = and X bases), the number of indel bases, and each indel as
+    (op,refPos,length).  scan() computes all of it in one pass over the CIGAR
+    text, without making CigarOp objects.
+
+    Attributes:
+        readBegin, readEnd, refBegin, refEnd : int
+        alignedLength : int
+        indelBases : int
+        indels : array of (op,refPos,length)
+        cigarString : string, the kept ops as CIGAR text
+    Instance Methods:
+        none
+    Class Methods:
+        summary=CigarSummary.scan(cigarString,refPos,keepOps)
+        summary=CigarSummary.fromCigar(cigar) # cigar is a processed
+                                              # CigarString with intervals
+    """
+
+    __slots__ = ("readBegin", "readEnd", "refBegin", "refEnd", "alignedLength",
+                 "indelBases", "indels", "cigarString")
+
+    CIGAR_OP = re.compile(r"(\d+)([MIDNSHP=X])")
+    ADVANCE_READ = frozenset("MIS=X")
+    ADVANCE_REF = frozenset("MDN=X")
+    ALIGNED = frozenset("M=X")
+    INDEL = frozenset("ID")
+
+    def __init__(self):
+        self.readBegin = self.readEnd = self.refBegin = self.refEnd = 0
+        self.alignedLength = self.indelBases = 0
+        self.indels = []
+        self.cigarString = ""
+
+    @classmethod
+    def scan(cls, cigarString, refPos, keepOps):
+        """
+        Parses the CIGAR text once, filtering it against keepOps.
+        """
+        advanceRead = cls.ADVANCE_READ
+        advanceRef = cls.ADVANCE_REF
+        aligned = cls.ALIGNED
+        indel = cls.INDEL
+        summary = cls()
+        indels = summary.indels
+        kept = []
+        readPos = 0
+        first = True
+        for (length, op) in cls.CIGAR_OP.findall(cigarString):
+            L = int(length)
+            keep = op in keepOps
+            if keep:
+                if first:
+                    summary.readBegin = readPos
+                    summary.refBegin = refPos
+                    first = False
+                kept.append(length + op)
+                if op in aligned:
+                    summary.alignedLength += L
+                elif op in indel:
+                    summary.indelBases += L
+                    indels.append((op, refPos, L))
+            if op in advanceRead:
+                readPos += L
+            if op in advanceRef:
+                refPos += L
+            if keep:
+                summary.readEnd = readPos
+                summary.refEnd = refPos
+        summary.cigarString = "".join(kept)
+        return summary
+
+    @classmethod
+    def fromCigar(cls, cigar):
+        """
+        Summarizes a processed CigarString whose intervals were computed.
+        """
+        summary = cls()
+        n = cigar.length()
+        for i in range(n):
+            op = cigar[i]
+            L = op.getLength()
+            if op.getOp() in cls.ALIGNED:
+                summary.alignedLength += L
+            elif op.getOp() in cls.INDEL:
+                summary.indelBases += L
+                summary.indels.append((op.getOp(),
+                                       op.getRefInterval().getBegin(), L))
+        firstOp = cigar[0]
+        lastOp = cigar[n - 1]
+        summary.readBegin = firstOp.getQueryInterval().getBegin()
+        summary.readEnd = lastOp.getQueryInterval().getEnd()
+        summary.refBegin = firstOp.getRefInterval().getBegin()
+        summary.refEnd = lastOp.getRefInterval().getEnd()
+        summary.cigarString = cigar.toString()
+        return summary
@@ -0,0 +1,160 @@
+# =========================================================================
+# This is OPEN SOURCE SOFTWARE governed by the Gnu General Public
+# License (GPL) version 3, as described at www.opensource.org.
+# Copyright (C)2016 William H. Majoros (martiandna@gmail.com).
+# Author: Siyan Liu
+# =========================================================================
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals, generators, nested_scopes, with_statement)
+
+import numpy as np
+
+
+class CutSiteIndex:
+    """
+    This class indexes the cut sites of one or many targets, per chromosome,
+    as sorted arrays, so that the questions asked for every HSP (is an indel
+    within window bp of a cut site, does an alignment span a cut site, how
+    far is an anchor from the nearest cut site, which target does a read
+    belong to) are answered by binary search in O(log n), however many
+    targets there are.  Since all windows have the same width, the window
+    begins and ends are sorted in the same order as the sites.
+
+    Attributes:
+        window : int
+        sites : dict mapping chrom to sorted int64 array of cut sites
+        begins, ends : dicts mapping chrom to int64 arrays, the windows
+                       (site-window,site+window) in the same order
+        targets : dict mapping chrom to array of target IDs, in the same order
+    Instance Methods:
+        index=CutSiteIndex(sites,window=15) # sites: array of (chrom,pos,ID)
+        n=index.numSites()
+        chroms=index.getChroms()
+        boolean=index.hasChrom(chrom)
+        boolean=index.overlapsWindow(chrom,begin,end) # [begin,end) is near
+                                                       # a cut site
+        boolean=index.spansSite(chrom,begin,end) # begin<site<end for a site
+        (distance,targetID)=index.nearest(chrom,pos) # None if no sites
+        distance=index.nearestDistance(chrom,pos) # None if no sites
+        targetID=index.assignTarget(chrom,begin,end,maxDistance=None)
+        windows=index.getWindows(padding) # merged (chrom,begin,end)
+    Class Methods:
+        index=CutSiteIndex.fromTable(filename,window=15) # TargetSite table
+    """
+
+    def __init__(self, sites, window=15):
+        self.window = window
+        byChrom = {}
+        for (chrom, pos, ID) in sites:
+            byChrom.setdefault(chrom, []).append((int(pos), ID))
+        self.sites = {}
+        self.begins = {}
+        self.ends = {}
+        self.targets = {}
+        for (chrom, entries) in byChrom.items():
+            entries.sort(key=lambda x: x[0])
+            positions = np.array([x[0] for x in entries], dtype=np.int64)
+            self.sites[chrom] = positions
+            self.begins[chrom] = positions - window
+            self.ends[chrom] = positions + window
+            self.targets[chrom] = [x[1] for x in entries]
+
+    @classmethod
+    def fromTable(cls, filename, window=15):
+        """
+        Makes an index from a table of TargetSites (as written by
+        find-target-sites-in-genome.py or find-off-target-sites.py), using
+        guide:chrom:cutSite as the target ID.
+        """
+        from TargetSiteFinder import TargetSite
+        sites = TargetSite.load(filename)
+        return CutSiteIndex([(x.chrom, x.cutSite,
+                              x.guideID + ":" + x.chrom + ":" + str(x.cutSite))
+                             for x in sites], window)
+
+    def numSites(self):
+        return sum(len(x) for x in self.sites.values())
+
+    def getChroms(self):
+        return list(self.sites.keys())
+
+    def hasChrom(self, chrom):
+        return chrom in self.sites
+
+    def overlapsWindow(self, chrom, begin, end):
+        """
+        Tells whether [begin,end) overlaps the window (site-window,
+        site+window) of any cut site on chrom.
+        """
+        ends = self.ends.get(chrom)
+        if ends is None:
+            return False
+        i = int(np.searchsorted(ends, begin, side="right"))
+        return i < len(ends) and self.begins[chrom][i] < end
+
+    def spansSite(self, chrom, begin, end):
+        """
+        Tells whether begin<site<end for any cut site on chrom.
+        """
+        sites = self.sites.get(chrom)
+        if sites is None:
+            return False
+        i = int(np.searchsorted(sites, begin, side="right"))
+        return i < len(sites) and sites[i] < end
+
+    def nearest(self, chrom, pos):
+        """
+        Returns (distance,targetID) for the cut site on chrom nearest to pos,
+        or None if chrom has no cut sites.  Ties go to the leftmost site.
+        """
+        sites = self.sites.get(chrom)
+        if sites is None:
+            return None
+        i = int(np.searchsorted(sites, pos, side="left"))
+        if i == len(sites) or (i > 0 and pos - sites[i - 1] <= sites[i] - pos):
+            i -= 1
+        return (abs(int(pos - sites[i])), self.targets[chrom][i])
+
+    def nearestDistance(self, chrom, pos):
+        nearest = self.nearest(chrom, pos)
+        return None if nearest is None else nearest[0]
+
+    def assignTarget(self, chrom, begin, end, maxDistance=None):
+        """
+        Returns the ID of the target whose cut site is nearest to the
+        reference interval [begin,end) (distance 0 if the interval contains
+        it), or None if chrom has no cut sites or the nearest one is more
+        than maxDistance away.
+        """
+        sites = self.sites.get(chrom)
+        if sites is None:
+            return None
+        i = int(np.searchsorted(sites, begin, side="left"))
+        if i < len(sites) and sites[i] < end:
+            return self.targets[chrom][i]
+        candidates = []
+        if i > 0:
+            candidates.append((begin - int(sites[i - 1]), i - 1))
+        if i < len(sites):
+            candidates.append((int(sites[i]) - end + 1, i))
+        (distance, i) = min(candidates)
+        if maxDistance is not None and distance > maxDistance:
+            return None
+        return self.targets[chrom][i]
+
+    def getWindows(self, padding):
+        """
+        Returns the windows within padding of a cut site as (chrom,begin,end)
+        triples, sorted, with overlapping windows merged.
+        """
+        windows = []
+        for chrom in sorted(self.sites.keys()):
+            merged = []
+            for site in self.sites[chrom].tolist():
+                (begin, end) = (max(0, site - padding), site + padding)
+                if len(merged) > 0 and begin <= merged[-1][2]:
+                    merged[-1] = (chrom, merged[-1][1], end)
+                else:
+                    merged.append((chrom, begin, end))
+            windows.extend(merged)
+        return windows
@@ -0,0 +1,254 @@
+# =========================================================================
+# This is OPEN SOURCE SOFTWARE governed by the Gnu General Public
+# License (GPL) version 3, as described at www.opensource.org.
+# Copyright (C)2016 William H. Majoros (martiandna@gmail.com).
+# Author: Siyan Liu
+# =========================================================================
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals, generators, nested_scopes, with_statement)
+
+import hashlib
+import os
+import re
+import shutil
+import struct
+import tempfile
+
+import numpy as np
+
+from SamHspFactory import SamHspFactory
+
+
+class Deduplicator:
+    """
+    This class removes PCR duplicates from a stream of read groups (one group
+    per fragment, as read from a name-grouped file), without relying on
+    duplicate flags from another tool.  Two fragments are duplicates if they
+    have the same signature: for each mapped end (the primary alignment of
+    read 1 and of read 2), its reference, strand and Tn5 insertion point (the
+    unclipped 5' end of the read), plus an optional UMI, taken from a tag or
+    from a field of the read name.  The first fragment seen is kept.
+
+    Signatures are stored as 64-bit hashes (BLAKE2), in a set holding at most
+    maxEntries; when it is full, its contents are written to disk as a sorted
+    run and looked up there by binary search through numpy memory maps.  Runs
+    are merged as they accumulate, like a binary counter, so there are never
+    more than about log2(fragments/maxEntries) of them.  Two different
+    signatures collide with probability about n^2/2^65 for n fragments.
+
+    Attributes:
+        umiTag : string, or None
+        umiField : int, or None (index into the read name split on
+                   umiSeparator; negative counts from the end)
+        umiSeparator : string
+        maxEntries : int
+        spillDir : string, or None (the system's temporary directory)
+        seen : set of int, hashes not yet spilled
+        runs : array of (filename,uint64 array), sorted hashes on disk
+        numFragments, numDuplicates : int
+    Instance Methods:
+        dedup=Deduplicator(umiTag=None,umiField=None,umiSeparator=":",
+                           maxEntries=4000000,spillDir=None)
+        boolean=dedup.isDuplicate(readGroup)
+        sig=dedup.signature(readGroup) # None if no end is mapped
+        state=dedup.saveState(directory) # for resuming a run
+        dedup.loadState(directory,state)
+        dedup.close() # deletes the spilled runs
+    Private Methods:
+        self.spill()
+        self.mergeRuns(run1,run2)
+    Class Methods:
+        pos=Deduplicator.insertionPoint(rec)
+        Deduplicator.linkOrCopy(source,target)
+    """
+
+    CIGAR_OP = re.compile(r"(\d+)([MIDNSHP=X])")
+    MERGE_CHUNK = 1 << 20
+
+    def __init__(self, umiTag=None, umiField=None, umiSeparator=":",
+                 maxEntries=4000000, spillDir=None):
+        self.umiTag = umiTag
+        self.umiField = umiField
+        self.umiSeparator = umiSeparator
+        self.maxEntries = maxEntries
+        self.spillDir = spillDir
+        self.tempDir = None
+        self.seen = set()
+        self.runs = []
+        self.numRuns = 0
+        self.numFragments = 0
+        self.numDuplicates = 0
+
+    @classmethod
+    def insertionPoint(cls, rec):
+        """
+        Returns the reference position of the unclipped 5' end of a read: the
+        first base for the forward strand, one past the last base for the
+        reverse strand.
+        """
+        ops = cls.CIGAR_OP.findall(SamHspFactory.cigarText(rec))
+        if rec.flag_revComp():
+            end = rec.getRefPos()
+            for (length, op) in ops:
+                if op in "MDN=X":
+                    end += int(length)
+            if len(ops) > 0 and ops[-1][1] == "S":
+                end += int(ops[-1][0])
+            elif len(ops) > 1 and ops[-1][1] == "H" and ops[-2][1] == "S":
+                end += int(ops[-2][0])
+            return end
+        begin = rec.getRefPos()
+        for (length, op) in ops:
+            if op == "S":
+                begin -= int(length)
+            elif op != "H":
+                break
+        return begin
+
+    def getUMI(self, rec):
+        if self.umiTag is not None:
+            umi = rec.getTag(self.umiTag)
+            return "" if umi is None else str(umi)
+        if self.umiField is not None:
+            fields = rec.getID().split(self.umiSeparator)
+            if -len(fields) <= self.umiField < len(fields):
+                return fields[self.umiField]
+        return ""
+
+    def signature(self, group):
+        ends = {}
+        for rec in group.getReads():
+            if rec.flag_unmapped() or rec.flag_secondary() or \
+                    rec.flag_supplementary():
+                continue
+            end = 1 if rec.flag_firstOfPair() else \
+                2 if rec.flag_secondOfPair() else 0
+            if end not in ends:
+                ends[end] = rec
+        if len(ends) == 0:
+            return None
+        fields = sorted([rec.getRefName() + ":" +
+                         ("-" if rec.flag_revComp() else "+") + ":" +
+                         str(self.insertionPoint(rec))
+                         for rec in ends.values()])
+        return "\t".join(fields + [self.getUMI(next(iter(ends.values())))])
+
+    def isDuplicate(self, group):
+        """
+        Tells whether a fragment with the same signature was seen before, and
+        remembers this one if not.  Groups with no mapped primary alignment
+        are never duplicates.
+        """
+        sig = self.signature(group)
+        if sig is None:
+            return False
+        self.numFragments += 1
+        digest = hashlib.blake2b(sig.encode("utf-8"), digest_size=8).digest()
+        (h,) = struct.unpack("<Q", digest)
+        if h in self.seen:
+            self.numDuplicates += 1
+            return True
+        if len(self.runs) > 0:
+            key = np.uint64(h)
+            for (filename, run) in self.runs:
+                i = int(np.searchsorted(run, key))
+                if i < len(run) and run[i] == key:
+                    self.numDuplicates += 1
+                    return True
+        self.seen.add(h)
+        if len(self.seen) >= self.maxEntries:
+            self.spill()
+        return False
+
+    def newRunFile(self):
+        if self.tempDir is None:
+            self.tempDir = tempfile.mkdtemp(prefix="tracer-dedup-",
+                                            dir=self.spillDir)
+        self.numRuns += 1
+        return os.path.join(self.tempDir, "run" + str(self.numRuns) + ".npy")
+
+    def spill(self):
+        """
+        Writes the in-memory hashes to disk as a sorted run, then merges the
+        newest runs while the last is at least as large as the one before.
+        """
+        hashes = np.fromiter(self.seen, dtype=np.uint64, count=len(self.seen))
+        hashes.sort()
+        filename = self.newRunFile()
+        np.save(filename, hashes)
+        self.seen = set()
+        self.runs.append((filename, np.load(filename, mmap_mode="r")))
+        while len(self.runs) > 1 and \
+                len(self.runs[-1][1]) >= len(self.runs[-2][1]):
+            second = self.runs.pop()
+            first = self.runs.pop()
+            self.runs.append(self.mergeRuns(first, second))
+
+    def mergeRuns(self, first, second):
+        """
+        Merges two sorted runs into a new one, a chunk at a time, and deletes
+        them.
+        """
+        (a, b) = (first[1], second[1])
+        filename = self.newRunFile()
+        out = np.lib.format.open_memmap(filename, mode="w+", dtype=np.uint64,
+                                        shape=(len(a) + len(b),))
+        (i, j, k) = (0, 0, 0)
+        chunk = self.MERGE_CHUNK
+        while i < len(a) or j < len(b):
+            (ca, cb) = (a[i:i + chunk], b[j:j + chunk])
+            if len(ca) == 0 or len(cb) == 0:
+                rest = cb if len(ca) == 0 else ca
+                out[k:k + len(rest)] = rest
+                (i, j, k) = (i + len(ca), j + len(cb), k + len(rest))
+                continue
+            cutoff = min(ca[-1], cb[-1])
+            na = int(np.searchsorted(ca, cutoff, side="right"))
+            nb = int(np.searchsorted(cb, cutoff, side="right"))
+            merged = np.sort(np.concatenate((ca[:na], cb[:nb])))
+            out[k:k + len(merged)] = merged
+            (i, j, k) = (i + na, j + nb, k + len(merged))
+        out.flush()
+        del out
+        os.remove(first[0])
+        os.remove(second[0])
+        return (filename, np.load(filename, mmap_mode="r"))
+
+    def saveState(self, directory):
+        """
+        Spills the in-memory hashes, so that every hash is in a run, and
+        links (or copies) the runs into directory.  Runs are never modified,
+        so the links stay valid when runs are later merged and deleted.
+        Returns the counters and the names of the runs in directory.
+        """
+        if len(self.seen) > 0:
+            self.spill()
+        names = []
+        for (filename, run) in self.runs:
+            name = "dedup" + str(len(names)) + ".npy"
+            self.linkOrCopy(filename, os.path.join(directory, name))
+            names.append(name)
+        return {"runs": names, "numFragments": self.numFragments,
+                "numDuplicates": self.numDuplicates}
+
+    def loadState(self, directory, state):
+        for name in state["runs"]:
+            filename = self.newRunFile()
+            self.linkOrCopy(os.path.join(directory, name), filename)
+            self.runs.append((filename, np.load(filename, mmap_mode="r")))
+        self.numFragments = state["numFragments"]
+        self.numDuplicates = state["numDuplicates"]
+
+    @classmethod
+    def linkOrCopy(cls, source, target):
+        try:
+            os.link(source, target)
+        except OSError:
+            shutil.copyfile(source, target)
+
+    def close(self):
+        self.runs = []
+        self.seen = set()
+        if self.tempDir is not None:
+            shutil.rmtree(self.tempDir, ignore_errors=True)
+            self.tempDir = None
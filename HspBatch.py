@@ -0,0 +1,218 @@
+# =========================================================================
+# This is OPEN SOURCE SOFTWARE governed by the Gnu General Public
+# License (GPL) version 3, as described at www.opensource.org.
+# Copyright (C)2016 William H. Majoros (martiandna@gmail.com).
+# Author: Siyan Liu
+# =========================================================================
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals, generators, nested_scopes, with_statement)
+
+import numpy as np
+
+from SamAnnotation import SamAnnotation
+from SamHSP import SamHSP
+from SamHspClusterer import SamHspClusterer
+
+
+class HspBatch:
+    """
+    This class is a columnar representation of the HSPs of a batch of read
+    groups: one numpy array per attribute, with one entry per SAM record, in
+    record order, grouped by read group.  Scores, percent identities and the
+    read-level (SamAnnotation) quantities used by the filters are computed
+    with vectorized operations; SamHSP objects are only made, by
+    makeAnnotation(), for reads that survive the filters.
+
+    Attributes:
+        groups : array of SamReadGroup
+        group : int32 array, index of the read group of each HSP
+        readBegin, readEnd, refBegin, refEnd : int64 arrays
+        strand : int8 array (1 if reverse strand, else 0)
+        refId : int32 array, index into refNames
+        refNames : array of string
+        matches, mismatches, indelBases, alignedLength : int64 arrays
+        seqLength : int64 array, length of the read sequence in the record
+        summaries : array of CigarSummary, one per HSP
+        score, identity : float64 arrays
+        selected : int64 array of the HSPs kept by cluster(), in read order
+                   within each group
+    Instance Methods:
+        batch=HspBatch(groups,factory) # factory is a SamHspFactory
+        batch.computeScores()
+        batch.cluster(optimal=False,minIdentity=None)
+        features=batch.groupFeatures() # dict of per-group arrays
+        anno=batch.makeAnnotation(groupIndex)
+    Class Methods:
+        none
+    """
+
+    def __init__(self, groups, factory):
+        self.groups = groups
+        self.factory = factory
+        refIds = {}
+        self.refNames = []
+        self.summaries = summaries = []
+        columns = ([], [], [], [], [], [], [], [], [], [], [])
+        (group, readBegin, readEnd, refBegin, refEnd, strand, refId,
+         mismatches, indelBases, alignedLength, seqLength) = columns
+        for (g, readGroup) in enumerate(groups):
+            for rec in readGroup.getReads():
+                refName = rec.getRefName()
+                if refName not in refIds:
+                    refIds[refName] = len(self.refNames)
+                    self.refNames.append(refName)
+                summary = factory.summarizeCigar(rec)
+                group.append(g)
+                readBegin.append(summary.readBegin)
+                readEnd.append(summary.readEnd)
+                refBegin.append(summary.refBegin)
+                refEnd.append(summary.refEnd)
+                alignedLength.append(summary.alignedLength)
+                indelBases.append(summary.indelBases)
+                strand.append(1 if rec.flag_revComp() else 0)
+                refId.append(refIds[refName])
+                mismatches.append(factory.countMismatches(rec, summary))
+                summaries.append(summary)
+                seqLength.append(rec.seqLength())
+        self.group = np.array(group, dtype=np.int32)
+        self.readBegin = np.array(readBegin, dtype=np.int64)
+        self.readEnd = np.array(readEnd, dtype=np.int64)
+        self.refBegin = np.array(refBegin, dtype=np.int64)
+        self.refEnd = np.array(refEnd, dtype=np.int64)
+        self.strand = np.array(strand, dtype=np.int8)
+        self.refId = np.array(refId, dtype=np.int32)
+        self.mismatches = np.array(mismatches, dtype=np.int64)
+        self.indelBases = np.array(indelBases, dtype=np.int64)
+        self.alignedLength = np.array(alignedLength, dtype=np.int64)
+        self.seqLength = np.array(seqLength, dtype=np.int64)
+        self.offsets = np.searchsorted(self.group, np.arange(len(groups) + 1))
+        self.score = None
+        self.identity = None
+        self.selected = None
+
+    def __len__(self):
+        return len(self.group)
+
+    def computeScores(self):
+        """
+        Computes SamHSP.computeScore() and SamHSP.getPercentIdentity() for
+        every HSP at once.
+        """
+        self.matches = self.alignedLength - self.mismatches
+        matches = self.matches.astype(np.float64)
+        errors = self.mismatches + self.indelBases
+        self.identity = matches / (matches + errors)
+        self.score = self.round2(matches / (1 + errors))
+
+    @classmethod
+    def round2(cls, x):
+        """
+        Rounds to two decimals exactly as Python's round(x,2) does.  np.round
+        can differ from it next to a tie, so those few values are redone.
+        """
+        rounded = np.round(x, 2)
+        scaled = x * 100
+        nearTie = np.abs(scaled - np.floor(scaled) - 0.5) < 1e-6
+        for i in np.flatnonzero(nearTie):
+            rounded[i] = round(float(x[i]), 2)
+        return rounded
+
+    def cluster(self, optimal=False, minIdentity=None):
+        """
+        Discards HSPs below minIdentity, then clusters the HSPs of each read
+        group with SamHspClusterer.  Sets self.selected.
+        """
+        if self.score is None:
+            self.computeScores()
+        keep = np.ones(len(self), dtype=bool) if minIdentity is None \
+            else self.identity >= minIdentity
+        choose = SamHspClusterer.chooseOptimal if optimal \
+            else SamHspClusterer.chooseGreedy
+        begins = self.readBegin.tolist()
+        ends = self.readEnd.tolist()
+        scores = self.score.tolist()
+        keepList = keep.tolist()
+        offsets = self.offsets.tolist()
+        selected = []
+        for g in range(len(self.groups)):
+            indices = [i for i in range(offsets[g], offsets[g + 1])
+                       if keepList[i]]
+            chosen = choose([begins[i] for i in indices],
+                            [ends[i] for i in indices],
+                            [scores[i] for i in indices])
+            chosen = sorted([indices[k] for k in chosen],
+                            key=lambda i: begins[i])
+            selected.extend(chosen)
+        self.selected = np.array(selected, dtype=np.int64)
+
+    def groupFeatures(self):
+        """
+        Returns a dict of per-group arrays describing the clustered HSPs:
+        numHSPs, readLength, alignedLength, alignedProportion, maxReadGap and
+        maxRefGap (-1 if there is no gap), and allRefsSame.
+        """
+        G = len(self.groups)
+        sel = self.selected
+        g = self.group[sel]
+        numHSPs = np.bincount(g, minlength=G)
+        isFirst = np.ones(len(sel), dtype=bool)
+        isFirst[1:] = g[1:] != g[:-1]
+        readLength = np.ones(G, dtype=np.int64)
+        readLength[g[isFirst]] = self.seqLength[sel[isFirst]]
+        aligned = np.bincount(g, weights=self.readEnd[sel] - self.readBegin[sel],
+                              minlength=G).astype(np.int64)
+        maxReadGap = np.full(G, -1, dtype=np.int64)
+        maxRefGap = np.full(G, -1, dtype=np.int64)
+        same = ~isFirst[1:]
+        pairGroups = g[1:][same]
+        readGaps = (self.readBegin[sel[1:]] - self.readEnd[sel[:-1]])[same]
+        refGaps = (self.refBegin[sel[1:]] - self.refEnd[sel[:-1]])[same]
+        positive = readGaps > 0
+        np.maximum.at(maxReadGap, pairGroups[positive], readGaps[positive])
+        positive = refGaps > 0
+        np.maximum.at(maxRefGap, pairGroups[positive], refGaps[positive])
+        refIds = self.refId[sel]
+        lowest = np.full(G, np.iinfo(np.int32).max, dtype=np.int32)
+        highest = np.full(G, -1, dtype=np.int32)
+        np.minimum.at(lowest, g, refIds)
+        np.maximum.at(highest, g, refIds)
+        return {"numHSPs": numHSPs,
+                "readLength": readLength,
+                "alignedLength": aligned,
+                "alignedProportion": aligned / readLength.astype(np.float64),
+                "maxReadGap": maxReadGap,
+                "maxRefGap": maxRefGap,
+                "allRefsSame": (highest <= lowest) | (numHSPs == 0)}
+
+    def selectedOf(self, g):
+        """
+        Returns the indices of the clustered HSPs of group g, in read order.
+        """
+        sel = self.selected
+        group = self.group[sel]
+        lo = np.searchsorted(group, g, side="left")
+        hi = np.searchsorted(group, g, side="right")
+        return sel[lo:hi]
+
+    def makeAnnotation(self, g, alignabilities=None):
+        """
+        Makes SamHSP objects for the clustered HSPs of group g and returns
+        them as a SamAnnotation, with CIGAR summaries, mismatch counts and
+        scores (and alignabilities, if given as a dict mapping HSP index to
+        value) copied from the batch.
+        """
+        offset = self.offsets[g]
+        reads = self.groups[g].getReads()
+        HSPs = []
+        for i in self.selectedOf(g).tolist():
+            if self.factory.fused:
+                hsp = SamHSP.fromSummary(reads[i - offset], self.summaries[i],
+                                         self.factory.keepRecords,
+                                         int(self.mismatches[i]))
+            else:
+                hsp = self.factory.makeHSPs([reads[i - offset]])[0]
+            hsp.score = float(self.score[i])
+            if alignabilities is not None and i in alignabilities:
+                hsp.setAlignability(alignabilities[i])
+            HSPs.append(hsp)
+        return SamAnnotation(HSPs)
@@ -0,0 +1,194 @@
+# =========================================================================
+# This is OPEN SOURCE SOFTWARE governed by the Gnu General Public
+# License (GPL) version 3, as described at www.opensource.org.
+# Copyright (C)2016 William H. Majoros (martiandna@gmail.com).
+# Author: Siyan Liu
+# =========================================================================
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals, generators, nested_scopes, with_statement)
+
+import mmap
+import os
+
+import numpy as np
+
+from TargetSiteFinder import BASE_CODES
+from TwoBitCache import TwoBitCache
+
+
+class IndexedFasta:
+    """
+    This class gives random access to the sequences of a FASTA file through
+    its .fai index (as written by "samtools faidx"), which is read if present
+    and otherwise built and saved next to the FASTA.  The file is memory-
+    mapped, so opening it costs only the index read, pages are shared by all
+    processes using the same genome, and only the regions asked for are ever
+    read.  A region lying on one line of the file (always, for unwrapped
+    FASTA) is returned as a numpy view of the map, without copying; a region
+    spanning lines is copied once, with the line breaks removed.
+
+    With cacheBytes>0, getCodes() goes through a TwoBitCache, which keeps
+    recently used blocks 2-bit packed (four bases per byte).
+
+    Attributes:
+        filename : string
+        index : dict mapping name to (length,offset,lineBases,lineBytes)
+        names : array of string, in file order
+        map : mmap.mmap
+        data : uint8 array, a view of map
+        cache : TwoBitCache, or None
+    Instance Methods:
+        genome=IndexedFasta(filename,cacheBytes=0)
+        names=genome.getChromNames()
+        L=genome.getLength(chrom)
+        array=genome.getRegion(chrom,begin,end) # uint8 array of ASCII bases
+        seq=genome.getSequence(chrom,begin,end) # string
+        codes=genome.getCodes(chrom,begin,end) # 2-bit codes, N=4
+        genome.close()
+    Class Methods:
+        index=IndexedFasta.buildIndex(filename) # list of .fai records
+    """
+
+    def __init__(self, filename, cacheBytes=0):
+        self.filename = filename
+        self.cacheBytes = cacheBytes
+        self.open()
+
+    def open(self):
+        indexFile = self.filename + ".fai"
+        if os.path.exists(indexFile) and \
+                os.path.getmtime(indexFile) >= os.path.getmtime(self.filename):
+            records = self.readIndex(indexFile)
+        else:
+            records = self.buildIndex(self.filename)
+            try:
+                self.writeIndex(indexFile, records)
+            except (IOError, OSError):
+                pass
+        self.names = [x[0] for x in records]
+        self.index = dict((x[0], tuple(x[1:])) for x in records)
+        with open(self.filename, "rb") as IN:
+            self.map = mmap.mmap(IN.fileno(), 0, access=mmap.ACCESS_READ)
+        self.data = np.frombuffer(self.map, dtype=np.uint8)
+        self.cache = None
+        if self.cacheBytes > 0:
+            self.cache = TwoBitCache(self.getLength, self.readCodes,
+                                     maxBytes=self.cacheBytes)
+
+    def __getstate__(self):
+        """
+        Only the file name is pickled; the map is reopened on unpickling,
+        so a genome can be sent to worker processes.
+        """
+        return {"filename": self.filename, "cacheBytes": self.cacheBytes}
+
+    def __setstate__(self, state):
+        self.filename = state["filename"]
+        self.cacheBytes = state["cacheBytes"]
+        self.open()
+
+    def getChromNames(self):
+        return self.names
+
+    def getLength(self, chrom):
+        return self.index[chrom][0]
+
+    def getRegion(self, chrom, begin, end):
+        """
+        Returns the bases of [begin,end) of chrom (clipped to the sequence)
+        as a uint8 array of ASCII codes: a view into the map if the region is
+        on one line of the file, else a copy.
+        """
+        (length, offset, lineBases, lineBytes) = self.index[chrom]
+        begin = max(0, begin)
+        end = min(end, length)
+        if end <= begin:
+            return np.zeros(0, dtype=np.uint8)
+        first = begin // lineBases
+        last = (end - 1) // lineBases
+        start = offset + first * lineBytes + begin % lineBases
+        if first == last:
+            return self.data[start:start + end - begin]
+        lines = np.lib.stride_tricks.as_strided(
+            self.data[offset + first * lineBytes:],
+            shape=(last - first, lineBases), strides=(lineBytes, 1))
+        tail = offset + last * lineBytes
+        return np.concatenate((lines[0, begin % lineBases:],
+                               lines[1:].reshape(-1),
+                               self.data[tail:tail + end - last * lineBases]))
+
+    def getSequence(self, chrom, begin, end):
+        return self.getRegion(chrom, begin, end).tobytes().decode("ascii")
+
+    def getCodes(self, chrom, begin, end):
+        """
+        Returns the 2-bit codes (A=0, C=1, G=2, T=3, other=4) of [begin,end)
+        of chrom as a uint8 array.
+        """
+        if self.cache is not None:
+            return self.cache.getCodes(chrom, begin, end)
+        return self.readCodes(chrom, begin, end)
+
+    def readCodes(self, chrom, begin, end):
+        return BASE_CODES[self.getRegion(chrom, begin, end)]
+
+    def close(self):
+        self.data = None
+        self.cache = None
+        self.map.close()
+
+    @classmethod
+    def readIndex(cls, filename):
+        records = []
+        with open(filename, "rt") as IN:
+            for line in IN:
+                fields = line.rstrip("\n").split("\t")
+                if len(fields) < 5:
+                    continue
+                records.append((fields[0],) +
+                               tuple(int(x) for x in fields[1:5]))
+        return records
+
+    @classmethod
+    def writeIndex(cls, filename, records):
+        with open(filename, "wt") as OUT:
+            for record in records:
+                OUT.write("\t".join(str(x) for x in record) + "\n")
+
+    @classmethod
+    def buildIndex(cls, filename):
+        """
+        Scans a FASTA file and returns its .fai records: (name,length,offset,
+        lineBases,lineBytes), where offset is the byte offset of the first
+        base.  All lines of a sequence but the last must have equal length.
+        """
+        records = []
+        record = None
+        offset = 0
+        shortLine = False
+        with open(filename, "rb") as IN:
+            for line in IN:
+                if line.startswith(b">"):
+                    if record is not None:
+                        records.append(tuple(record))
+                    words = line[1:].split()
+                    name = words[0].decode("utf-8") if len(words) > 0 else ""
+                    record = [name, 0, offset + len(line), 0, 0]
+                    shortLine = False
+                elif record is not None:
+                    bases = len(line.rstrip(b"\r\n"))
+                    terminator = len(line) - bases
+                    if bases > 0:
+                        if record[3] == 0:
+                            (record[3], record[4]) = (bases, len(line))
+                        elif shortLine or bases > record[3] or \
+                                (terminator > 0 and
+                                 terminator != record[4] - record[3]):
+                            raise Exception("Lines of " + record[0] + " in " +
+                                            filename + " have unequal lengths")
+                        shortLine = bases < record[3]
+                        record[1] += bases
+                offset += len(line)
+        if record is not None:
+            records.append(tuple(record))
+        return records
@@ -0,0 +1,107 @@
+# =========================================================================
+# This is OPEN SOURCE SOFTWARE governed by the Gnu General Public
+# License (GPL) version 3, as described at www.opensource.org.
+# Copyright (C)2016 William H. Majoros (martiandna@gmail.com).
+# Author: Siyan Liu
+# =========================================================================
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals, generators, nested_scopes, with_statement)
+
+from LazySamRecord import LazySamRecord
+
+
+class LazySamReader:
+    """
+    This class reads alignments from a text SAM file and returns them one at
+    a time as LazySamRecord objects, in file order, like SamReader does.
+    The file is read in binary chunks of CHUNK_SIZE bytes, and each record
+    is cut out of its chunk by locating its first six tabs: only QNAME,
+    FLAG, RNAME, POS and CIGAR are decoded, and the record keeps the chunk
+    and the offsets of the rest of its line, so no per-line string or field
+    list is made.  Reference names are interned, so records on the same
+    chromosome share one string.  Header lines are skipped.
+
+    Attributes:
+        file : file object, opened in binary mode
+        buffer : bytes, the current chunk
+        bufferOffset : int, file offset of buffer[0]
+        pos : int, start of the next line in buffer
+        refNames : dict mapping RNAME bytes to string
+    Instance Methods:
+        reader=LazySamReader(filename)
+        rec=reader.nextSequence() # returns None at end of file
+        offset=reader.tell() # byte offset of the next record
+        reader.seek(offset)
+        reader.close()
+    Private Methods:
+        boolean=self.fill() # False at end of file
+    Class Methods:
+        none
+    """
+
+    CHUNK_SIZE = 1 << 20
+
+    def __init__(self, filename):
+        self.file = open(filename, "rb")
+        self.buffer = b""
+        self.bufferOffset = 0
+        self.pos = 0
+        self.refNames = {}
+
+    def fill(self):
+        data = self.file.read(self.CHUNK_SIZE)
+        if not data:
+            return False
+        self.bufferOffset += self.pos
+        self.buffer = self.buffer[self.pos:] + data
+        self.pos = 0
+        return True
+
+    def nextSequence(self):
+        while True:
+            buffer = self.buffer
+            start = self.pos
+            end = buffer.find(b"\n", start)
+            if end < 0:
+                if self.fill():
+                    continue
+                if start >= len(buffer):
+                    return None
+                end = self.pos = len(buffer)
+            else:
+                self.pos = end + 1
+            if end > start and buffer[end - 1:end] == b"\r":
+                end -= 1
+            if end == start or buffer[start:start + 1] == b"@":
+                continue
+
+            # Decode the first six fields; MAPQ is not used
+            tab1 = buffer.index(b"\t", start, end)
+            tab2 = buffer.index(b"\t", tab1 + 1, end)
+            tab3 = buffer.index(b"\t", tab2 + 1, end)
+            tab4 = buffer.index(b"\t", tab3 + 1, end)
+            tab5 = buffer.index(b"\t", tab4 + 1, end)
+            tab6 = buffer.find(b"\t", tab5 + 1, end)
+            if tab6 < 0:
+                tab6 = end
+            rawName = buffer[tab2 + 1:tab3]
+            refName = self.refNames.get(rawName)
+            if refName is None:
+                refName = self.refNames[rawName] = rawName.decode("ascii")
+            return LazySamRecord(buffer[start:tab1].decode("ascii"),
+                                 int(buffer[tab1 + 1:tab2]), refName,
+                                 int(buffer[tab3 + 1:tab4]) - 1,
+                                 buffer[tab5 + 1:tab6].decode("ascii"),
+                                 buffer, min(tab6 + 1, end), end)
+
+    def tell(self):
+        return self.bufferOffset + self.pos
+
+    def seek(self, offset):
+        self.file.seek(offset)
+        self.buffer = b""
+        self.bufferOffset = offset
+        self.pos = 0
+
+    def close(self):
+        self.file.close()
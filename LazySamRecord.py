@@ -0,0 +1,226 @@
+# =========================================================================
+# This is OPEN SOURCE SOFTWARE governed by the Gnu General Public
+# License (GPL) version 3, as described at www.opensource.org.
+# Copyright (C)2016 William H. Majoros (martiandna@gmail.com).
+# Author: Siyan Liu
+# =========================================================================
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals, generators, nested_scopes, with_statement)
+
+import re
+
+from CigarString import CigarString
+
+
+class LazySamRecord:
+    """
+    This class represents one line of a text SAM file, decoded only as far
+    as grouping and HSP construction need: QNAME, FLAG, RNAME, POS and CIGAR
+    are decoded when the record is made, and the rest of the line (RNEXT to
+    the optional tags) is kept as a slice of the reader's chunk buffer,
+    which many records share.  The sequence, qualities and tags are decoded
+    on first use; seqLength() only locates the SEQ field.  It provides the
+    same subset of the SamRecord interface as BamRecord.  When pickled, only
+    the record's own bytes are kept, not the shared buffer.
+
+    Attributes:
+        ID : string
+        flags : int
+        refName : string
+        refPos : int (0-based)
+        cigarString : string
+        buffer : bytes, holding the rest of the line at [start,end)
+        seqStart, seqEnd : int, the SEQ field in buffer, or None
+        seq, qual : string, or None until decoded
+        tags : dict mapping tag name to value, or None until decoded
+    Instance Methods:
+        rec=LazySamRecord(ID,flags,refName,refPos,cigarString,buffer,start,
+                          end)
+        ID=rec.getID()
+        refName=rec.getRefName()
+        pos=rec.getRefPos()
+        cigar=rec.getCigar() # returns CigarString object
+        cigar=rec.getCigarString() # returns the CIGAR as text
+        seq=rec.getSequence()
+        qual=rec.getQuality()
+        L=rec.seqLength()
+        rec.detach() # copies its bytes out of the shared buffer
+        value=rec.getTag(tag) # returns None if tag is absent
+        n=rec.countMismatches()
+        boolean=rec.flag_unmapped()
+        boolean=rec.flag_PCRduplicate()
+        boolean=rec.flag_revComp()
+        boolean=rec.flag_firstOfPair()
+        boolean=rec.flag_secondOfPair()
+        boolean=rec.flag_secondary()
+        boolean=rec.flag_supplementary()
+    Private Methods:
+        self.locateSeq()
+        self.decodeTags()
+    Class Methods:
+        value=LazySamRecord.parseTag(typeCode,text)
+    """
+
+    __slots__ = ("ID", "flags", "refName", "refPos", "cigarString", "cigar",
+                 "buffer", "start", "end", "seqStart", "seqEnd", "seq",
+                 "qual", "tags")
+
+    MD_MISMATCH = re.compile(r"\^[A-Za-z]+|[A-Za-z]")
+    TAB = b"\t"
+
+    def __init__(self, ID, flags, refName, refPos, cigarString, buffer, start,
+                 end):
+        self.ID = ID
+        self.flags = flags
+        self.refName = refName
+        self.refPos = refPos
+        self.cigarString = cigarString
+        self.cigar = None
+        self.buffer = buffer
+        self.start = start
+        self.end = end
+        self.seqStart = None
+        self.seqEnd = None
+        self.seq = None
+        self.qual = None
+        self.tags = None
+
+    def __getstate__(self):
+        return (self.ID, self.flags, self.refName, self.refPos,
+                self.cigarString, self.buffer[self.start:self.end])
+
+    def __setstate__(self, state):
+        (ID, flags, refName, refPos, cigarString, rest) = state
+        self.__init__(ID, flags, refName, refPos, cigarString, rest, 0,
+                      len(rest))
+
+    def detach(self):
+        """
+        Copies the rest of the line out of the reader's chunk buffer, so a
+        record kept for long (e.g., while grouping unsorted input) does not
+        keep the whole chunk alive.
+        """
+        start = self.start
+        if start == 0 and self.end == len(self.buffer):
+            return
+        self.buffer = self.buffer[start:self.end]
+        self.start = 0
+        self.end = len(self.buffer)
+        if self.seqStart is not None:
+            self.seqStart -= start
+            self.seqEnd -= start
+
+    def locateSeq(self):
+        # The rest of the line is RNEXT, PNEXT, TLEN, SEQ, QUAL, tags...
+        buffer = self.buffer
+        pos = self.start
+        for i in range(3):
+            pos = buffer.index(self.TAB, pos, self.end) + 1
+        end = buffer.find(self.TAB, pos, self.end)
+        self.seqStart = pos
+        self.seqEnd = self.end if end < 0 else end
+
+    def getID(self):
+        return self.ID
+
+    def getRefName(self):
+        return self.refName
+
+    def getRefPos(self):
+        return self.refPos
+
+    def getCigar(self):
+        if self.cigar is None:
+            self.cigar = CigarString(self.cigarString)
+        return self.cigar
+
+    def getCigarString(self):
+        return self.cigarString
+
+    def getSequence(self):
+        if self.seq is None:
+            if self.seqStart is None:
+                self.locateSeq()
+            self.seq = self.buffer[self.seqStart:self.seqEnd].decode("ascii")
+        return self.seq
+
+    def getQuality(self):
+        if self.qual is None:
+            if self.seqStart is None:
+                self.locateSeq()
+            start = min(self.seqEnd + 1, self.end)
+            end = self.buffer.find(self.TAB, start, self.end)
+            if end < 0:
+                end = self.end
+            self.qual = self.buffer[start:end].decode("ascii")
+        return self.qual
+
+    def seqLength(self):
+        if self.seq is not None:
+            return len(self.seq)
+        if self.seqStart is None:
+            self.locateSeq()
+        return self.seqEnd - self.seqStart
+
+    @classmethod
+    def parseTag(cls, typeCode, text):
+        if typeCode == "i":
+            return int(text)
+        if typeCode == "f":
+            return float(text)
+        if typeCode == "B":
+            values = text.split(",")
+            convert = float if values[0] == "f" else int
+            return [convert(x) for x in values[1:]]
+        return text
+
+    def decodeTags(self):
+        tags = {}
+        if self.seqStart is None:
+            self.locateSeq()
+        start = self.buffer.find(self.TAB, self.seqEnd + 1, self.end)
+        if start >= 0:
+            for field in self.buffer[start + 1:self.end].decode(
+                    "ascii").split("\t"):
+                (tag, typeCode, text) = field.split(":", 2)
+                tags[tag] = self.parseTag(typeCode, text)
+        self.tags = tags
+
+    def getTag(self, tag):
+        if self.tags is None:
+            self.decodeTags()
+        return self.tags.get(tag)
+
+    def countMismatches(self):
+        """
+        Counts mismatched bases, using the MD tag if present and otherwise the
+        edit distance in the NM tag minus the indel bases in the CIGAR.
+        """
+        MD = self.getTag("MD")
+        if MD is not None:
+            return sum(1 for x in self.MD_MISMATCH.findall(MD) if x[0] != "^")
+        NM = self.getTag("NM")
+        if NM is None:
+            return 0
+        return int(NM) - self.getCigar().countIndelBases()
+
+    def flag_unmapped(self):
+        return (self.flags & 0x4) != 0
+
+    def flag_PCRduplicate(self):
+        return (self.flags & 0x400) != 0
+
+    def flag_revComp(self):
+        return (self.flags & 0x10) != 0
+
+    def flag_firstOfPair(self):
+        return (self.flags & 0x40) != 0
+
+    def flag_secondOfPair(self):
+        return (self.flags & 0x80) != 0
+
+    def flag_secondary(self):
+        return (self.flags & 0x100) != 0
+
+    def flag_supplementary(self):
+        return (self.flags & 0x800) != 0
@@ -0,0 +1,139 @@
+# =========================================================================
+# This is OPEN SOURCE SOFTWARE governed by the Gnu General Public
+# License (GPL) version 3, as described at www.opensource.org.
+# Copyright (C)2016 William H. Majoros (martiandna@gmail.com).
+# Author: Siyan Liu
+# =========================================================================
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals, generators, nested_scopes, with_statement)
+
+import mmap
+import struct
+
+import numpy as np
+
+
+class MappedAlignability:
+    """
+    This class reads a per-base alignability map in a compact binary format
+    through mmap, so that any number of processes share one page-cached copy
+    and opening the map costs only a header read.  It answers the same
+    getMin() queries as AlignabilityCache.
+
+    File format (little-endian):
+        header  : magic "TRCRALN1", uint32 dtype code (1=uint8, 2=float16),
+                  float32 scale, uint32 number of chromosomes
+        index   : per chromosome, uint16 name length, name (UTF-8),
+                  uint64 length, uint64 byte offset of its data
+        data    : per chromosome, one value per base, starting on a page
+                  boundary.  uint8 values are round(x*scale) with 255 meaning
+                  "no data"; float16 values are x rounded up, with NaN
+                  meaning "no data".
+
+    Attributes:
+        map : mmap.mmap
+        chroms : dict mapping chromosome name to numpy array (a view of map)
+        scale : float
+    Instance Methods:
+        alignability=MappedAlignability(filename)
+        x=alignability.getMin(chrom,begin,end) # None if no data in range
+        alignability.close()
+    Class Methods:
+        MappedAlignability.convert(bigwig,filename,dtype="uint8")
+    """
+
+    MAGIC = b"TRCRALN1"
+    DTYPES = {1: np.uint8, 2: np.float16}
+    MISSING = 255
+    PAGE = 4096
+
+    def __init__(self, filename):
+        with open(filename, "rb") as IN:
+            self.map = mmap.mmap(IN.fileno(), 0, access=mmap.ACCESS_READ)
+        buf = self.map
+        if buf[:8] != self.MAGIC:
+            raise Exception(filename + " is not an alignability map")
+        (code, self.scale, numChroms) = struct.unpack_from("<IfI", buf, 8)
+        dtype = self.DTYPES[code]
+        self.chroms = {}
+        pos = 20
+        for i in range(numChroms):
+            (nameLen,) = struct.unpack_from("<H", buf, pos)
+            name = bytes(buf[pos + 2:pos + 2 + nameLen]).decode("utf-8")
+            (length, offset) = struct.unpack_from("<QQ", buf, pos + 2 + nameLen)
+            pos += 18 + nameLen
+            self.chroms[name] = np.frombuffer(buf, dtype, length, offset)
+        self.isQuantized = dtype == np.uint8
+
+    def getMin(self, chrom, begin, end):
+        """
+        Returns the minimum alignability over [begin,end) of chrom, ignoring
+        bases with no data, or None if there is no data at all.
+        """
+        values = self.chroms.get(chrom)
+        if values is None:
+            return None
+        values = values[begin:end]
+        if len(values) == 0:
+            return None
+        if self.isQuantized:
+            lowest = values.min()
+            if lowest == self.MISSING:
+                return None
+            return float(lowest) / self.scale
+        lowest = np.fmin.reduce(values)
+        if np.isnan(lowest):
+            return None
+        return float(lowest)
+
+    def close(self):
+        self.chroms = {}
+        self.map.close()
+
+    @classmethod
+    def convert(cls, bigwig, filename, dtype="uint8", chunkSize=10000000):
+        """
+        Writes the contents of an open pyBigWig file into a map file.
+        """
+        code = 1 if dtype == "uint8" else 2
+        scale = float(cls.MISSING - 1) if code == 1 else 1.0
+        chroms = sorted(bigwig.chroms().items())
+        header = cls.MAGIC + struct.pack("<IfI", code, scale, len(chroms))
+        indexSize = sum(18 + len(name.encode("utf-8")) for (name, L) in chroms)
+        offset = cls.pageAlign(len(header) + indexSize)
+        itemSize = np.dtype(cls.DTYPES[code]).itemsize
+        index = []
+        for (name, length) in chroms:
+            encoded = name.encode("utf-8")
+            index.append(struct.pack("<H", len(encoded)) + encoded +
+                         struct.pack("<QQ", length, offset))
+            offset = cls.pageAlign(offset + length * itemSize)
+        with open(filename, "wb") as OUT:
+            OUT.write(header)
+            OUT.write(b"".join(index))
+            for (name, length) in chroms:
+                OUT.seek(cls.pageAlign(OUT.tell()))
+                for begin in range(0, length, chunkSize):
+                    end = min(begin + chunkSize, length)
+                    values = np.asarray(bigwig.values(name, begin, end,
+                                                      numpy=True),
+                                        dtype=np.float32)
+                    if code == 1:
+                        missing = np.isnan(values)
+                        values = np.rint(np.clip(np.nan_to_num(values), 0, 1)
+                                         * scale).astype(np.uint8)
+                        values[missing] = cls.MISSING
+                    else:
+                        # Round up, so no value drops below a threshold
+                        # that the bigWig value meets
+                        rounded = values.astype(np.float16)
+                        low = rounded < values
+                        rounded[low] = np.nextafter(rounded[low],
+                                                    np.float16(np.inf))
+                        values = rounded
+                    OUT.write(values.tobytes())
+            OUT.truncate(offset)
+
+    @classmethod
+    def pageAlign(cls, offset):
+        return (offset + cls.PAGE - 1) // cls.PAGE * cls.PAGE
@@ -0,0 +1,159 @@
+# =========================================================================
+# This is OPEN SOURCE SOFTWARE governed by the Gnu General Public
+# License (GPL) version 3, as described at www.opensource.org.
+# Copyright (C)2016 William H. Majoros (martiandna@gmail.com).
+# Author: Siyan Liu
+# =========================================================================
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals, generators, nested_scopes, with_statement)
+
+import json
+import os
+import sys
+import time
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+# Monotonic, high-resolution clock used for all stage timers
+clock = time.perf_counter
+
+
+def peakMemory():
+    """
+    Returns the peak resident memory of this process in bytes, or None where
+    the resource module is not available.
+    """
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+class Metrics:
+    """
+    This class collects counters and stage timers for a run: seconds spent
+    per stage (e.g. parse, makeHSPs, cluster, alignability, classify,
+    write), reads processed, reads rejected per filter, reads binned per bin,
+    and the peak memory of each process.  Timers use a monotonic clock and
+    are added up by the caller (start=clock() ... addTime(stage,
+    clock()-start)), so the cost is two clock reads per timed call.  Worker
+    processes send their Metrics back with each batch, to be merged into the
+    main one; all counts and times are sums, and peak memory is kept per
+    process ID.
+
+    Attributes:
+        times : dict mapping stage name to seconds
+        counts : dict mapping counter name to int ("reads", "duplicates")
+        rejected : dict mapping filter name to int
+        binned : dict mapping bin name to int
+        peakMemory : dict mapping process ID to bytes
+        start : clock() when created
+    Instance Methods:
+        metrics=Metrics()
+        metrics.addTime(stage,seconds)
+        metrics.count(name,n=1)
+        metrics.reject(filterName,n=1)
+        metrics.addBin(binName,n=1)
+        metrics.updatePeakMemory()
+        metrics.merge(otherMetrics)
+        seconds=metrics.elapsed()
+        boolean=metrics.progressDue(interval) # True every interval seconds
+        line=metrics.progressLine()
+        report=metrics.getReport() # dict, as written by writeReport()
+        metrics.writeReport(filename)
+    Class Methods:
+        none
+    """
+
+    def __init__(self):
+        self.times = {}
+        self.counts = {}
+        self.rejected = {}
+        self.binned = {}
+        self.peakMemory = {}
+        self.start = clock()
+        self.lastProgress = self.start
+
+    def addTime(self, stage, seconds):
+        self.times[stage] = self.times.get(stage, 0.0) + seconds
+
+    def count(self, name, n=1):
+        self.counts[name] = self.counts.get(name, 0) + n
+
+    def reject(self, filterName, n=1):
+        self.rejected[filterName] = self.rejected.get(filterName, 0) + n
+
+    def addBin(self, binName, n=1):
+        self.binned[binName] = self.binned.get(binName, 0) + n
+
+    def updatePeakMemory(self):
+        peak = peakMemory()
+        if peak is not None:
+            self.peakMemory[os.getpid()] = peak
+
+    def merge(self, other):
+        for (mine, theirs) in ((self.times, other.times),
+                               (self.counts, other.counts),
+                               (self.rejected, other.rejected),
+                               (self.binned, other.binned)):
+            for (key, value) in theirs.items():
+                mine[key] = mine.get(key, 0) + value
+        for (pid, peak) in other.peakMemory.items():
+            self.peakMemory[pid] = max(peak, self.peakMemory.get(pid, 0))
+
+    def elapsed(self):
+        return clock() - self.start
+
+    def progressDue(self, interval):
+        now = clock()
+        if now - self.lastProgress < interval:
+            return False
+        self.lastProgress = now
+        return True
+
+    def readsPerSecond(self):
+        elapsed = self.elapsed()
+        return self.counts.get("reads", 0) / elapsed if elapsed > 0 else 0.0
+
+    def progressLine(self):
+        self.updatePeakMemory()
+        line = "[" + str(round(self.elapsed(), 1)) + " s] " + \
+            str(self.counts.get("reads", 0)) + " reads, " + \
+            str(int(self.readsPerSecond())) + " reads/s, " + \
+            str(sum(self.binned.values())) + " binned"
+        if len(self.peakMemory) > 0:
+            line += ", peak " + \
+                str(round(max(self.peakMemory.values()) / (1 << 20), 1)) + \
+                " MB"
+        return line
+
+    def getReport(self):
+        """
+        Returns the final report as a dict: elapsed seconds, reads and
+        reads/s, seconds per stage, rejections per filter, reads per bin,
+        other counters, and the peak memory of the largest process and the
+        sum over all processes, in MB.
+        """
+        self.updatePeakMemory()
+        peaks = list(self.peakMemory.values())
+        return {"elapsedSeconds": round(self.elapsed(), 3),
+                "reads": self.counts.get("reads", 0),
+                "readsPerSecond": round(self.readsPerSecond(), 1),
+                "stageSeconds": dict((key, round(value, 3))
+                                     for (key, value) in self.times.items()),
+                "rejected": dict(self.rejected),
+                "binned": dict(self.binned),
+                "counts": dict(self.counts),
+                "processes": len(peaks),
+                "peakMemoryMB": round(max(peaks) / (1 << 20), 1)
+                if len(peaks) > 0 else None,
+                "totalPeakMemoryMB": round(sum(peaks) / (1 << 20), 1)
+                if len(peaks) > 0 else None}
+
+    def writeReport(self, filename):
+        with open(filename, "wt") as OUT:
+            json.dump(self.getReport(), OUT, indent=2, sort_keys=True)
+            OUT.write("\n")
@@ -0,0 +1,99 @@
+# =========================================================================
+# This is OPEN SOURCE SOFTWARE governed by the Gnu General Public
+# License (GPL) version 3, as described at www.opensource.org.
+# Copyright (C)2016 William H. Majoros (martiandna@gmail.com).
+# Author: Siyan Liu
+# =========================================================================
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals, generators, nested_scopes, with_statement)
+
+import bisect
+import re
+
+
+class MismatchCounter:
+    """
+    This class counts the mismatched bases of HSPs from the MD tags of their
+    records.  Each MD string is parsed once into a sorted list of the
+    reference positions of mismatched bases, and an HSP's count is the number
+    of those positions inside its reference interval (the span of its kept
+    CIGAR ops), found by binary search.  MD strings do not cover reference
+    skipped by N ops (e.g., introns), so positions after each N are shifted
+    by the skipped lengths taken from the CIGAR.  Records without an MD tag
+    fall back to SamRecord.countMismatches() (NM minus the indel bases).
+
+    Attributes:
+        none
+    Instance Methods:
+        none
+    Class Methods:
+        positions=MismatchCounter.parseMD(MD,refPos,cigarString=None)
+        (offsets,totals)=MismatchCounter.referenceSkips(cigarString)
+        n=MismatchCounter.countInRange(positions,begin,end)
+        n=MismatchCounter.count(rec,summary,cigarString) # summary is a
+                                                         # CigarSummary
+    """
+
+    MD_TOKEN = re.compile(r"(\d+)|\^([A-Za-z]+)|([A-Za-z])")
+    CIGAR_OP = re.compile(r"(\d+)([MIDNSHP=X])")
+    MD_OPS = frozenset("MD=X")
+
+    @classmethod
+    def referenceSkips(cls, cigarString):
+        """
+        Returns the N ops of a CIGAR string as two parallel lists: the offset
+        into the MD string's reference bases at which each occurs, and the
+        total length skipped up to and including it.
+        """
+        offsets = []
+        totals = []
+        offset = 0
+        total = 0
+        for (length, op) in cls.CIGAR_OP.findall(cigarString):
+            if op == "N":
+                total += int(length)
+                offsets.append(offset)
+                totals.append(total)
+            elif op in cls.MD_OPS:
+                offset += int(length)
+        return (offsets, totals)
+
+    @classmethod
+    def parseMD(cls, MD, refPos, cigarString=None):
+        """
+        Returns the reference positions of the mismatched bases in an MD
+        string, for an alignment starting at refPos with the given CIGAR
+        (only needed if it may contain N ops).
+        """
+        offsets = None
+        if cigarString is not None and "N" in cigarString:
+            (offsets, totals) = cls.referenceSkips(cigarString)
+        positions = []
+        offset = 0
+        for (matches, deleted, mismatch) in cls.MD_TOKEN.findall(MD):
+            if matches:
+                offset += int(matches)
+            elif deleted:
+                offset += len(deleted)
+            else:
+                pos = refPos + offset
+                if offsets:
+                    i = bisect.bisect_right(offsets, offset)
+                    if i > 0:
+                        pos += totals[i - 1]
+                positions.append(pos)
+                offset += 1
+        return positions
+
+    @classmethod
+    def countInRange(cls, positions, begin, end):
+        return bisect.bisect_left(positions, end) - \
+            bisect.bisect_left(positions, begin)
+
+    @classmethod
+    def count(cls, rec, summary, cigarString):
+        MD = rec.getTag("MD")
+        if MD is None:
+            return rec.countMismatches()
+        positions = cls.parseMD(MD, rec.getRefPos(), cigarString)
+        return cls.countInRange(positions, summary.refBegin, summary.refEnd)
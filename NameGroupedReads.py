@@ -0,0 +1,179 @@
+# =========================================================================
+# This is OPEN SOURCE SOFTWARE governed by the Gnu General Public
+# License (GPL) version 3, as described at www.opensource.org.
+# Copyright (C)2016 William H. Majoros (martiandna@gmail.com).
+# Author: Siyan Liu
+# =========================================================================
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals, generators, nested_scopes, with_statement)
+
+import heapq
+import logging
+import os
+import pickle
+import shutil
+import tempfile
+
+from SamReadGroup import SamReadGroup
+from StreamSamReads import StreamSamReads
+
+
+class NameGroupedReads(StreamSamReads):
+    """
+    This is a drop-in replacement for StreamSamReads for input that is not
+    grouped by read ID (e.g., coordinate-sorted), so no "samtools sort -n" is
+    needed.  Records are gathered by read ID in memory until their estimated
+    size reaches maxBytes; the gathered groups are then written to a
+    temporary run file, sorted by read ID, and memory is cleared.  At the end
+    of the input the runs (and whatever is still in memory) are merged k
+    ways, so each read group comes out complete, in order of read ID, with
+    its records in input order.  Nothing is written to disk if the whole
+    input fits in maxBytes.  Runs are merged into one whenever there are
+    MAX_RUNS of them, to bound the number of open files.
+
+    Attributes:
+        maxBytes : int, estimated memory for gathered records
+        spillDir : string, or None (the system's temporary directory)
+        pending : dict mapping read ID to array of records
+        pendingBytes : int
+        runFiles : array of string
+        merged : iterator over (readID,records), once the input is read
+        lookahead : (readID,records) taken from merged but not yet returned
+    Instance Methods:
+        stream=NameGroupedReads(filename,dedup=True,threads=1,reference=None,
+                                deduplicator=None,maxBytes=1<<30,
+                                spillDir=None)
+        readGroup=stream.nextGroup()
+        groups=stream.nextBatch(n)
+        stream.close() # deletes the run files
+    Private Methods:
+        self.gather()
+        self.spill()
+        self.mergeRuns()
+        iterator=self.readRun(filename)
+    Class Methods:
+        n=NameGroupedReads.recordBytes(rec)
+    """
+
+    def __init__(self, filename, dedup=True, threads=1, reference=None,
+                 deduplicator=None, maxBytes=1 << 30, spillDir=None):
+        StreamSamReads.__init__(self, filename, dedup, threads, reference,
+                                deduplicator)
+        self.maxBytes = maxBytes
+        self.spillDir = spillDir
+        self.tempDir = None
+        self.pending = {}
+        self.pendingBytes = 0
+        self.runFiles = []
+        self.numRuns = 0
+        self.merged = None
+        self.lookahead = None
+
+    MAX_RUNS = 64
+
+    @classmethod
+    def recordBytes(cls, rec):
+        """
+        Returns a rough estimate of the memory used by a record: a fixed
+        overhead for the object, its fields and tags, plus the sequence.
+        LazySamRecords are detached from the reader's chunk buffer before
+        they are gathered, so the chunk is not counted.
+        """
+        return 600 + rec.seqLength()
+
+    def gather(self):
+        """
+        Reads the whole input, spilling runs as needed, and sets up the
+        merge.
+        """
+        while True:
+            read = self.reader.nextSequence()
+            if read is None:
+                break
+            if read.flag_unmapped():
+                logging.debug("Read is unmapped")
+                continue
+            if self.dedup and read.flag_PCRduplicate():
+                logging.debug("Read is PCR duplicate")
+                continue
+            if hasattr(read, "detach"):
+                read.detach()
+            self.pending.setdefault(read.getID(), []).append(read)
+            self.pendingBytes += self.recordBytes(read)
+            if self.pendingBytes >= self.maxBytes:
+                self.spill()
+        runs = [self.readRun(x) for x in self.runFiles]
+        runs.append(iter(sorted(self.pending.items(), key=lambda x: x[0])))
+        self.pending = {}
+        self.merged = heapq.merge(*runs, key=lambda x: x[0])
+
+    def newRunFile(self):
+        if self.tempDir is None:
+            self.tempDir = tempfile.mkdtemp(prefix="tracer-group-",
+                                            dir=self.spillDir)
+        self.numRuns += 1
+        return os.path.join(self.tempDir, "run" + str(self.numRuns) + ".pkl")
+
+    def spill(self):
+        filename = self.newRunFile()
+        with open(filename, "wb") as OUT:
+            for readID in sorted(self.pending.keys()):
+                pickle.dump((readID, self.pending[readID]), OUT,
+                            pickle.HIGHEST_PROTOCOL)
+        self.runFiles.append(filename)
+        self.pending = {}
+        self.pendingBytes = 0
+        if len(self.runFiles) >= self.MAX_RUNS:
+            self.mergeRuns()
+
+    def mergeRuns(self):
+        """
+        Merges all runs into one, so that no more than MAX_RUNS files are
+        ever open at once during the final merge.
+        """
+        filename = self.newRunFile()
+        runs = [self.readRun(x) for x in self.runFiles]
+        with open(filename, "wb") as OUT:
+            for item in heapq.merge(*runs, key=lambda x: x[0]):
+                pickle.dump(item, OUT, pickle.HIGHEST_PROTOCOL)
+        for x in self.runFiles:
+            os.remove(x)
+        self.runFiles = [filename]
+
+    def readRun(self, filename):
+        with open(filename, "rb") as IN:
+            while True:
+                try:
+                    yield pickle.load(IN)
+                except EOFError:
+                    break
+
+    def readGroup(self):
+        """
+        Returns the next complete read group: the records of one read ID from
+        all runs, in input order (runs are merged stably).
+        """
+        if self.merged is None:
+            self.gather()
+        group = SamReadGroup()
+        groupID = None
+        while True:
+            if self.lookahead is None:
+                self.lookahead = next(self.merged, None)
+                if self.lookahead is None:
+                    break
+            (readID, records) = self.lookahead
+            if groupID is None:
+                groupID = readID
+            elif readID != groupID:
+                break
+            group.reads.extend(records)
+            self.lookahead = None
+        if len(group) == 0:
+            self.close()
+        return group
+
+    def close(self):
+        if self.tempDir is not None:
+            shutil.rmtree(self.tempDir, ignore_errors=True)
+            self.tempDir = None
@@ -0,0 +1,155 @@
+# =========================================================================
+# This is OPEN SOURCE SOFTWARE governed by the Gnu General Public
+# License (GPL) version 3, as described at www.opensource.org.
+# Copyright (C)2016 William H. Majoros (martiandna@gmail.com).
+# Author: Siyan Liu
+# =========================================================================
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals, generators, nested_scopes, with_statement)
+
+import multiprocessing
+
+import numpy as np
+
+from TargetSiteFinder import TargetSiteFinder
+
+# Number of set bits in each byte value, for popcount without
+# numpy.bitwise_count
+POPCOUNT8 = np.array([bin(x).count("1") for x in range(256)], dtype=np.uint8)
+LOW_BITS = np.uint64(0x5555555555555555)
+
+
+def countMismatches(x, y):
+    """
+    Returns the number of differing bases between two arrays of 2-bit packed
+    k-mers: the bits of x^y are folded so that each base with any difference
+    sets one bit, and those bits are counted.
+    """
+    diff = x ^ y
+    diff = (diff | (diff >> np.uint64(1))) & LOW_BITS
+    if hasattr(np, "bitwise_count"):
+        return np.bitwise_count(diff)
+    return POPCOUNT8[diff.view(np.uint8).reshape(-1, 8)].sum(axis=1)
+
+
+def expandRanges(lo, hi):
+    """
+    Given index ranges [lo[i],hi[i]), returns (rows,indices), listing every
+    index in every range together with the i it came from.
+    """
+    counts = hi - lo
+    total = int(counts.sum())
+    rows = np.repeat(np.arange(len(lo)), counts)
+    shift = np.repeat(lo - (np.cumsum(counts) - counts), counts)
+    return (rows, np.arange(total, dtype=np.int64) + shift)
+
+
+class OffTargetScanner(TargetSiteFinder):
+    """
+    This class finds every site within maxMismatches mismatches of any guide
+    (with an exact PAM), on both strands.  It uses the pigeonhole principle:
+    each guide is cut into maxMismatches+1 segments, so any site with few
+    enough mismatches matches at least one segment exactly.  Segments are
+    looked up by binary search in sorted tables over the 2-bit packed
+    protospacer at every PAM position, and each candidate is then verified
+    with a bit-parallel (XOR and popcount) mismatch count over the whole
+    packed k-mer.
+
+    Attributes:
+        maxMismatches : int
+        segments : dict mapping (k,strand) to array of (shift,mask,values,
+                   rows), one per segment; values are sorted segment values
+                   and rows index into the (k,strand) guide table
+    Instance Methods:
+        scanner=OffTargetScanner(guides,maxMismatches=3,pam="NGG",
+                                 cutOffset=-3)
+        sites=scanner.search(chrom,seq) # returns array of TargetSite
+        sites=scanner.scanGenome(genome,processes=1,chroms=None)
+    Class Methods:
+        none
+    """
+
+    CHUNK = 1000000
+
+    def __init__(self, guides, maxMismatches=3, pam="NGG", cutOffset=-3):
+        TargetSiteFinder.__init__(self, guides, pam, cutOffset)
+        self.maxMismatches = maxMismatches
+        self.segments = {}
+        for ((k, strand), (keys, guideIndices)) in self.tables.items():
+            numSegments = min(maxMismatches + 1, k)
+            segments = []
+            for j in range(numSegments):
+                (a, b) = (j * k // numSegments, (j + 1) * k // numSegments)
+                shift = np.uint64(2 * (k - b))
+                mask = np.uint64((1 << (2 * (b - a))) - 1)
+                values = (keys >> shift) & mask
+                order = np.argsort(values, kind="stable")
+                segments.append((shift, mask, values[order], order))
+            self.segments[(k, strand)] = segments
+
+    def match(self, chrom, begin, protospacers, packed, k, strand):
+        """
+        Returns the sites whose packed protospacers are within maxMismatches
+        of a guide.
+        """
+        (keys, guideIndices) = self.tables[(k, strand)]
+        pairs = []
+        for (shift, mask, values, rows) in self.segments[(k, strand)]:
+            segment = (packed >> shift) & mask
+            lo = np.searchsorted(values, segment, side="left")
+            hi = np.searchsorted(values, segment, side="right")
+            (positions, indices) = expandRanges(lo, hi)
+            pairs.append(positions * len(keys) + rows[indices])
+        if len(pairs) == 0:
+            return []
+        pairs = np.unique(np.concatenate(pairs))
+        (positions, rows) = (pairs // len(keys), pairs % len(keys))
+        mismatches = countMismatches(packed[positions], keys[rows])
+        ok = mismatches <= self.maxMismatches
+        sites = []
+        for (p, row, m) in zip(positions[ok].tolist(), rows[ok].tolist(),
+                               mismatches[ok].tolist()):
+            guide = self.guides[guideIndices[row]]
+            sites.append(self.makeSite(guide, chrom, begin + protospacers[p],
+                                       k, strand, m))
+        return sites
+
+    def scanGenome(self, genome, processes=1, chroms=None):
+        """
+        Searches the chromosomes of an IndexedFasta (all of them, or those
+        named in chroms), one chromosome per task on a pool of worker
+        processes, and returns all sites sorted by chromosome and position.
+        """
+        if chroms is None:
+            chroms = genome.getChromNames()
+        sites = []
+        if processes <= 1:
+            for chrom in chroms:
+                sites.extend(self.searchGenome(genome, chrom))
+        else:
+            pool = multiprocessing.Pool(processes, initScanner,
+                                        (self, genome))
+            try:
+                for result in pool.imap_unordered(scanChromosome, chroms):
+                    sites.extend(result)
+                pool.close()
+            finally:
+                pool.terminate()
+                pool.join()
+        sites.sort(key=lambda site: (site.chrom, site.pos, site.guideID,
+                                     site.strand))
+        return sites
+
+
+# The scanner and genome of each worker process, set by initScanner()
+SCANNER = None
+GENOME = None
+
+
+def initScanner(scanner, genome):
+    global SCANNER, GENOME
+    (SCANNER, GENOME) = (scanner, genome)
+
+
+def scanChromosome(chrom):
+    return SCANNER.searchGenome(GENOME, chrom)
@@ -0,0 +1,192 @@
+# =========================================================================
+# This is OPEN SOURCE SOFTWARE governed by the Gnu General Public
+# License (GPL) version 3, as described at www.opensource.org.
+# Copyright (C)2016 William H. Majoros (martiandna@gmail.com).
+# Author: Siyan Liu
+# =========================================================================
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals, generators, nested_scopes, with_statement)
+
+import hashlib
+import struct
+
+import numpy as np
+
+
+class CountMinSketch:
+    """
+    This class estimates the counts of arbitrarily many string keys in fixed
+    memory (depth x width counters).  Estimates are never too low, and are too
+    high by at most 2N/width with probability 1-(1/2)^depth, for N the total
+    count.  Keys are hashed with BLAKE2, not hash(), so sketches made in
+    different processes can be merged.
+
+    Attributes:
+        counts : int64 array of shape (depth,width)
+    Instance Methods:
+        sketch=CountMinSketch(width=1<<20,depth=4)
+        sketch.add(key,n=1)
+        n=sketch.estimate(key)
+        sketch.merge(otherSketch)
+    Class Methods:
+        none
+    """
+
+    def __init__(self, width=1 << 20, depth=4):
+        self.counts = np.zeros((depth, width), dtype=np.int64)
+        self.rows = np.arange(depth, dtype=np.uint64)
+
+    def columns(self, key):
+        digest = hashlib.blake2b(key.encode("utf-8"), digest_size=16).digest()
+        (h1, h2) = struct.unpack("<QQ", digest)
+        hashes = np.uint64(h1) + self.rows * np.uint64(h2 | 1)
+        return (hashes % np.uint64(self.counts.shape[1])).astype(np.int64)
+
+    def add(self, key, n=1):
+        self.counts[np.arange(len(self.rows)), self.columns(key)] += n
+
+    def estimate(self, key):
+        return int(self.counts[np.arange(len(self.rows)),
+                               self.columns(key)].min())
+
+    def merge(self, other):
+        self.counts += other.counts
+
+
+class OutcomeAggregator:
+    """
+    This class counts binned reads per (target,bin,outcome) as they stream
+    by, where the outcome is a normalized description of the edit (see
+    Tracer.describeOutcome()), and writes one summary table at the end, in
+    place of the per-read bin files.
+
+    Without maxOutcomes, all counts are exact.  With maxOutcomes=K, at most K
+    outcomes are counted individually and the rest go into a CountMinSketch.
+    An outcome in the sketch whose estimated count overtakes the smallest
+    counted one takes its place, starting from its estimate; its error (the
+    most its count can be too high) is recorded.  Outcomes that are common
+    from the start are therefore counted exactly.  Reads not covered by any
+    counted outcome are reported, per target and bin, on a "*" line; the
+    total per target and bin is always exact.
+
+    Attributes:
+        maxOutcomes : int, or None for no limit
+        counts : dict mapping (target,bin,outcome) to [count,error,sketched],
+                 where sketched is the part of count already in the sketch
+        totals : dict mapping (target,bin) to int
+        sketch : CountMinSketch, or None
+    Instance Methods:
+        aggregator=OutcomeAggregator(maxOutcomes=None,sketchWidth=1<<20,
+                                     sketchDepth=4)
+        aggregator.add(target,binName,outcome,n=1)
+        aggregator.merge(otherAggregator)
+        rows=aggregator.getRows() # array of (target,bin,outcome,count,error)
+        aggregator.write(filename)
+    Class Methods:
+        OutcomeAggregator.writeSamples(filename,samples)
+    """
+
+    HEADER = "target\tbin\toutcome\treads\terror"
+
+    def __init__(self, maxOutcomes=None, sketchWidth=1 << 20, sketchDepth=4):
+        self.maxOutcomes = maxOutcomes
+        self.counts = {}
+        self.totals = {}
+        self.sketch = None if maxOutcomes is None \
+            else CountMinSketch(sketchWidth, sketchDepth)
+        self.smallest = 0
+
+    def add(self, target, binName, outcome, n=1):
+        key = (target, binName, outcome)
+        totalKey = (target, binName)
+        self.totals[totalKey] = self.totals.get(totalKey, 0) + n
+        entry = self.counts.get(key)
+        if entry is not None:
+            entry[0] += n
+        elif self.maxOutcomes is None or len(self.counts) < self.maxOutcomes:
+            self.counts[key] = [n, 0, 0]
+        else:
+            self.addToSketch(key, n)
+
+    def addToSketch(self, key, n):
+        """
+        Counts an outcome in the sketch, and swaps it with the smallest
+        counted outcome if its estimate is larger.  self.smallest is a lower
+        bound on the smallest count, so the table is only scanned when a
+        swap is likely.
+        """
+        sketchKey = "\t".join(key)
+        self.sketch.add(sketchKey, n)
+        estimate = self.sketch.estimate(sketchKey)
+        if estimate <= self.smallest or len(self.counts) == 0:
+            return
+        (smallestKey, smallest) = min(self.counts.items(),
+                                      key=lambda x: x[1][0])
+        self.smallest = smallest[0]
+        if estimate <= self.smallest:
+            return
+        del self.counts[smallestKey]
+        self.sketch.add("\t".join(smallestKey), smallest[0] - smallest[2])
+        self.counts[key] = [estimate, estimate - n, estimate]
+        self.smallest = min(x[0] for x in self.counts.values())
+
+    def merge(self, other):
+        """
+        Adds the counts of another aggregator (from another worker) into this
+        one.  Sketches must have the same dimensions.
+        """
+        if other.sketch is not None:
+            if self.sketch is None:
+                raise Exception("Cannot merge a bounded aggregator into an "
+                                "exact one")
+            self.sketch.merge(other.sketch)
+        for (key, (count, error, sketched)) in other.counts.items():
+            entry = self.counts.get(key)
+            if entry is not None:
+                entry[0] += count
+                entry[1] += error
+                entry[2] += sketched
+            elif self.maxOutcomes is None or \
+                    len(self.counts) < self.maxOutcomes:
+                self.counts[key] = [count, error, sketched]
+            else:
+                self.addToSketch(key, count - sketched)
+        for (key, n) in other.totals.items():
+            self.totals[key] = self.totals.get(key, 0) + n
+
+    def getRows(self):
+        """
+        Returns (target,bin,outcome,count,error) for every counted outcome,
+        sorted by target, bin and decreasing count, plus a "*" row per target
+        and bin for reads not covered by the counted outcomes.
+        """
+        rows = [key + tuple(value[:2]) for (key, value) in self.counts.items()]
+        covered = {}
+        for (target, binName, outcome, count, error) in rows:
+            covered[(target, binName)] = covered.get((target, binName), 0) + \
+                count - error
+        for (key, total) in self.totals.items():
+            rest = total - covered.get(key, 0)
+            if rest > 0 and self.sketch is not None:
+                rows.append(key + ("*", rest, 0))
+        rows.sort(key=lambda x: (x[0], x[1], x[2] == "*", -x[3], x[2]))
+        return rows
+
+    def write(self, filename):
+        with open(filename, "wt") as OUT:
+            OUT.write(self.HEADER + "\n")
+            for row in self.getRows():
+                OUT.write("\t".join([str(x) for x in row]) + "\n")
+
+    @classmethod
+    def writeSamples(cls, filename, samples):
+        """
+        Writes the counts of several samples into one table, with the sample
+        ID in the first column; samples is an array of (sampleID,aggregator).
+        """
+        with open(filename, "wt") as OUT:
+            OUT.write("sample\t" + cls.HEADER + "\n")
+            for (sampleID, aggregator) in samples:
+                for row in aggregator.getRows():
+                    OUT.write(sampleID + "\t" +
+                              "\t".join([str(x) for x in row]) + "\n")
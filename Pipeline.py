@@ -0,0 +1,200 @@
+# =========================================================================
+# This is OPEN SOURCE SOFTWARE governed by the Gnu General Public
+# License (GPL) version 3, as described at www.opensource.org.
+# Copyright (C)2016 William H. Majoros (martiandna@gmail.com).
+# Author: Siyan Liu
+# =========================================================================
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals, generators, nested_scopes, with_statement)
+
+import sys
+import threading
+
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+# How long a blocked thread waits before checking whether the pipeline was
+# stopped, in seconds
+POLL_INTERVAL = 0.1
+
+
+class PipelineStage:
+    """
+    This is the common part of ReadAheadStream and WriterThread: a daemon
+    thread connected to the main thread by a bounded queue.  A full queue
+    blocks the producer (backpressure), so at most depth items are buffered.
+    Blocking calls wake up regularly to check the stop event, so neither side
+    can hang after the other fails or quits; an exception raised in the
+    thread is kept and re-raised in the main thread.
+
+    Attributes:
+        queue : queue.Queue of at most depth items
+        stopped : threading.Event
+        error : exc_info triple of an exception raised in the thread, or None
+        thread : threading.Thread
+    Instance Methods:
+        stage.start()
+        stage.stop() # asks the thread to quit, and waits for it
+        stage.checkError() # re-raises an exception from the thread
+    Class Methods:
+        none
+    """
+
+    END = object()
+
+    def __init__(self, depth):
+        self.queue = queue.Queue(maxsize=depth)
+        self.stopped = threading.Event()
+        self.error = None
+        self.thread = threading.Thread(target=self.runSafely)
+        self.thread.daemon = True
+
+    def start(self):
+        self.thread.start()
+
+    def runSafely(self):
+        try:
+            self.run()
+        except BaseException:
+            self.error = sys.exc_info()
+            self.stopped.set()
+
+    def put(self, item):
+        """
+        Puts an item on the queue, waiting while it is full; returns False
+        if the pipeline was stopped instead.
+        """
+        while not self.stopped.is_set():
+            try:
+                self.queue.put(item, timeout=POLL_INTERVAL)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def get(self):
+        """
+        Takes an item from the queue, waiting while it is empty; returns END
+        if the pipeline was stopped instead.
+        """
+        while True:
+            try:
+                return self.queue.get(timeout=POLL_INTERVAL)
+            except queue.Empty:
+                if self.stopped.is_set() or not self.thread.is_alive():
+                    return self.END
+
+    def checkError(self):
+        if self.error is not None:
+            (type, value, traceback) = self.error
+            self.error = None
+            raise value
+
+    def stop(self):
+        self.stopped.set()
+        if self.thread.is_alive():
+            self.thread.join()
+
+
+class ReadAheadStream(PipelineStage):
+    """
+    This class wraps a StreamSamReads (or RegionSamReads) and reads batches
+    of read groups from it on a background thread, at most depth batches
+    ahead of the consumer, so that parsing and decompression overlap with
+    processing.  It can be passed to TracerPool.run() in place of the stream.
+
+    Attributes:
+        stream : StreamSamReads
+        batchSize : int
+    Instance Methods:
+        stream=ReadAheadStream(stream,batchSize=1000,depth=4)
+        groups=stream.nextBatch(n) # n must be batchSize; [] at the end
+        stream.close()
+    Class Methods:
+        none
+    """
+
+    def __init__(self, stream, batchSize=1000, depth=4):
+        PipelineStage.__init__(self, depth)
+        self.stream = stream
+        self.batchSize = batchSize
+        self.finished = False
+        self.start()
+
+    def run(self):
+        while not self.stopped.is_set():
+            groups = self.stream.nextBatch(self.batchSize)
+            if not self.put(groups) or len(groups) == 0:
+                break
+
+    def nextBatch(self, n):
+        if n != self.batchSize:
+            raise Exception("ReadAheadStream reads batches of " +
+                            str(self.batchSize) + " groups, not " + str(n))
+        if self.finished:
+            return []
+        groups = self.get()
+        if groups is self.END:
+            self.checkError()
+            groups = []
+        if len(groups) == 0:
+            self.finished = True
+        return groups
+
+    def close(self):
+        self.stop()
+
+
+class WriterThread(PipelineStage):
+    """
+    This class calls a function on each item put on it, in order, on a
+    background thread, so that output is written while the next batch is
+    being computed.  Used as a context manager, it waits for all items to be
+    written on normal exit, but on an exception it discards whatever is still
+    queued and stops at once.  An exception in the writer is re-raised by
+    the next put() or by close().
+
+    Attributes:
+        write : function(item)
+    Instance Methods:
+        writer=WriterThread(write,depth=4)
+        writer.put(item)
+        writer.close() # waits until everything is written
+    Class Methods:
+        none
+    """
+
+    def __init__(self, write, depth=4):
+        PipelineStage.__init__(self, depth)
+        self.write = write
+        self.start()
+
+    def run(self):
+        while True:
+            item = self.get()
+            if item is self.END or self.stopped.is_set():
+                break
+            self.write(item)
+
+    def put(self, item):
+        if not PipelineStage.put(self, item):
+            self.checkError()
+            raise Exception("Writer was stopped")
+
+    def close(self):
+        if not self.stopped.is_set():
+            PipelineStage.put(self, self.END)
+            self.thread.join()
+        self.stop()
+        self.checkError()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, traceback):
+        if type is None:
+            self.close()
+        else:
+            self.stop()
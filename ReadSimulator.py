@@ -0,0 +1,342 @@
+# =========================================================================
+# This is OPEN SOURCE SOFTWARE governed by the Gnu General Public
+# License (GPL) version 3, as described at www.opensource.org.
+# Copyright (C)2016 William H. Majoros (martiandna@gmail.com).
+# Author: Siyan Liu
+# =========================================================================
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals, generators, nested_scopes, with_statement)
+
+import os
+import random
+
+import numpy as np
+
+from MappedAlignability import MappedAlignability
+
+
+class SimulatedAlignability:
+    """
+    This class holds a synthetic per-base alignability track, with the two
+    methods of a pyBigWig file that MappedAlignability.convert() needs, so a
+    .alnmap can be written without pyBigWig.
+
+    Attributes:
+        tracks : dict mapping chromosome name to float32 array
+    Instance Methods:
+        track=SimulatedAlignability(tracks)
+        chroms=track.chroms() # dict mapping name to length
+        values=track.values(chrom,begin,end,numpy=True) # always an array
+    Class Methods:
+        none
+    """
+
+    def __init__(self, tracks):
+        self.tracks = tracks
+
+    def chroms(self):
+        return dict((name, len(x)) for (name, x) in self.tracks.items())
+
+    def values(self, chrom, begin, end, numpy=True):
+        return self.tracks[chrom][begin:end]
+
+
+class ReadSimulator:
+    """
+    This class simulates a name-grouped SAM file of single-end reads from a
+    CRISPR experiment with two guides, on a random reference made of a target
+    chromosome and a decoy chromosome.  Each fragment is one of:
+        deletion : a split read joining the two cut sites, as a primary and
+                   a supplementary alignment with SA tags
+        indel : a small deletion or insertion within a few bases of a cut
+        intact : a read spanning a cut site with no edit
+        chimeric : a read split between a cut site and the decoy chromosome
+        offtarget : a read elsewhere on the target or decoy chromosome
+        lowquality : an intact read with many sequencing errors
+        unmapped : an unmapped record
+        duplicate : a copy of an earlier fragment under a new read ID, flagged
+                    as a PCR duplicate half of the time
+    in proportions given by weights.  All reads also carry sequencing errors
+    at errorRate.  Records have correct CIGAR, NM and MD fields, so the MD
+    and NM code paths are both exercised.  The two cut sites follow the
+    config file's convention: a deletion joins ref[:cut1] to ref[cut2:].
+
+    Attributes:
+        rng : random.Random
+        chrom, decoy : string, names of the two chromosomes
+        reference : dict mapping chromosome name to string
+        cutSites : (int,int)
+        readLength : int
+        errorRate : float
+        weights : dict mapping category to relative frequency
+    Instance Methods:
+        sim=ReadSimulator(seed=1,refLength=100000,readLength=150,
+                          errorRate=0.002,weights=None)
+        for (readID,category,lines) in sim.simulate(numFragments):
+        sim.writeFasta(filename)
+        sim.writeAlignability(filename) # as .alnmap
+        sim.writeSam(filename,numFragments,truthFile=None)
+        sim.writeConfig(filename,alignabilityFile=None)
+        sim.writeAll(prefix,numFragments) # .fa .sam .truth.tsv .alnmap .config
+    Private Methods:
+        lines=self.makeFragment(readID,category)
+        line=self.record(readID,flags,chrom,pos,ops,seq,tags)
+    Class Methods:
+        none
+    """
+
+    WEIGHTS = {"deletion": 0.30, "indel": 0.20, "intact": 0.20,
+               "chimeric": 0.05, "offtarget": 0.08, "lowquality": 0.04,
+               "unmapped": 0.05, "duplicate": 0.08}
+    FLAG_REVERSE = 16
+    FLAG_UNMAPPED = 4
+    FLAG_DUPLICATE = 1024
+    FLAG_SUPPLEMENTARY = 2048
+    MAX_EARLIER = 10000
+
+    def __init__(self, seed=1, refLength=100000, readLength=150,
+                 errorRate=0.002, weights=None):
+        self.rng = random.Random(seed)
+        self.chrom = "chrT"
+        self.decoy = "chrD"
+        self.reference = {}
+        for chrom in (self.chrom, self.decoy):
+            self.reference[chrom] = "".join(
+                self.rng.choice("ACGT") for i in range(refLength))
+        middle = refLength // 2
+        self.cutSites = (middle, middle + 1600)
+        self.readLength = readLength
+        self.errorRate = errorRate
+        self.weights = self.WEIGHTS if weights is None else weights
+        self.categories = sorted(self.weights.keys())
+        self.earlier = []
+
+    def mutate(self, seq, rate):
+        bases = list(seq)
+        for i in range(len(bases)):
+            if self.rng.random() < rate:
+                bases[i] = self.rng.choice([x for x in "ACGT" if x != bases[i]])
+        return "".join(bases)
+
+    def record(self, readID, flags, chrom, pos, ops, seq, tags=()):
+        """
+        Returns one SAM line for an alignment of seq at pos (0-based) on
+        chrom, described by a list of (op,length) pairs, with NM and MD
+        computed from the reference.
+        """
+        ref = self.reference[chrom]
+        (readPos, refPos, NM, matches, MD) = (0, pos, 0, 0, [])
+        for (op, length) in ops:
+            if op == "M":
+                for i in range(length):
+                    if seq[readPos + i] == ref[refPos + i]:
+                        matches += 1
+                    else:
+                        MD.append(str(matches) + ref[refPos + i])
+                        matches = 0
+                        NM += 1
+                (readPos, refPos) = (readPos + length, refPos + length)
+            elif op == "D":
+                MD.append(str(matches) + "^" + ref[refPos:refPos + length])
+                matches = 0
+                NM += length
+                refPos += length
+            elif op == "I":
+                NM += length
+                readPos += length
+            elif op == "S":
+                readPos += length
+        MD.append(str(matches))
+        cigar = "".join(str(length) + op for (op, length) in ops)
+        fields = [readID, str(flags), chrom, str(pos + 1), "60", cigar, "*",
+                  "0", "0", seq, "*", "NM:i:" + str(NM), "MD:Z:" + "".join(MD)]
+        return "\t".join(fields + list(tags))
+
+    def nearCut(self, margin):
+        """
+        Returns a random cut site and a read start placing it at least margin
+        bases from either end of the read.
+        """
+        cut = self.rng.choice(self.cutSites)
+        return (cut, cut - self.rng.randint(margin, self.readLength - margin))
+
+    def strandFlag(self):
+        return self.FLAG_REVERSE if self.rng.random() < 0.5 else 0
+
+    def splitRead(self, readID, chrom1, pos1, chrom2, pos2, a):
+        """
+        Returns the primary and supplementary records of a read whose first
+        a bases align at pos1 on chrom1 and the rest at pos2 on chrom2.
+        """
+        b = self.readLength - a
+        seq = self.mutate(self.reference[chrom1][pos1:pos1 + a] +
+                          self.reference[chrom2][pos2:pos2 + b], self.errorRate)
+        strand = self.strandFlag()
+        sign = "-" if strand else "+"
+        first = self.record(readID, strand, chrom1, pos1, [("M", a), ("S", b)],
+                            seq, ["SA:Z:" + chrom2 + "," + str(pos2 + 1) + "," +
+                                  sign + "," + str(a) + "S" + str(b) +
+                                  "M,60,0;"])
+        second = self.record(readID, strand | self.FLAG_SUPPLEMENTARY, chrom2,
+                             pos2, [("S", a), ("M", b)], seq,
+                             ["SA:Z:" + chrom1 + "," + str(pos1 + 1) + "," +
+                              sign + "," + str(a) + "M" + str(b) + "S,60,0;"])
+        return [first, second]
+
+    def makeFragment(self, readID, category):
+        R = self.readLength
+        rng = self.rng
+        if category == "deletion":
+            a = rng.randint(30, R - 30)
+            (cut1, cut2) = self.cutSites
+            return self.splitRead(readID, self.chrom, cut1 - a, self.chrom,
+                                  cut2, a)
+        if category == "chimeric":
+            a = rng.randint(40, R - 40)
+            cut = rng.choice(self.cutSites)
+            pos2 = rng.randint(0, len(self.reference[self.decoy]) - R)
+            return self.splitRead(readID, self.chrom, cut - a, self.decoy,
+                                  pos2, a)
+        if category == "indel":
+            (cut, start) = self.nearCut(30)
+            site = cut + rng.randint(-3, 3)
+            left = site - start
+            ref = self.reference[self.chrom]
+            if rng.random() < 0.6:
+                length = rng.randint(1, 10)
+                seq = ref[start:site] + \
+                    ref[site + length:site + length + R - left]
+                ops = [("M", left), ("D", length), ("M", R - left)]
+            else:
+                length = rng.randint(1, 5)
+                inserted = "".join(rng.choice("ACGT") for i in range(length))
+                seq = ref[start:site] + inserted + \
+                    ref[site:site + R - left - length]
+                ops = [("M", left), ("I", length), ("M", R - left - length)]
+            return [self.record(readID, self.strandFlag(), self.chrom, start,
+                                ops, self.mutate(seq, self.errorRate))]
+        if category in ("intact", "lowquality"):
+            (cut, start) = self.nearCut(10)
+            rate = self.errorRate if category == "intact" else 0.15
+            seq = self.mutate(self.reference[self.chrom][start:start + R], rate)
+            return [self.record(readID, self.strandFlag(), self.chrom, start,
+                                [("M", R)], seq)]
+        if category == "offtarget":
+            chrom = rng.choice((self.chrom, self.decoy))
+            ref = self.reference[chrom]
+            while True:
+                start = rng.randint(0, len(ref) - R)
+                if all(abs(start - cut) > 2 * R for cut in self.cutSites):
+                    break
+            seq = self.mutate(ref[start:start + R], self.errorRate)
+            return [self.record(readID, self.strandFlag(), chrom, start,
+                                [("M", R)], seq)]
+        if category == "unmapped":
+            seq = "".join(rng.choice("ACGT") for i in range(R))
+            return ["\t".join([readID, str(self.FLAG_UNMAPPED), "*", "0", "0",
+                               "*", "*", "0", "0", seq, "*"])]
+        if category == "duplicate":
+            if len(self.earlier) == 0:
+                return self.makeFragment(readID, "intact")
+            original = rng.choice(self.earlier)
+            flag = self.FLAG_DUPLICATE if rng.random() < 0.5 else 0
+            lines = []
+            for line in original:
+                fields = line.split("\t")
+                fields[0] = readID
+                fields[1] = str(int(fields[1]) | flag)
+                lines.append("\t".join(fields))
+            return lines
+        raise Exception("Unknown category: " + category)
+
+    def simulate(self, numFragments):
+        """
+        Generates numFragments simulated fragments, in order of read ID, as
+        (readID,category,lines) triples.  Duplicates are copies of one of the
+        last MAX_EARLIER fragments that can be duplicated.
+        """
+        total = sum(self.weights.values())
+        cumulative = np.cumsum([self.weights[x] / total
+                                for x in self.categories])
+        width = len(str(numFragments))
+        for i in range(numFragments):
+            readID = "sim" + str(i).zfill(width)
+            k = int(np.searchsorted(cumulative, self.rng.random(),
+                                    side="right"))
+            category = self.categories[min(k, len(self.categories) - 1)]
+            lines = self.makeFragment(readID, category)
+            if category not in ("duplicate", "unmapped"):
+                if len(self.earlier) < self.MAX_EARLIER:
+                    self.earlier.append(lines)
+                else:
+                    self.earlier[i % self.MAX_EARLIER] = lines
+            yield (readID, category, lines)
+
+    def writeFasta(self, filename):
+        with open(filename, "wt") as OUT:
+            for chrom in (self.chrom, self.decoy):
+                seq = self.reference[chrom]
+                OUT.write(">" + chrom + "\n")
+                for i in range(0, len(seq), 60):
+                    OUT.write(seq[i:i + 60] + "\n")
+
+    def writeAlignability(self, filename):
+        """
+        Writes an alignability map that is 1 except for a few blocks of 100
+        bases with lower values.
+        """
+        tracks = {}
+        for chrom in (self.chrom, self.decoy):
+            values = np.ones(len(self.reference[chrom]), dtype=np.float32)
+            for begin in range(0, len(values), 100):
+                if self.rng.random() < 0.1:
+                    values[begin:begin + 100] = self.rng.choice((0.5, 0.1))
+            tracks[chrom] = values
+        MappedAlignability.convert(SimulatedAlignability(tracks), filename)
+
+    def writeSam(self, filename, numFragments, truthFile=None):
+        """
+        Writes numFragments simulated fragments as SAM, and optionally the
+        category of each read ID into truthFile.
+        """
+        TRUTH = None if truthFile is None else open(truthFile, "wt")
+        with open(filename, "wt") as OUT:
+            OUT.write("@HD\tVN:1.6\tSO:queryname\n")
+            for chrom in (self.chrom, self.decoy):
+                OUT.write("@SQ\tSN:" + chrom + "\tLN:" +
+                          str(len(self.reference[chrom])) + "\n")
+            if TRUTH is not None:
+                TRUTH.write("readID\tcategory\n")
+            for (readID, category, lines) in self.simulate(numFragments):
+                OUT.write("\n".join(lines) + "\n")
+                if TRUTH is not None:
+                    TRUTH.write(readID + "\t" + category + "\n")
+        if TRUTH is not None:
+            TRUTH.close()
+
+    def writeConfig(self, filename, alignabilityFile=None):
+        lines = ["TARGET_CHROM = " + self.chrom,
+                 "FIRST_CUT_SITE = " + str(self.cutSites[0]),
+                 "SECOND_CUT_SITE = " + str(self.cutSites[1]),
+                 "DEDUPLICATE = True",
+                 "MIN_IDENTITY = 0.9",
+                 "MAX_REF_GAP = 10000",
+                 "MAX_READ_GAP = 20",
+                 "MAX_ANCHOR_DISTANCE = 50",
+                 "MIN_ALIGNED_PROPORTION = 0.8"]
+        if alignabilityFile is not None:
+            lines += ["ALIGNABILITY = " + alignabilityFile,
+                      "MIN_ALIGNABILITY = 0.2"]
+        with open(filename, "wt") as OUT:
+            OUT.write("\n".join(lines) + "\n")
+
+    def writeAll(self, prefix, numFragments):
+        """
+        Writes PREFIX.fa, PREFIX.alnmap, PREFIX.sam, PREFIX.truth.tsv and a
+        Tracer config file PREFIX.config that uses them.
+        """
+        self.writeFasta(prefix + ".fa")
+        self.writeAlignability(prefix + ".alnmap")
+        self.writeSam(prefix + ".sam", numFragments, prefix + ".truth.tsv")
+        self.writeConfig(prefix + ".config",
+                         os.path.abspath(prefix + ".alnmap"))
@@ -0,0 +1,128 @@
+# =========================================================================
+# This is OPEN SOURCE SOFTWARE governed by the Gnu General Public
+# License (GPL) version 3, as described at www.opensource.org.
+# Copyright (C)2016 William H. Majoros (martiandna@gmail.com).
+# Author: Siyan Liu
+# =========================================================================
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals, generators, nested_scopes, with_statement)
+
+import logging
+
+import pysam
+
+from BamRecord import BamRecord
+from SamReadGroup import SamReadGroup
+from StreamSamReads import StreamSamReads
+
+
+class RegionSamReads(StreamSamReads):
+    """
+    This is a drop-in replacement for StreamSamReads that uses the index of a
+    coordinate-sorted BAM/CRAM file to fetch only the reads overlapping a set
+    of regions (e.g., the windows around the cut sites).  Each read group is
+    completed by also fetching the mates and supplementary alignments (from
+    the SA tag) of those reads, wherever they map.  Secondary alignments are
+    only included if they overlap a region.  Groups are returned in order of
+    read ID.
+
+    Attributes:
+        file : pysam.AlignmentFile
+        dedup : boolean
+        deduplicator : Deduplicator, or None
+        groups : array of SamReadGroup, in reverse order of read ID
+    Instance Methods:
+        stream=RegionSamReads(filename,regions,dedup=True,threads=1,
+                              reference=None,deduplicator=None)
+            # regions: array of (chrom,begin,end)
+        readGroup=stream.nextGroup()
+        groups=stream.nextBatch(n)
+    Private Methods:
+        self.fetchRegions(regions)
+        locations=self.partnerLocations(segment)
+    Class Methods:
+        none
+    """
+
+    def __init__(self, filename, regions, dedup=True, threads=1,
+                 reference=None, deduplicator=None):
+        mode = "rc" if filename.lower().endswith(".cram") else "rb"
+        self.file = pysam.AlignmentFile(filename, mode, threads=threads,
+                                        reference_filename=reference)
+        self.dedup = dedup
+        self.deduplicator = deduplicator
+        self.groups = self.fetchRegions(regions)
+        self.file.close()
+
+    def keep(self, segment):
+        if segment.is_unmapped:
+            logging.debug("Read is unmapped")
+            return False
+        if self.dedup and segment.is_duplicate:
+            logging.debug("Read is PCR duplicate")
+            return False
+        return True
+
+    def partnerLocations(self, segment):
+        """
+        Returns the (chrom,pos) locations of the mate and the supplementary
+        alignments of this segment.
+        """
+        locations = []
+        if segment.is_paired and not segment.mate_is_unmapped:
+            locations.append((segment.next_reference_name,
+                              segment.next_reference_start))
+        if segment.has_tag("SA"):
+            for entry in segment.get_tag("SA").split(";"):
+                fields = entry.split(",")
+                if len(fields) >= 2:
+                    locations.append((fields[0], int(fields[1]) - 1))
+        return locations
+
+    def fetchRegions(self, regions):
+        """
+        Fetches all alignments overlapping the regions, then follows mate and
+        SA links until every read group is complete.
+        """
+        records = {}
+        seen = set()
+        pending = []
+        visited = set()
+
+        def add(segment):
+            key = (segment.query_name, segment.flag, segment.reference_id,
+                   segment.reference_start, segment.cigarstring)
+            if key in seen:
+                return
+            seen.add(key)
+            if not self.keep(segment):
+                return
+            records.setdefault(segment.query_name, []).append(
+                BamRecord(segment))
+            pending.extend(self.partnerLocations(segment))
+
+        for (chrom, begin, end) in regions:
+            for segment in self.file.fetch(chrom, begin, end):
+                add(segment)
+        while len(pending) > 0:
+            location = pending.pop()
+            if location in visited:
+                continue
+            visited.add(location)
+            (chrom, pos) = location
+            for segment in self.file.fetch(chrom, pos, pos + 1):
+                if segment.query_name in records:
+                    add(segment)
+        groups = []
+        for readID in sorted(records.keys(), reverse=True):
+            group = SamReadGroup()
+            group.ID = readID
+            group.reads = sorted(records[readID], key=lambda rec: (
+                rec.getRefName(), rec.getRefPos(), rec.flags))
+            groups.append(group)
+        return groups
+
+    def readGroup(self):
+        if len(self.groups) == 0:
+            return SamReadGroup()
+        return self.groups.pop()
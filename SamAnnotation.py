@@ -14,6 +14,96 @@ from SamHSP import SamHSP
 from Interval import Interval
 
 
+class AnnotationFeatures:
+    """
+    This class holds the read-level summary features of a SamAnnotation,
+    computed in one pass over its HSPs (plus a sort for the overlap sweep),
+    so that repeated queries from the filters cost O(1).  Gaps are kept as
+    (begin,end) pairs; Interval objects are only made if asked for.
+
+    Attributes:
+        numHSPs : int
+        readLength : int (None if there are no HSPs)
+        alignedLength : int, summed over HSPs
+        readGaps, refGaps : array of (begin,end), between consecutive HSPs
+        firstReadBegin, lastReadEnd : int, the margins of the read
+        maxReadGap, maxRefGap : int, or None if there are no gaps
+        lowestIdentity : float (None if there are no HSPs)
+        lowestAlignability : float, or None if no HSP has one
+        sameStrand, sameRef, refsOverlap : boolean
+        refNames : set of string
+    Instance Methods:
+        features=AnnotationFeatures(HSPs)
+    Class Methods:
+        boolean=AnnotationFeatures.anyOverlap(intervals) # (begin,end) pairs
+    """
+
+    __slots__ = ("numHSPs", "readLength", "alignedLength", "readGaps",
+                 "refGaps", "firstReadBegin", "lastReadEnd", "maxReadGap",
+                 "maxRefGap", "lowestIdentity", "lowestAlignability",
+                 "sameStrand", "sameRef", "refsOverlap", "refNames")
+
+    def __init__(self, HSPs):
+        n = len(HSPs)
+        self.numHSPs = n
+        self.readLength = HSPs[0].getReadLength() if n > 0 else None
+        self.alignedLength = 0
+        self.readGaps = []
+        self.refGaps = []
+        self.lowestIdentity = None
+        self.lowestAlignability = None
+        self.refNames = set()
+        self.sameStrand = True
+        self.sameRef = True
+        refIntervals = []
+        previous = None
+        for hsp in HSPs:
+            summary = hsp.getSummary()
+            self.alignedLength += summary.readEnd - summary.readBegin
+            if previous is not None:
+                if previous.readEnd < summary.readBegin:
+                    self.readGaps.append((previous.readEnd, summary.readBegin))
+                if previous.refEnd < summary.refBegin:
+                    self.refGaps.append((previous.refEnd, summary.refBegin))
+            previous = summary
+            identity = hsp.getPercentIdentity()
+            if self.lowestIdentity is None or identity < self.lowestIdentity:
+                self.lowestIdentity = identity
+            alignability = hsp.getAlignability()
+            if alignability is not None and (self.lowestAlignability is None
+                                             or alignability <
+                                             self.lowestAlignability):
+                self.lowestAlignability = alignability
+            if hsp.getStrand() != HSPs[0].getStrand():
+                self.sameStrand = False
+            if hsp.getRefName() != HSPs[0].getRefName():
+                self.sameRef = False
+            self.refNames.add(hsp.getRefName())
+            refIntervals.append((summary.refBegin, summary.refEnd))
+        self.firstReadBegin = HSPs[0].getSummary().readBegin if n > 0 else 0
+        self.lastReadEnd = previous.readEnd if n > 0 else 0
+        self.maxReadGap = max([e - b for (b, e) in self.readGaps]) \
+            if len(self.readGaps) > 0 else None
+        self.maxRefGap = max([e - b for (b, e) in self.refGaps]) \
+            if len(self.refGaps) > 0 else None
+        self.refsOverlap = self.anyOverlap(refIntervals)
+
+    @classmethod
+    def anyOverlap(cls, intervals):
+        """
+        Tells whether any two of the (begin,end) intervals overlap, by
+        sweeping them in order of begin and keeping the largest end so far.
+        """
+        intervals = sorted(intervals)
+        maxEnd = None
+        for (begin, end) in intervals:
+            if maxEnd is not None and begin < maxEnd and begin < end:
+                return True
+            if maxEnd is None or end > maxEnd:
+                maxEnd = end
+        return False
+
+
 class SamAnnotation:
     """
     This class represents a set of HSPs (local alignments) for a single read.
@@ -40,7 +130,10 @@ class SamAnnotation:
         P=anno.unalignedProportion()
         identity=anno.lowestPercentIdentity()
         x=anno.getLowestAlignability()
-        SamRecord anno.getSamRecord()
+        seq=anno.getReadSeq() # the whole read sequence
+        SamRecord anno.getSamRecord() # raises unless the HSPs kept records
+        features=anno.getFeatures() # AnnotationFeatures, computed once
+        anno.setLowestAlignability(x) # after setting the HSPs' alignabilities
     Class Methods:
         none
     """
@@ -49,6 +142,24 @@ class SamAnnotation:
         self.HSPs = []
         for hsp in HSPs:
             self.HSPs.append(hsp)
+        self.features = None
+
+    def getFeatures(self):
+        """
+        Returns the AnnotationFeatures of this annotation, computing them on
+        first use.
+        """
+        if self.features is None:
+            self.features = AnnotationFeatures(self.HSPs)
+        return self.features
+
+    def setLowestAlignability(self, x):
+        """
+        Updates the cached lowest alignability after the HSPs' alignabilities
+        were set, keeping the other features.
+        """
+        if self.features is not None:
+            self.features.lowestAlignability = x
 
     def __del__(self):
         for hsp in self.HSPs:
@@ -58,30 +169,38 @@ class SamAnnotation:
         """
         This returns the SAM record for the first HSP (note that different HSPs
         will have different SAM records, but those records will share some info,
-        such as the read ID and read sequence).
+        such as the read ID and read sequence).  HSPs only keep their records
+        if made by a SamHspFactory with keepRecords=True; otherwise this
+        raises an exception (use getReadSeq() and getReadID() instead).
         """
         HSPs = self.HSPs
         if len(HSPs) == 0: raise Exception("No HSPs in Annotation")
         return HSPs[0].getRec()
 
+    def getReadSeq(self):
+        """
+        This returns the read sequence of the first HSP, which is what
+        getSamRecord().getSequence() used to return.
+        """
+        HSPs = self.HSPs
+        if len(HSPs) == 0: raise Exception("No HSPs in Annotation")
+        return HSPs[0].getReadSeq()
+
     def alignedProportion(self):
         """
         Returns the aligned proportion, accounting for all HSPs.
         """
-        L = self.getReadLength()
-        N = self.alignedLength()
-        return float(N) / float(L)
+        features = self.getFeatures()
+        if features.numHSPs == 0:
+            raise Exception("Don't know read length: no HSPs")
+        return float(features.alignedLength) / float(features.readLength)
 
     def alignedLength(self):
         """
         Returns the total aligned length, summed over all HSPs.
         (Prerequisite: HSPs are non-overlapping on the read)
         """
-        aligned = 0
-        HSPs = self.HSPs
-        for hsp in HSPs:
-            aligned += hsp.getReadInterval().getLength()
-        return aligned
+        return self.getFeatures().alignedLength
 
     def getReadID(self):
         """
@@ -96,26 +215,24 @@ class SamAnnotation:
         """
         Returns the lowest %identity across all the HSPs, for filtering purposes.
         """
-        return min([x.getPercentIdentity() for x in self.HSPs])
+        features = self.getFeatures()
+        if features.numHSPs == 0:
+            raise Exception("No HSPs in Annotation")
+        return features.lowestIdentity
 
     def getLowestAlignability(self):
         """
         Returns the lowest alignability across all the HSPs, for filtering.
+        HSPs with no alignability (e.g., not on a chromosome in the map) are
+        ignored; returns None if no HSP has one.
         """
-        return min([x.getAlignability() for x in self.HSPs])
+        return self.getFeatures().lowestAlignability
 
     def allSameStrand(self):
         """
         Tells whether all HSPs had the same strand.
         """
-        HSPs = self.HSPs
-        n = len(HSPs)
-        if n == 0:
-            return True
-        strand = HSPs[0].getStrand()
-        for i in range(1, n):
-            if HSPs[i].getStrand() != strand: return False
-        return True
+        return self.getFeatures().sameStrand
 
     def getReadLength(self):
         """
@@ -125,28 +242,22 @@ class SamAnnotation:
         n = len(HSPs)
         if n == 0:
             raise Exception("Don't know read length: no HSPs")
-        return HSPs[0].getRec().seqLength()
+        return HSPs[0].getReadLength()
 
     def getReadGaps(self, includeMargins=False):
         """
         Returns a vector of gaps *between* (not within!) HSPs.
         """
         L = self.getReadLength()
-        HSPs = self.HSPs
-        numHSPs = len(HSPs)
-        if numHSPs == 0:
-            return Interval(0, L)
+        features = self.getFeatures()
         intervals = []
         if includeMargins:
-            b = HSPs[0].getReadInterval().getBegin()
+            b = features.firstReadBegin
             if b > 0: intervals.append(Interval(0, b))
-        for i in range(numHSPs - 1):
-            b = HSPs[i].getReadInterval().getEnd()
-            e = HSPs[i + 1].getReadInterval().getBegin()
-            if b < e:
-                intervals.append(Interval(b, e))
+        for (b, e) in features.readGaps:
+            intervals.append(Interval(b, e))
         if includeMargins:
-            e = HSPs[numHSPs - 1].getReadInterval().getEnd()
+            e = features.lastReadEnd
             if e < L:
                 intervals.append(Interval(e, L))
         return intervals
@@ -156,46 +267,28 @@ class SamAnnotation:
         This is similar to getReadGaps(), except that the coordinates are
         on the reference instead of the read.
         """
-        HSPs = self.HSPs
-        numHSPs = len(HSPs)
-        if numHSPs == 0:
-            return []
-        gaps = []
-        for i in range(numHSPs - 1):
-            b = HSPs[i].getRefInterval().getEnd()
-            e = HSPs[i + 1].getRefInterval().getBegin()
-            if b < e:
-                gaps.append(Interval(b, e))
-        return gaps
+        return [Interval(b, e) for (b, e) in self.getFeatures().refGaps]
 
     def anyRefsOverlap(self):
         """
         Do any of the reference segments overlap?
         """
-        HSPs = self.HSPs
-        numHSPs = len(HSPs)
-        for i in range(numHSPs - 1):
-            for j in range(i + 1, numHSPs):
-                if HSPs[i].overlapsOnRef(HSPs[j]):
-                    return True
-        return False
+        return self.getFeatures().refsOverlap
 
     def getReadGapLengths(self, includeMargins=False):
         """
         Returns lengths of gaps between HSPs, measured on the read (not the
         reference).
         """
-        intervals = self.getReadGaps(includeMargins)
-        lengths = [x.getLength() for x in intervals]
-        return lengths
+        if includeMargins:
+            return [x.getLength() for x in self.getReadGaps(True)]
+        return [e - b for (b, e) in self.getFeatures().readGaps]
 
     def getRefGapLengths(self):
         """
         Similar to getReadGapLengths(), but measured on the reference.
         """
-        intervals = self.getRefGaps()
-        lengths = [x.getLength() for x in intervals]
-        return lengths
+        return [e - b for (b, e) in self.getFeatures().refGaps]
 
     def numDifferentRefs(self):
         """
@@ -209,10 +302,7 @@ class SamAnnotation:
         Returns the names of all reference sequences this read is mapped to in
         this annotation.
         """
-        names = set()
-        for hsp in self.HSPs:
-            set.add(hsp.getRefName())
-        return names
+        return set(self.getFeatures().refNames)
 
     def firstRef(self):
         """
@@ -228,15 +318,7 @@ class SamAnnotation:
         """
         Tells whether all HSPs in this annotation map to the same reference.
         """
-        HSPs = self.HSPs
-        n = len(HSPs)
-        if n == 0:
-            return True
-        ref = HSPs[0].getRefName()
-        for i in range(1, n):
-            if HSPs[i].getRefName() != ref:
-                return False
-        return True
+        return self.getFeatures().sameRef
 
     def numHSPs(self):
         return len(self.HSPs)
@@ -10,6 +10,7 @@ from builtins import (bytes, dict, int, list, object, range, str, ascii,
                       chr, hex, input, next, oct, open, pow, round, super, filter, map, zip)
 
 from CigarString import CigarString
+from CigarSummary import CigarSummary
 
 from Interval import Interval
 from Strand import Strand
@@ -23,25 +24,32 @@ class SamHSP:
     This class represents an HSP (High-scoring Segment Pair), which is a local
     alignment between a read and a reference sequence.  It encapsulates the
     coordinates on the read and reference, and information about the quality of
-    that local alignment.  It also has a link back to the SamRecord used to
-    make the HSP.
+    that local alignment.  To keep HSPs small, it does not keep the SamRecord
+    used to make it (unless asked to), only the read ID and a reference to the
+    read sequence, which is shared with the record and the other HSPs of the
+    read; qualities and tags are not kept alive.
 
     Attributes:
-        cigar : CigarString
+        summary : CigarSummary (coordinates, aligned length, indels)
+        cigar : CigarString (made on demand)
         refName : string
         strand : Strand
-        readInterval : Interval
-        refInterval : Interval
+        readID : string
+        readSeq : string (the whole read, not just the HSP)
+        mismatches : int (within the kept CIGAR ops; see MismatchCounter)
         score : float = #matches/(1+#mismatches+#indelbases)
         percentIdentity : float = #matches/(#matches+#mismatches+#indelbases)
         alignability : float (from ENCODE alignability map)
-        rec : the SamRecord this HSP came from
+        rec : the SamRecord this HSP came from, or None if not kept
     Instance Methods:
-        hsp=SamHSP(rec,cigar) # rec is a SamRecord
+        hsp=SamHSP(rec,cigar,keepRecord=False) # rec is a SamRecord
         cigar=hsp.getCigar() # returns CigarString object
+        summary=hsp.getSummary() # returns CigarSummary object
         refName=hsp.getRefName()
         Strand hsp.getStrand()
         seq=hsp.getSeq()
+        seq=hsp.getReadSeq() # the whole read
+        L=hsp.getReadLength() # length of the whole read
         boolean hsp.forwardStrand()
         boolean=hsp.overlapsOnRead(otherHSP)
         boolean=hsp.overlapsOnRef(otherHSP)
@@ -53,44 +61,67 @@ class SamHSP:
         hsp.setAlignability(x)
         x=hsp.getAlignability()
         str=hsp.toString()
-        rec=hsp.getRec() # returns the SamRecord this HSP came from
+        rec=hsp.getRec() # the SamRecord; raises unless it was kept
         ID=hsp.getReadID()
-    Private Methods:
-        self.computeIntervals()
     Class Methods:
-        none
+        hsp=SamHSP.fromSummary(rec,summary,keepRecord=False,mismatches=None)
     """
 
-    def __init__(self, rec, cigar):
+    __slots__ = ("summary", "cigar", "refName", "strand", "readID", "readSeq",
+                 "mismatches", "score", "percentIdentity", "alignability",
+                 "rec")
+
+    def __init__(self, rec, cigar, keepRecord=False):
+        """
+        Makes an HSP from a processed CigarString whose intervals were
+        computed (see SamHspFactory.processCigar()).
+        """
+        self.initialize(rec, CigarSummary.fromCigar(cigar), keepRecord)
         self.cigar = cigar
+
+    @classmethod
+    def fromSummary(cls, rec, summary, keepRecord=False, mismatches=None):
+        """
+        Makes an HSP from a CigarSummary (see SamHspFactory), without a
+        CigarString; getCigar() builds one only if it is asked for.  The
+        mismatch count is taken from rec.countMismatches() unless given.
+        """
+        hsp = cls.__new__(cls)
+        hsp.initialize(rec, summary, keepRecord, mismatches)
+        return hsp
+
+    def initialize(self, rec, summary, keepRecord, mismatches=None):
+        self.summary = summary
+        self.cigar = None
         self.refName = rec.getRefName()
-        self.rec = rec
-        self.computeIntervals()
+        self.strand = Strand.REVERSE if rec.flag_revComp() else Strand.FORWARD
+        self.readID = rec.getID()
+        self.readSeq = rec.getSequence()
+        self.mismatches = rec.countMismatches() if mismatches is None \
+            else mismatches
         self.score = None
         self.percentIdentity = None
-        self.strand = Strand.REVERSE if rec.flag_revComp() else Strand.FORWARD
         self.alignability = None
+        self.rec = rec if keepRecord else None
+
+    def getSummary(self):
+        return self.summary
 
-    def containsOnTargetIndels(self, cut_site):
+    def containsOnTargetIndels(self, cutSites):
         """
         This method returns true if HSP contains indel 15+- from the cut site.
+        cutSites is a CutSiteIndex.
         """
-        begin_pos = int(self.refInterval.getBegin())
-        for op in self.cigar.ops:
-            if op.getOp() in ("I", "D"):
-                op_interval = Interval(begin_pos, begin_pos + op.getLength())
-                for site in cut_site:
-                    cut_range = Interval(int(site) - 15, int(site + 15))
-                    if cut_range.overlaps(op_interval):
-                        return True
-            begin_pos = begin_pos + op.getLength()
+        for (op, pos, length) in self.summary.indels:
+            if cutSites.overlapsWindow(self.refName, pos, pos + length):
+                return True
         return False
 
     def containsIndels(self):
-        return not self.cigar.completeMatch()
+        return self.summary.indelBases > 0
 
     def getReadID(self):
-        return self.rec.getID()
+        return self.readID
 
     def setAlignability(self, x):
         self.alignability = x
@@ -99,13 +130,24 @@ class SamHSP:
         return self.alignability
 
     def getSeq(self):
-        return self.rec.getSequence()[self.readInterval.getBegin():
-                                      self.readInterval.getEnd()]
+        return self.readSeq[self.summary.readBegin:self.summary.readEnd]
+
+    def getReadSeq(self):
+        return self.readSeq
+
+    def getReadLength(self):
+        return len(self.readSeq)
 
     def getRec(self):
         """
-        This returns the original SamRecord used to make this HSP
+        This returns the original SamRecord used to make this HSP.  The record
+        is only kept if asked for (keepRecord=True); otherwise this raises an
+        exception.  The read ID and sequence are always available from
+        getReadID() and getReadSeq().
         """
+        if self.rec is None:
+            raise Exception("SamRecord of HSP was not kept; make HSPs with "
+                            "SamHspFactory(keepRecords=True)")
         return self.rec
 
     def getStrand(self):
@@ -119,9 +161,9 @@ class SamHSP:
         This generates a printable string for debugging.
         """
         return self.refName + "|" + Strand.toString(self.strand) + "|" + \
-               self.refInterval.toString() + "|" + \
-               self.readInterval.toString() + "|" + \
-               self.cigar.toString() + "|" + \
+               self.getRefInterval().toString() + "|" + \
+               self.getReadInterval().toString() + "|" + \
+               self.getCigar().toString() + "|" + \
                str(round(self.getPercentIdentity(), 3)) + "|" + \
                self.getSeq()
 
@@ -130,9 +172,10 @@ class SamHSP:
         Method returns the percent of matched base pairs out of all base pairs.
         """
         if self.percentIdentity is None:
-            mismatches = self.rec.countMismatches()
-            matches = self.cigar.totalAlignmentLength() - mismatches
-            indelBases = self.cigar.countIndelBases()
+            summary = self.summary
+            mismatches = self.mismatches
+            matches = summary.alignedLength - mismatches
+            indelBases = summary.indelBases
             numerator = matches
             denominator = matches + mismatches + indelBases
             self.percentIdentity = float(numerator) / float(denominator)
@@ -147,9 +190,10 @@ class SamHSP:
         it is #matches / (1+#mismatches+#indelbases).  This score is used
         in the clustering step to eliminate overlapping HSPs of lower quality.
         """
-        mismatches = self.rec.countMismatches()
-        matches = self.cigar.totalAlignmentLength() - mismatches
-        indelBases = self.cigar.countIndelBases()
+        summary = self.summary
+        mismatches = self.mismatches
+        matches = summary.alignedLength - mismatches
+        indelBases = summary.indelBases
         numerator = matches
         denominator = 1 + mismatches + indelBases
         self.score = round(float(numerator) / float(denominator), 2)
@@ -158,40 +202,30 @@ class SamHSP:
         """
         Do these HSPs overlap on the read?
         """
-        return (self.readInterval.begin + 10) < other.readInterval.end and (
-                    other.readInterval.begin + 10) < self.readInterval.end
+        return (self.summary.readBegin + 10) < other.summary.readEnd and (
+                other.summary.readBegin + 10) < self.summary.readEnd
 
     def overlapsOnRef(self, other):
         """
         Do these HSPs overlap on the reference sequence?
         """
-        return self.refInterval.overlaps(other.refInterval)
+        return self.summary.refBegin < other.summary.refEnd and \
+            other.summary.refBegin < self.summary.refEnd
 
     def getCigar(self):
         """
         This returns the *processed* CIGAR string, which does not include the
         soft-mask elements
         """
+        if self.cigar is None:
+            self.cigar = CigarString(self.summary.cigarString)
         return self.cigar
 
     def getRefName(self):
         return self.refName
 
     def getReadInterval(self):
-        return self.readInterval
+        return Interval(self.summary.readBegin, self.summary.readEnd)
 
     def getRefInterval(self):
-        return self.refInterval
-
-    def computeIntervals(self):
-        """
-        Begin and end of an HSP.
-        """
-        cigar = self.cigar
-        n = cigar.length()
-        firstOp = cigar[0]
-        lastOp = cigar[n - 1]
-        self.readInterval = Interval(firstOp.getQueryInterval().getBegin(),
-                                     lastOp.getQueryInterval().getEnd())
-        self.refInterval = Interval(firstOp.getRefInterval().getBegin(),
-                                    lastOp.getRefInterval().getEnd())
+        return Interval(self.summary.refBegin, self.summary.refEnd)
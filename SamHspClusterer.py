@@ -7,20 +7,32 @@
 from __future__ import (absolute_import, division, print_function,
                         unicode_literals, generators, nested_scopes, with_statement)
 
+from bisect import bisect_right
+
 
 class SamHspClusterer:
     """
     This class eliminates overlaps in HSPs by choosing a high-scoring subset
-    with no overlaps.
+    with no overlaps.  The default (greedy) method accepts HSPs in order of
+    decreasing score; the optimal method finds the subset with the largest
+    total score by weighted interval scheduling.
 
     Attributes:
         none
     Instance Methods:
         clusterer=SamHspClusterer()
     Cla Methods:
-        clustered=SamHspClusterer.cluster(HSPs)
+        clustered=SamHspClusterer.cluster(HSPs,optimal=False)
+        clustered=SamHspClusterer.clusterGreedy(HSPs)
+        clustered=SamHspClusterer.clusterOptimal(HSPs)
+        indices=SamHspClusterer.chooseGreedy(begins,ends,scores)
+        indices=SamHspClusterer.chooseOptimal(begins,ends,scores)
     """
 
+    # HSPs may overlap by up to this many bases on the read (see
+    # SamHSP.overlapsOnRead())
+    TOLERANCE = 10
+
     def __init__(self):
         pass
 
@@ -36,17 +48,111 @@ class SamHspClusterer:
         return False
 
     @classmethod
-    def cluster(cls, raw):
+    def cluster(cls, raw, optimal=False):
+        """
+        This method picks a nonoverlapping set of high-scoring HSPs, using
+        either the greedy or the optimal method.
+        """
+        if optimal:
+            return cls.clusterOptimal(raw)
+        return cls.clusterGreedy(raw)
+
+    @classmethod
+    def clusterGreedy(cls, raw):
         """
         This method picks a nonoverlapping set of the highest-scoring HSPs.
         """
-        nonoverlapping = []
+        return cls.select(raw, cls.chooseGreedy)
+
+    @classmethod
+    def clusterOptimal(cls, raw):
+        """
+        This method picks the nonoverlapping set of HSPs with the largest
+        total score.
+        """
+        return cls.select(raw, cls.chooseOptimal)
+
+    @classmethod
+    def select(cls, raw, choose):
+        """
+        Scores the HSPs, lets choose() pick a subset from their read
+        coordinates and scores, and returns that subset in read order.
+        """
         HSPs = [x for x in raw]
         for hsp in HSPs:
             hsp.computeScore()
-        HSPs.sort(key=lambda hsp: -hsp.getScore())
-        for hsp in HSPs:
-            if not cls.overlap(hsp, nonoverlapping):
-                nonoverlapping.append(hsp)
+        begins = [hsp.getReadInterval().getBegin() for hsp in HSPs]
+        ends = [hsp.getReadInterval().getEnd() for hsp in HSPs]
+        scores = [hsp.getScore() for hsp in HSPs]
+        nonoverlapping = [HSPs[i] for i in choose(begins, ends, scores)]
         nonoverlapping.sort(key=lambda hsp: hsp.getReadInterval().getBegin())
         return nonoverlapping
+
+    @classmethod
+    def chooseGreedy(cls, begins, ends, scores):
+        """
+        Given the read intervals and scores of some HSPs, returns the indices
+        of those accepted in order of decreasing score, skipping any that
+        overlap (as in SamHSP.overlapsOnRead()) one accepted earlier.
+        """
+        T = cls.TOLERANCE
+        order = sorted(range(len(scores)), key=lambda i: -scores[i])
+        chosen = []
+        for i in order:
+            (begin, end) = (begins[i], ends[i])
+            for j in chosen:
+                if begin + T < ends[j] and begins[j] + T < end:
+                    break
+            else:
+                chosen.append(i)
+        return chosen
+
+    @classmethod
+    def chooseOptimal(cls, begins, ends, scores):
+        """
+        Given the read intervals and scores of some HSPs, returns the indices
+        of the nonoverlapping subset with the largest total score.  Two HSPs
+        overlap (as in SamHSP.overlapsOnRead()) exactly when each begins
+        before the other's end minus the tolerance.  HSPs longer than the
+        tolerance are therefore chosen by weighted interval scheduling on
+        (begin,end-TOLERANCE): best[k] is the best total using the first k
+        in order of end, and the HSPs compatible with one are a prefix,
+        found by binary search.  HSPs no longer than the tolerance never
+        overlap each other, and each overlaps only longer HSPs that contain
+        it; it is kept unless a chosen HSP contains it, so each longer HSP
+        is scheduled with the scores of the short HSPs it contains
+        subtracted from its own.
+        """
+        T = cls.TOLERANCE
+        n = len(scores)
+        short = [i for i in range(n) if ends[i] - T <= begins[i]]
+        order = sorted([i for i in range(n) if ends[i] - T > begins[i]],
+                       key=lambda i: ends[i])
+        limits = [ends[i] - T for i in order]
+        contained = [[j for j in short
+                      if begins[i] + T < ends[j] and begins[j] + T < ends[i]]
+                     for i in order]
+        m = len(order)
+        best = [0.0] * (m + 1)
+        previous = [None] * m
+        for k in range(m):
+            i = order[k]
+            p = bisect_right(limits, begins[i], 0, k)
+            score = best[p] + scores[i] - sum(scores[j] for j in contained[k])
+            if score >= best[k]:
+                best[k + 1] = score
+                previous[k] = p
+            else:
+                best[k + 1] = best[k]
+        chosen = []
+        excluded = set()
+        k = m
+        while k > 0:
+            if previous[k - 1] is None:
+                k -= 1
+            else:
+                chosen.append(order[k - 1])
+                excluded.update(contained[k - 1])
+                k = previous[k - 1]
+        chosen.extend(j for j in short if j not in excluded)
+        return chosen
@@ -12,40 +12,88 @@ from builtins import (bytes, dict, int, list, object, range, str, ascii,
 from SamHSP import SamHSP
 from SamRecord import SamRecord
 from CigarString import CigarString
+from CigarSummary import CigarSummary
+from MismatchCounter import MismatchCounter
 
 
 class SamHspFactory:
     """
-    This class manufactures HSPs from SAM records
+    This class manufactures HSPs from SAM records.  By default (fused=True)
+    each CIGAR string is parsed once by CigarSummary.scan(), which filters it
+    against keepOps and computes the HSP's intervals, aligned length and
+    indels in the same pass; with fused=False the CIGAR is processed op by
+    op through CigarString, as before.  In the fused path, mismatches are
+    counted from each record's MD tag within the HSP's kept ops, by
+    MismatchCounter.  HSPs only keep their SamRecords if keepRecords=True.
 
     Attributes:
         keepOps : set of string
+        fused : boolean
+        keepRecords : boolean
     Instance Methods:
-        factory=SamHspFactory()
+        factory=SamHspFactory(fused=True,keepRecords=False)
         HSPs=factory.makeHSPs(SamRecords)
+        summary=factory.summarizeCigar(SamRecord) # returns CigarSummary
+        n=factory.countMismatches(SamRecord,summary)
     Private Methods:
         cigar=self.processCigar(cigar)
     Class Methods:
-        none
+        text=SamHspFactory.cigarText(SamRecord)
     """
 
-    def __init__(self):
+    def __init__(self, fused=True, keepRecords=False):
         self.keepOps = set(["M", "I", "D", "=", "X"])
+        self.fused = fused
+        self.keepRecords = keepRecords
 
     def makeHSPs(self, reads):
         """
         Given a set of SamRecord objects, this function computes intervals of
         local alignments and manufactures a set of HSPs.
         """
+        if self.fused:
+            HSPs = []
+            for read in reads:
+                summary = self.summarizeCigar(read)
+                HSPs.append(SamHSP.fromSummary(
+                    read, summary, self.keepRecords,
+                    self.countMismatches(read, summary)))
+            return HSPs
         HSPs = []
         for read in reads:
             cigar = read.getCigar()
             cigar.computeIntervals(read.getRefPos())
             cigar = self.processCigar(cigar)
-            hsp = SamHSP(read, cigar)
-            HSPs.append(hsp)
+            HSPs.append(SamHSP(read, cigar, self.keepRecords))
         return HSPs
 
+    @classmethod
+    def cigarText(cls, read):
+        """
+        Returns the CIGAR of a record as text, without parsing it if the
+        record keeps the text (BamRecord does).
+        """
+        if hasattr(read, "getCigarString"):
+            return read.getCigarString()
+        return read.getCigar().toString()
+
+    def summarizeCigar(self, read):
+        """
+        Returns the CigarSummary of the HSP that makeHSPs() would make from
+        this record, without making the HSP.
+        """
+        return CigarSummary.scan(self.cigarText(read), read.getRefPos(),
+                                 self.keepOps)
+
+    def countMismatches(self, read, summary):
+        """
+        Returns the number of mismatches in the HSP that makeHSPs() would make
+        from this record, given its CigarSummary.
+        """
+        if self.fused:
+            return MismatchCounter.count(read, summary, self.cigarText(read))
+        return read.countMismatches()
+
     def processCigar(self, cigar):
         """
         This processes a CIGAR string by removing soft-mask and other unwanted
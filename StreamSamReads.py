@@ -9,35 +9,74 @@ from __future__ import (absolute_import, division, print_function,
 
 import logging
 
-from SamReader import SamReader
+from LazySamReader import LazySamReader
 from SamReadGroup import SamReadGroup
 
 
 class StreamSamReads:
     """
-    This is an adapter class that reads SamRecords from a SamReader and groups
-    them into SamPairedRead objects.  It implements a buffer, to avoid losing
-    reads when reading too far into the SAM file.
+    This is an adapter class that reads SamRecords from a LazySamReader and
+    groups them into SamPairedRead objects.  It implements a buffer, to avoid
+    losing reads when reading too far into the SAM file.  Files ending in
+    .bam or .cram are read with a BamReader instead, which decompresses BGZF
+    blocks on a pool of threads; CRAM files also need the reference FASTA.
+    dedup drops records flagged as PCR duplicates; a Deduplicator, if given,
+    drops duplicate fragments by their coordinates instead, with no flags
+    needed.
 
     Attributes:
-        reader : SamReader
+        reader : LazySamReader or BamReader
         dedup : boolean
+        deduplicator : Deduplicator, or None
         bufferedRec : SamRecord
         bufferedPair : SamPairedRead
     Instance Methods:
-        stream=SamPairedReadStream(filename,dedup=True)
+        stream=SamPairedReadStream(filename,dedup=True,threads=1,reference=None,
+                                   deduplicator=None)
         pair=stream.nextPair() # returns SamPairedRead
         readGroup=stream.nextGroup() # returns array of SamPairedRead
+        groups=stream.nextBatch(n) # returns up to n read groups
+        for group in stream: # every non-empty read group
+        for groups in stream.batches(n): # lists of up to n groups
+        state=stream.getState() # where the next read group starts
+        stream.setState(state) # continues from there, in a new stream
+    Private Methods:
+        readGroup=self.readGroup() # the next group, before deduplication
     Class Methods:
-        none
+        reader=StreamSamReads.openReader(filename,threads=1,reference=None)
     """
 
-    def __init__(self, filename, dedup=True):
-        self.reader = SamReader(filename)
+    def __init__(self, filename, dedup=True, threads=1, reference=None,
+                 deduplicator=None):
+        self.reader = self.openReader(filename, threads, reference)
         self.dedup = dedup
+        self.deduplicator = deduplicator
         self.buffer_read = None
 
+    @classmethod
+    def openReader(cls, filename, threads=1, reference=None):
+        """
+        Returns a LazySamReader for text SAM, or a BamReader for BAM/CRAM.
+        """
+        lower = filename.lower()
+        if lower.endswith(".bam") or lower.endswith(".cram"):
+            from BamReader import BamReader
+            return BamReader(filename, threads=threads, reference=reference)
+        return LazySamReader(filename)
+
     def nextGroup(self):
+        """
+        Returns the next read group that is not a duplicate fragment; the
+        group is empty at the end of the file.
+        """
+        while True:
+            group = self.readGroup()
+            if len(group) == 0 or self.deduplicator is None or \
+                    not self.deduplicator.isDuplicate(group):
+                return group
+            logging.debug("Fragment is a duplicate")
+
+    def readGroup(self):
         group = SamReadGroup()
         readID = None
         while True:
@@ -75,3 +114,47 @@ class StreamSamReads:
                 break
 
         return group
+
+    def getState(self):
+        """
+        Returns the position of the next read group, for resuming a run:
+        the input offset (a byte offset, or a BGZF virtual offset) after the
+        last record read, and the record read past the end of the last
+        group, if any.  A Deduplicator has its own state.
+        """
+        return (self.reader.tell(), self.buffer_read)
+
+    def setState(self, state):
+        (offset, self.buffer_read) = state
+        self.reader.seek(offset)
+
+    def nextBatch(self, n):
+        """
+        Returns a list of up to n non-empty read groups; the list is empty at
+        the end of the file.
+        """
+        groups = []
+        while len(groups) < n:
+            group = self.nextGroup()
+            if len(group) == 0:
+                break
+            groups.append(group)
+        return groups
+
+    def __iter__(self):
+        while True:
+            group = self.nextGroup()
+            if len(group) == 0:
+                return
+            yield group
+
+    def batches(self, n):
+        """
+        Yields lists of up to n non-empty read groups until the end of the
+        file.
+        """
+        while True:
+            groups = self.nextBatch(n)
+            if len(groups) == 0:
+                return
+            yield groups
@@ -0,0 +1,340 @@
+# =========================================================================
+# This is OPEN SOURCE SOFTWARE governed by the Gnu General Public
+# License (GPL) version 3, as described at www.opensource.org.
+# Copyright (C)2016 William H. Majoros (martiandna@gmail.com).
+# Author: Siyan Liu
+# =========================================================================
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals, generators, nested_scopes, with_statement)
+
+import os
+import re
+
+import numpy as np
+
+# Maps ASCII bytes to 2-bit base codes (A=0, C=1, G=2, T=3); anything else,
+# including N, maps to 4
+BASE_CODES = np.full(256, 4, dtype=np.uint8)
+for (i, base) in enumerate("ACGT"):
+    BASE_CODES[ord(base)] = i
+    BASE_CODES[ord(base.lower())] = i
+
+# Sets of base codes matched by each IUPAC code, as 4-bit masks
+IUPAC = {"A": 1, "C": 2, "G": 4, "T": 8, "R": 5, "Y": 10, "S": 6, "W": 9,
+         "K": 12, "M": 3, "B": 14, "D": 13, "H": 11, "V": 7, "N": 15}
+COMPLEMENT = {"A": "T", "C": "G", "G": "C", "T": "A", "R": "Y", "Y": "R",
+              "S": "S", "W": "W", "K": "M", "M": "K", "B": "V", "D": "H",
+              "H": "D", "V": "B", "N": "N"}
+
+
+def encode(seq):
+    """
+    Returns the 2-bit codes of a sequence (str or bytes) as a uint8 array.
+    """
+    if not isinstance(seq, (bytes, bytearray, memoryview)):
+        seq = seq.encode("ascii")
+    return BASE_CODES[np.frombuffer(seq, dtype=np.uint8)]
+
+
+def reverseComplement(seq):
+    return "".join([COMPLEMENT[x] for x in reversed(seq.upper())])
+
+
+def pack(codes, positions, length):
+    """
+    Returns the 2-bit packed k-mers (as uint64) of the given length starting
+    at each of the positions.
+    """
+    packed = np.zeros(len(positions), dtype=np.uint64)
+    for j in range(length):
+        packed = (packed << np.uint64(2)) | \
+            codes[positions + j].astype(np.uint64)
+    return packed
+
+
+def matchesPattern(codes, positions, pattern):
+    """
+    Returns a boolean array telling whether the IUPAC pattern occurs at each
+    of the positions.
+    """
+    ok = np.ones(len(positions), dtype=bool)
+    for (j, symbol) in enumerate(pattern):
+        mask = IUPAC[symbol]
+        if mask == 15:
+            ok &= codes[positions + j] < 4
+        else:
+            ok &= ((np.uint8(mask) >> codes[positions + j]) & 1) == 1
+    return ok
+
+
+class Guide:
+    """
+    A guide (protospacer) sequence with an identifier.
+
+    Attributes:
+        ID : string
+        seq : string
+    Class Methods:
+        guides=Guide.load(filename) # lines of "ID SEQ", or just "SEQ"
+    """
+
+    def __init__(self, ID, seq):
+        self.ID = ID
+        self.seq = seq.upper()
+
+    @classmethod
+    def load(cls, filename):
+        guides = []
+        with open(filename, "rt") as IN:
+            for line in IN:
+                fields = line.split()
+                if len(fields) == 0 or fields[0].startswith("#"):
+                    continue
+                if len(fields) == 1:
+                    fields = ["guide" + str(len(guides) + 1), fields[0]]
+                guides.append(Guide(fields[0], fields[1]))
+        return guides
+
+
+class TargetSite:
+    """
+    One occurrence of a guide in the genome.  pos is the 0-based start of the
+    protospacer on the forward strand; cutSite is the 0-based position of the
+    first base after the cut, on the forward strand.
+
+    Attributes:
+        guideID : string
+        chrom : string
+        pos : int
+        strand : string ("+" or "-")
+        cutSite : int
+        mismatches : int
+    Instance Methods:
+        line=site.toString() # tab-separated, as in the site tables
+    Class Methods:
+        sites=TargetSite.load(filename) # reads a site table
+    """
+
+    HEADER = "guide\tchrom\tpos\tstrand\tcut_site\tmismatches"
+
+    def __init__(self, guideID, chrom, pos, strand, cutSite, mismatches=0):
+        self.guideID = guideID
+        self.chrom = chrom
+        self.pos = pos
+        self.strand = strand
+        self.cutSite = cutSite
+        self.mismatches = mismatches
+
+    def toString(self):
+        return "\t".join([self.guideID, self.chrom, str(self.pos),
+                          self.strand, str(self.cutSite),
+                          str(self.mismatches)])
+
+    @classmethod
+    def load(cls, filename):
+        sites = []
+        with open(filename, "rt") as IN:
+            for line in IN:
+                fields = line.rstrip("\n").split("\t")
+                if len(fields) < 5 or fields[0] == "guide":
+                    continue
+                mismatches = int(fields[5]) if len(fields) > 5 else 0
+                sites.append(TargetSite(fields[0], fields[1], int(fields[2]),
+                                        fields[3], int(fields[4]),
+                                        mismatches))
+        return sites
+
+
+class TargetSiteFinder:
+    """
+    This class finds every exact occurrence of many guides, on both strands,
+    in one pass over each chromosome.  Positions are first filtered by the
+    PAM (on each strand), then the protospacer at each surviving position is
+    packed into a 64-bit integer and looked up among the packed guides by
+    binary search, so the cost does not grow with the number of guides.
+
+    Attributes:
+        guides : array of Guide
+        pam : string (IUPAC, e.g. "NGG"; "" for no PAM)
+        cutOffset : int, position of the cut relative to the 3' end of the
+                    protospacer (-3 for Cas9)
+    Instance Methods:
+        finder=TargetSiteFinder(guides,pam="NGG",cutOffset=-3)
+        sites=finder.search(chrom,seq) # returns array of TargetSite
+        sites=finder.searchGenome(genome,chrom) # genome is an IndexedFasta
+    Class Methods:
+        tableFile=TargetSiteFinder.writeConfig(configFile,sites)
+    """
+
+    CHUNK = 4000000
+
+    def __init__(self, guides, pam="NGG", cutOffset=-3):
+        self.guides = guides
+        self.pam = pam.upper()
+        self.cutOffset = cutOffset
+        byLength = {}
+        for (index, guide) in enumerate(guides):
+            if len(guide.seq) > 32:
+                raise Exception("Guide " + guide.ID + " is longer than 32 bp")
+            byLength.setdefault(len(guide.seq), []).append(index)
+        self.tables = {}
+        for (k, indices) in byLength.items():
+            for strand in ("+", "-"):
+                seqs = [guides[i].seq if strand == "+"
+                        else reverseComplement(guides[i].seq) for i in indices]
+                codes = [encode(x) for x in seqs]
+                valid = [(i, c) for (i, c) in zip(indices, codes)
+                         if c.max() < 4]
+                keys = np.array([pack(c, np.zeros(1, np.int64), k)[0]
+                                 for (i, c) in valid], dtype=np.uint64)
+                order = np.argsort(keys, kind="stable")
+                self.tables[(k, strand)] = (
+                    keys[order],
+                    np.array([i for (i, c) in valid], dtype=np.int64)[order])
+
+    def candidates(self, window, k, strand, count):
+        """
+        Returns (protospacers,packed) for the first count positions of a
+        window of codes: protospacers holds the window-relative start of
+        every length-k window next to a PAM (on the given strand) and free
+        of ambiguous bases, and packed holds those windows as 2-bit k-mers.
+        """
+        pamLength = len(self.pam)
+        span = k + pamLength
+        starts = np.arange(0, min(count, len(window) - span + 1),
+                           dtype=np.int64)
+        if strand == "+":
+            ok = matchesPattern(window, starts + k, self.pam)
+            protospacers = starts[ok]
+        else:
+            ok = matchesPattern(window, starts, reverseComplement(self.pam))
+            protospacers = starts[ok] + pamLength
+        protospacers = protospacers[self.noAmbiguity(window, protospacers, k)]
+        return (protospacers, pack(window, protospacers, k))
+
+    def search(self, chrom, seq):
+        """
+        Returns all occurrences of the guides (with PAM) in seq.
+        """
+        codes = encode(seq)
+        return self.searchCodes(chrom, len(codes), lambda b, e: codes[b:e])
+
+    def searchGenome(self, genome, chrom):
+        """
+        Returns all occurrences of the guides in chrom of an IndexedFasta,
+        reading it one chunk at a time.
+        """
+        return self.searchCodes(chrom, genome.getLength(chrom),
+                                lambda b, e: genome.getCodes(chrom, b, e))
+
+    def searchCodes(self, chrom, length, getCodes):
+        """
+        Searches a sequence of the given length in chunks of CHUNK positions,
+        calling getCodes(begin,end) for the codes of each chunk (plus enough
+        overlap for the longest guide and PAM).
+        """
+        overlap = max([k for (k, strand) in self.tables.keys()] + [0]) + \
+            len(self.pam) - 1
+        sites = []
+        for begin in range(0, length, self.CHUNK):
+            window = getCodes(begin, min(length, begin + self.CHUNK + overlap))
+            for (k, strand) in sorted(self.tables.keys()):
+                (protospacers, packed) = self.candidates(window, k, strand,
+                                                         self.CHUNK)
+                sites.extend(self.match(chrom, begin, protospacers, packed,
+                                        k, strand))
+        sites.sort(key=lambda site: (site.pos, site.guideID, site.strand))
+        return sites
+
+    def match(self, chrom, begin, protospacers, packed, k, strand):
+        """
+        Returns the sites whose packed protospacers equal a guide.
+        """
+        (keys, guideIndices) = self.tables[(k, strand)]
+        found = np.searchsorted(keys, packed, side="left")
+        hit = found < len(keys)
+        hit[hit] = keys[found[hit]] == packed[hit]
+        sites = []
+        for (p, f) in zip(protospacers[hit].tolist(), found[hit].tolist()):
+            for g in self.guidesAt(keys, guideIndices, f):
+                sites.append(self.makeSite(g, chrom, begin + p, k, strand))
+        return sites
+
+    def guidesAt(self, keys, guideIndices, f):
+        """
+        Returns the guides whose packed key equals keys[f] (there can be more
+        than one if guides are duplicated).
+        """
+        key = keys[f]
+        result = []
+        while f < len(keys) and keys[f] == key:
+            result.append(self.guides[guideIndices[f]])
+            f += 1
+        return result
+
+    def noAmbiguity(self, codes, positions, length):
+        """
+        Tells which of the windows [pos,pos+length) contain only A/C/G/T.
+        """
+        ambiguous = np.concatenate(([0], np.cumsum(codes >= 4)))
+        return ambiguous[positions + length] == ambiguous[positions]
+
+    def makeSite(self, guide, chrom, pos, k, strand, mismatches=0):
+        if strand == "+":
+            cutSite = pos + k + self.cutOffset
+        else:
+            cutSite = pos - self.cutOffset
+        return TargetSite(guide.ID, chrom, pos, strand, cutSite, mismatches)
+
+    @classmethod
+    def writeConfig(cls, configFile, sites):
+        """
+        Writes the cut sites into a TRACER config file.  If all sites are on
+        one chromosome, they are written as TARGET_CHROM, FIRST_CUT_SITE and
+        SECOND_CUT_SITE (the first two sites) and CUT_SITES (all of them),
+        and any TARGET_SITES line is dropped; otherwise the sites are written to a site table next to the config
+        file (CONFIG.sites.txt, for CONFIG.config), which TARGET_SITES is
+        set to.  Other lines, including comments, are kept.  Returns the
+        name of the site table, or None.
+        """
+        if len(sites) == 0:
+            raise Exception("No cut sites to write into " + configFile)
+        chroms = set([site.chrom for site in sites])
+        tableFile = None
+        removed = set()
+        if len(chroms) == 1:
+            cutSites = sorted(set([site.cutSite for site in sites]))
+            values = {"TARGET_CHROM": chroms.pop(),
+                      "FIRST_CUT_SITE": str(cutSites[0]),
+                      "CUT_SITES": ",".join([str(x) for x in cutSites])}
+            if len(cutSites) > 1:
+                values["SECOND_CUT_SITE"] = str(cutSites[1])
+            else:
+                removed.add("SECOND_CUT_SITE")
+            removed.add("TARGET_SITES")
+        else:
+            tableFile = os.path.abspath(
+                os.path.splitext(configFile)[0] + ".sites.txt")
+            with open(tableFile, "wt") as OUT:
+                OUT.write(TargetSite.HEADER + "\n")
+                for site in sorted(sites, key=lambda x: (x.chrom, x.cutSite)):
+                    OUT.write(site.toString() + "\n")
+            values = {"TARGET_SITES": tableFile}
+        with open(configFile, "rt") as IN:
+            lines = IN.readlines()
+        written = set()
+        keyPattern = re.compile(r"^\s*([A-Za-z_0-9]+)\s*=")
+        for (i, line) in enumerate(lines):
+            match = keyPattern.match(line)
+            if match and match.group(1) in values:
+                key = match.group(1)
+                lines[i] = key + " = " + values[key] + "\n"
+                written.add(key)
+            elif match and match.group(1) in removed:
+                lines[i] = None
+        for key in sorted(values.keys()):
+            if key not in written:
+                lines.append(key + " = " + values[key] + "\n")
+        with open(configFile, "wt") as OUT:
+            OUT.write("".join([x for x in lines if x is not None]))
+        return tableFile
@@ -7,10 +7,18 @@
 from __future__ import (absolute_import, division, print_function,
                         unicode_literals, generators, nested_scopes, with_statement)
 
+import numpy as np
+
 from Rex import Rex
 rex = Rex()
 from ConfigFile import ConfigFile
 from Strand import Strand
+from SamHspFactory import SamHspFactory
+from SamHspClusterer import SamHspClusterer
+from SamAnnotation import SamAnnotation
+from HspBatch import HspBatch
+from Metrics import Metrics, clock
+from CutSiteIndex import CutSiteIndex
 
 
 class Tracer:
@@ -20,46 +28,188 @@ class Tracer:
 
     Attributes:
         readsBinned : int
+        targetChrom : string
+        cutSites : array of int (CUT_SITES, or FIRST_CUT_SITE and
+                   SECOND_CUT_SITE)
+        cutSiteIndex : CutSiteIndex of the cut sites of TARGET_CHROM, or of
+                       all sites in the TARGET_SITES table if given
+        minIdentity, maxRefGap, maxReadGap, minAlignability,
+        maxAnchorDistance, minAlignedProportion : thresholds from the config
+            file (None if absent, which disables that filter)
+        optimal : boolean (CLUSTERING = optimal, rather than greedy)
+        metrics : Metrics, stage timers and filter rejection counts
+        dedup : boolean (DEDUPLICATE = True: drop reads flagged as duplicates)
     Instance Methods:
         tracer=Tracer(OUTPUT_DIR)
         tracer.bin(Annotation,FILE)
+        tracer.binRead(readID,readSeq,FILE)
         tracer.dump(Annotation,FILE)
+        tracer.loadAlignability()
+        tracer.reopenAlignability() # in a child process, after fork()
+        dedup=tracer.makeDeduplicator() # None unless DEDUPLICATE=coordinates
+        regions=tracer.getTargetWindows() # array of (chrom,begin,end)
         tracer.getAlignabilities(anno)
+        x=tracer.lookupAlignability(chrom,begin,end)
+        anno=tracer.annotate(readGroup) # returns None if no HSPs survive
+        filterName=tracer.filter(anno) # returns None if anno passes
+        binName=tracer.classify(anno)
+        targetID=tracer.assignTarget(anno) # None if not near a target
+        (targetID,outcome)=tracer.describeOutcome(binName,anno)
+        distance=tracer.nearestCutSiteDistance(chrom,pos)
+        (binName,anno)=tracer.processGroup(readGroup)
+        results=tracer.processBatch(readGroups) # array of (binName,anno)
     Class Methods:
         none
     Private methods:
+        value=self.getSetting(key,type)
     """
 
+    BINS = ("deletion", "indel", "intact", "other")
+
     def __init__(self, configFile):
         self.config = ConfigFile(configFile)
         self.readsBinned = 0
+        self.metrics = Metrics()
         self.CHROMS = set()
+        self.bigwig = None
+        self.alignability = None
+        self.factory = SamHspFactory()
+        self.targetChrom = self.config.lookup("TARGET_CHROM")
+        cutSites = self.config.lookup("CUT_SITES")
+        if cutSites is not None:
+            self.cutSites = [int(x) for x in cutSites.split(",")]
+        else:
+            self.cutSites = [x for x in (self.getSetting("FIRST_CUT_SITE", int),
+                                         self.getSetting("SECOND_CUT_SITE", int))
+                             if x is not None]
+        targetSites = self.config.lookup("TARGET_SITES")
+        if targetSites is not None:
+            self.cutSiteIndex = CutSiteIndex.fromTable(targetSites)
+        else:
+            self.cutSiteIndex = CutSiteIndex(
+                [(self.targetChrom, site, str(self.targetChrom) + ":" + str(site))
+                 for site in self.cutSites])
+        self.dedup = self.getSetting("DEDUPLICATE", str) == "True"
+        self.minIdentity = self.getSetting("MIN_IDENTITY", float)
+        self.maxRefGap = self.getSetting("MAX_REF_GAP", int)
+        self.maxReadGap = self.getSetting("MAX_READ_GAP", int)
+        self.minAlignability = self.getSetting("MIN_ALIGNABILITY", float)
+        self.maxAnchorDistance = self.getSetting("MAX_ANCHOR_DISTANCE", int)
+        self.minAlignedProportion = self.getSetting("MIN_ALIGNED_PROPORTION",
+                                                    float)
+        self.optimal = self.config.lookup("CLUSTERING") == "optimal"
+
+    def getSetting(self, key, type):
+        """
+        Returns the config value for key converted to the given type, or None
+        if the key is not in the config file.
+        """
+        value = self.config.lookup(key)
+        if value is None:
+            return None
+        return type(value)
+
+    def makeDeduplicator(self):
+        """
+        Returns a Deduplicator configured by the DEDUP_* keys if DEDUPLICATE
+        is "coordinates", else None.
+        """
+        if self.config.lookup("DEDUPLICATE") != "coordinates":
+            return None
+        from Deduplicator import Deduplicator
+        maxEntries = self.getSetting("DEDUP_MAX_ENTRIES", int)
+        return Deduplicator(
+            umiTag=self.config.lookup("DEDUP_UMI_TAG"),
+            umiField=self.getSetting("DEDUP_UMI_FIELD", int),
+            umiSeparator=self.config.lookup("DEDUP_UMI_SEPARATOR") or ":",
+            maxEntries=4000000 if maxEntries is None else maxEntries,
+            spillDir=self.config.lookup("DEDUP_SPILL_DIR"))
+
+    def getTargetWindows(self):
+        """
+        Returns the windows within MAX_ANCHOR_DISTANCE of a cut site, as
+        (chrom,begin,end) triples; overlapping windows are merged.  Only reads
+        overlapping these windows can be binned as anything other than
+        "other".
+        """
+        return self.cutSiteIndex.getWindows(
+            max(self.maxAnchorDistance or 0, 15))
+
+    def loadAlignability(self):
+        """
+        Opens the ENCODE alignability map named by ALIGNABILITY, if any.  A
+        file ending in .alnmap (see convert-alignability.py) is memory-mapped;
+        anything else is read as a bigWig through an AlignabilityCache.
+        """
+        filename = self.config.lookup("ALIGNABILITY")
+        if filename is None:
+            return
+        if filename.endswith(".alnmap"):
+            from MappedAlignability import MappedAlignability
+            self.alignability = MappedAlignability(filename)
+            self.CHROMS = set(self.alignability.chroms.keys())
+            return
+        import pyBigWig
+        from AlignabilityCache import AlignabilityCache
+        self.bigwig = pyBigWig.open(filename)
+        self.CHROMS = set(self.bigwig.chroms().keys())
+        cacheMB = self.getSetting("ALIGNABILITY_CACHE_MB", int)
+        self.alignability = AlignabilityCache(
+            self.bigwig, maxBytes=(256 if cacheMB is None else cacheMB) << 20)
+        preload = self.config.lookup("ALIGNABILITY_PRELOAD") or "targets"
+        if preload == "chroms":
+            for chrom in self.CHROMS:
+                self.alignability.preloadChrom(chrom)
+        elif preload == "targets":
+            for (chrom, begin, end) in self.getTargetWindows():
+                self.alignability.preload(chrom, begin, end)
+
+    def reopenAlignability(self):
+        """
+        Opens a new handle on the alignability bigWig, keeping the cached
+        blocks, for a Tracer inherited by a child process: a file handle
+        shared with the parent would have its read position moved by both.
+        A memory-mapped .alnmap needs nothing.
+        """
+        if self.bigwig is None:
+            return
+        import pyBigWig
+        self.bigwig = pyBigWig.open(self.config.lookup("ALIGNABILITY"))
+        self.alignability.bigwig = self.bigwig
 
     def dump(self, anno, FILE):
         """
-        This method prints out debugging information for the HSPs of a read.
+        This method prints out debugging information for the HSPs of a read,
+        with one write() call per read.
         """
         HSPs = anno.getHSPs()
         numHSPs = len(HSPs)
-        print(anno.getReadID(), numHSPs, sep="\t", file=FILE, flush=True)
+        lines = [anno.getReadID() + "\t" + str(numHSPs) + "\n"]
         for hsp in HSPs:
-            print("\t",
-                  hsp.getRefName(),
-                  Strand.toString(hsp.getStrand()),
-                  hsp.getReadInterval().toString(),
-                  hsp.getRefInterval().toString(),
-                  hsp.getCigar().toString(),
-                  hsp.getPercentIdentity(),
-                  hsp.getAlignability(),
-                  hsp.getSeq(),
-                  sep="\t", file=FILE, flush=True)
+            fields = [hsp.getRefName(),
+                      Strand.toString(hsp.getStrand()),
+                      hsp.getReadInterval().toString(),
+                      hsp.getRefInterval().toString(),
+                      hsp.getCigar().toString(),
+                      hsp.getPercentIdentity(),
+                      hsp.getAlignability(),
+                      hsp.getSeq()]
+            lines.append("\t\t" + "\t".join([str(x) for x in fields]) + "\n")
+        FILE.write("".join(lines))
 
     def bin(self, anno, FILE):
         """
         This method bins a read by writing into a bin file.
         """
-        readSeq = anno.getSamRecord().getSequence()
-        print(anno.getReadID(), readSeq, sep="\t", file=FILE, flush=True)
+        self.binRead(anno.getReadID(), anno.getReadSeq(), FILE)
+
+    def binRead(self, readID, readSeq, FILE):
+        """
+        This method bins a read given just its ID and sequence, as returned
+        by worker processes.  FILE is normally a buffered BinWriter; it is
+        not flushed here.
+        """
+        FILE.write(readID + "\t" + readSeq + "\n")
         self.readsBinned += 1
 
     def getMinAlignability(self, A):
@@ -75,15 +225,257 @@ class Tracer:
         return 0
 
 
+    def lookupAlignability(self, chrom, begin, end):
+        """
+        Returns the minimum alignability over [begin,end) of chrom, or 0 if
+        the map has no data there, using the AlignabilityCache or
+        MappedAlignability if one was loaded, and otherwise calling
+        bigwig.stats() directly.
+        """
+        if self.alignability is not None:
+            minValue = self.alignability.getMin(chrom, begin, end)
+            return 0 if minValue is None else minValue
+        stats = self.bigwig.stats(chrom, begin, end, type="min")
+        return self.getMinAlignability(stats)
+
     def getAlignabilities(self, anno):
         """
-        This calls bigwit.stats() to get the alignabilities for all windows
-        overlapping any HSPs in this annotation
+        This sets each HSP's alignability to the minimum alignability over its
+        reference interval, and the annotation's lowest alignability.
         """
+        start = clock()
+        lowest = None
         for hsp in anno.getHSPs():
             if hsp.getRefName() in self.CHROMS:
                 refCoords = hsp.getRefInterval()
-                stats = self.bigwig.stats(hsp.getRefName(), refCoords.getBegin(),
-                                          refCoords.getEnd(), type="mean")
-                minValue = self.getMinAlignability(stats)
-                hsp.setAlignability(minValue)
+                hsp.setAlignability(self.lookupAlignability(
+                    hsp.getRefName(), refCoords.getBegin(), refCoords.getEnd()))
+            alignability = hsp.getAlignability()
+            if alignability is not None and (lowest is None or
+                                             alignability < lowest):
+                lowest = alignability
+        anno.setLowestAlignability(lowest)
+        self.metrics.addTime("alignability", clock() - start)
+
+    def annotate(self, group):
+        """
+        Builds HSPs for all alignments of a read, discards HSPs below
+        MIN_IDENTITY, and clusters the rest into an annotation.  Returns None
+        if no HSPs are left, counting the read as rejected by MIN_IDENTITY
+        (or NO_HSPS if it had none to begin with).
+        """
+        metrics = self.metrics
+        start = clock()
+        HSPs = self.factory.makeHSPs(group.getReads())
+        metrics.addTime("makeHSPs", clock() - start)
+        if len(HSPs) == 0:
+            metrics.reject("NO_HSPS")
+            return None
+        if self.minIdentity is not None:
+            HSPs = [x for x in HSPs
+                    if x.getPercentIdentity() >= self.minIdentity]
+            if len(HSPs) == 0:
+                metrics.reject("MIN_IDENTITY")
+                return None
+        start = clock()
+        anno = SamAnnotation(SamHspClusterer.cluster(HSPs, self.optimal))
+        metrics.addTime("cluster", clock() - start)
+        return anno
+
+    def filter(self, anno):
+        """
+        Applies the read-level filters from the config file.  Returns the name
+        of the first filter that rejects the read, or None if it passes.
+        """
+        features = anno.getFeatures()
+        if self.maxRefGap is not None and features.sameRef and \
+                features.maxRefGap is not None and \
+                features.maxRefGap > self.maxRefGap:
+            return "MAX_REF_GAP"
+        if self.maxReadGap is not None and features.maxReadGap is not None \
+                and features.maxReadGap > self.maxReadGap:
+            return "MAX_READ_GAP"
+        if self.minAlignability is not None and len(self.CHROMS) > 0:
+            self.getAlignabilities(anno)
+            lowest = anno.getLowestAlignability()
+            if lowest is not None and lowest < self.minAlignability:
+                return "MIN_ALIGNABILITY"
+        if self.minAlignedProportion is not None and \
+                anno.alignedProportion() < self.minAlignedProportion:
+            return "MIN_ALIGNED_PROPORTION"
+        return None
+
+    def nearestCutSiteDistance(self, chrom, pos):
+        """
+        Returns the distance from pos to the nearest cut site on chrom, or
+        None if there are none.
+        """
+        return self.cutSiteIndex.nearestDistance(chrom, pos)
+
+    def assignTarget(self, anno):
+        """
+        Returns the ID of the target locus of a read: the target whose cut
+        site is nearest to the reference span of its HSPs, if they are all on
+        one chromosome and within MAX_ANCHOR_DISTANCE of it; otherwise None.
+        """
+        HSPs = anno.getHSPs()
+        if len(HSPs) == 0 or not anno.allRefsSame():
+            return None
+        begin = min(hsp.getSummary().refBegin for hsp in HSPs)
+        end = max(hsp.getSummary().refEnd for hsp in HSPs)
+        return self.cutSiteIndex.assignTarget(anno.firstRef(), begin, end,
+                                              self.maxAnchorDistance)
+
+    def classify(self, anno):
+        """
+        Assigns a filtered read to one of the bins in Tracer.BINS: a deletion
+        between cut sites (two anchors, each within MAX_ANCHOR_DISTANCE of a
+        cut site), an indel near a cut site, an intact cut site, or other.
+        """
+        chrom = anno.firstRef()
+        if not anno.allRefsSame() or not self.cutSiteIndex.hasChrom(chrom):
+            return "other"
+        HSPs = anno.getHSPs()
+        if len(HSPs) == 1:
+            hsp = HSPs[0]
+            if hsp.containsOnTargetIndels(self.cutSiteIndex):
+                return "indel"
+            ref = hsp.getRefInterval()
+            if self.cutSiteIndex.spansSite(chrom, ref.getBegin(), ref.getEnd()):
+                return "intact"
+            return "other"
+        if len(HSPs) == 2 and anno.allSameStrand():
+            (left, right) = sorted(HSPs,
+                                   key=lambda x: x.getRefInterval().getBegin())
+            leftEnd = left.getRefInterval().getEnd()
+            rightBegin = right.getRefInterval().getBegin()
+            maxDistance = self.maxAnchorDistance
+            if leftEnd < rightBegin and (maxDistance is None or (
+                    self.nearestCutSiteDistance(chrom, leftEnd) <= maxDistance
+                    and self.nearestCutSiteDistance(chrom, rightBegin)
+                    <= maxDistance)):
+                return "deletion"
+        return "other"
+
+    def describeOutcome(self, binName, anno):
+        """
+        Returns (targetID,outcome) for a binned read, where targetID is from
+        assignTarget() ("." if none) and outcome is a normalized description
+        of the edit, the same for all reads with the same edit:
+            deletion : "del:CHROM:BEGIN-END", the reference gap between the
+                       anchors (several gaps are joined with ",")
+            indel : "indel:CHROM:" then the indels near a cut site, each as
+                    "D<refPos>+<length>" or "I<refPos>+<length>", joined
+                    with ","
+            intact, other : the bin name
+        """
+        targetID = self.assignTarget(anno)
+        if targetID is None:
+            targetID = "."
+        if binName == "deletion":
+            gaps = anno.getRefGaps()
+            return (targetID, "del:" + anno.firstRef() + ":" + ",".join(
+                [str(x.getBegin()) + "-" + str(x.getEnd()) for x in gaps]))
+        if binName == "indel":
+            hsp = anno.getHSPs()[0]
+            chrom = hsp.getRefName()
+            indels = [op + str(pos) + "+" + str(length)
+                      for (op, pos, length) in hsp.getSummary().indels
+                      if self.cutSiteIndex.overlapsWindow(chrom, pos,
+                                                          pos + length)]
+            return (targetID, "indel:" + chrom + ":" + ",".join(indels))
+        return (targetID, binName)
+
+    def processGroup(self, group):
+        """
+        Runs the whole per-read pipeline on one read group.  Returns a pair
+        (binName,anno), where binName is None if the read was filtered out
+        (anno is None if no HSPs survived MIN_IDENTITY).
+        """
+        metrics = self.metrics
+        metrics.count("reads")
+        anno = self.annotate(group)
+        if anno is None:
+            return (None, anno)
+        filterName = self.filter(anno)
+        if filterName is not None:
+            metrics.reject(filterName)
+            return (None, anno)
+        start = clock()
+        binName = self.classify(anno)
+        metrics.addTime("classify", clock() - start)
+        metrics.addBin(binName)
+        return (binName, anno)
+
+    def processBatch(self, groups):
+        """
+        Does the same as calling processGroup() on each group, but builds a
+        columnar HspBatch and applies MIN_IDENTITY, clustering and the gap and
+        aligned-proportion filters with vectorized operations; SamHSPs are
+        only made for reads that pass.  Returns one (binName,anno) pair per
+        group, where anno is None for reads that were filtered out.  Filters
+        are charged for rejections in the same order as in filter().
+        """
+        metrics = self.metrics
+        metrics.count("reads", len(groups))
+        start = clock()
+        batch = HspBatch(groups, self.factory)
+        metrics.addTime("makeHSPs", clock() - start)
+        start = clock()
+        batch.cluster(self.optimal, self.minIdentity)
+        metrics.addTime("cluster", clock() - start)
+        features = batch.groupFeatures()
+        G = len(groups)
+        hasHSPs = (features["numHSPs"] > 0).tolist()
+        hadHSPs = (np.diff(batch.offsets) > 0).tolist()
+        refGapFails = np.zeros(G, dtype=bool)
+        if self.maxRefGap is not None:
+            refGapFails = features["allRefsSame"] & \
+                (features["maxRefGap"] > self.maxRefGap)
+        readGapFails = np.zeros(G, dtype=bool)
+        if self.maxReadGap is not None:
+            readGapFails = features["maxReadGap"] > self.maxReadGap
+        proportionFails = np.zeros(G, dtype=bool)
+        if self.minAlignedProportion is not None:
+            proportionFails = features["alignedProportion"] < \
+                self.minAlignedProportion
+        (refGapFails, readGapFails, proportionFails) = (
+            refGapFails.tolist(), readGapFails.tolist(),
+            proportionFails.tolist())
+        checkAlignability = self.minAlignability is not None and \
+            len(self.CHROMS) > 0
+        results = []
+        for g in range(G):
+            filterName = None
+            alignabilities = None
+            if not hasHSPs[g]:
+                filterName = "MIN_IDENTITY" if hadHSPs[g] else "NO_HSPS"
+            elif refGapFails[g]:
+                filterName = "MAX_REF_GAP"
+            elif readGapFails[g]:
+                filterName = "MAX_READ_GAP"
+            elif checkAlignability:
+                start = clock()
+                alignabilities = {}
+                for i in batch.selectedOf(g).tolist():
+                    chrom = batch.refNames[batch.refId[i]]
+                    if chrom in self.CHROMS:
+                        alignabilities[i] = self.lookupAlignability(
+                            chrom, int(batch.refBegin[i]), int(batch.refEnd[i]))
+                values = alignabilities.values()
+                if len(values) > 0 and min(values) < self.minAlignability:
+                    filterName = "MIN_ALIGNABILITY"
+                metrics.addTime("alignability", clock() - start)
+            if filterName is None and proportionFails[g]:
+                filterName = "MIN_ALIGNED_PROPORTION"
+            if filterName is not None:
+                metrics.reject(filterName)
+                results.append((None, None))
+                continue
+            start = clock()
+            anno = batch.makeAnnotation(g, alignabilities)
+            binName = self.classify(anno)
+            metrics.addTime("classify", clock() - start)
+            metrics.addBin(binName)
+            results.append((binName, anno))
+        return results
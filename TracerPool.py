@@ -0,0 +1,160 @@
+# =========================================================================
+# This is OPEN SOURCE SOFTWARE governed by the Gnu General Public
+# License (GPL) version 3, as described at www.opensource.org.
+# Copyright (C)2016 William H. Majoros (martiandna@gmail.com).
+# Author: Siyan Liu
+# =========================================================================
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals, generators, nested_scopes, with_statement)
+
+import collections
+import multiprocessing
+
+from Metrics import Metrics, clock
+from Tracer import Tracer
+
+# The Tracer owned by each worker process, created by initWorker()
+TRACER = None
+VECTORIZED = False
+
+
+def initWorker(configFile, vectorized=False):
+    global TRACER, VECTORIZED
+    TRACER = Tracer(configFile)
+    TRACER.loadAlignability()
+    VECTORIZED = vectorized
+
+
+def summarize(tracer, binName, anno):
+    """
+    Returns (binName,readID,readSeq,targetID,outcome) if the read was binned,
+    or None if it was filtered out.
+    """
+    if binName is None:
+        return None
+    (targetID, outcome) = tracer.describeOutcome(binName, anno)
+    return (binName, anno.getReadID(), anno.getReadSeq(), targetID, outcome)
+
+
+def runBatch(tracer, groups, vectorized):
+    """
+    Runs a batch of read groups through the pipeline, one group at a time or
+    as a vectorized HspBatch, and summarizes the results.
+    """
+    if vectorized:
+        results = tracer.processBatch(groups)
+    else:
+        results = [tracer.processGroup(group) for group in groups]
+    return [summarize(tracer, binName, anno) for (binName, anno) in results]
+
+
+def processBatch(groups):
+    """
+    Runs a batch in a worker process.  Returns the results with the metrics
+    collected while running them, which are reset for the next batch.
+    """
+    results = runBatch(TRACER, groups, VECTORIZED)
+    metrics = TRACER.metrics
+    metrics.updatePeakMemory()
+    TRACER.metrics = Metrics()
+    return (results, metrics)
+
+
+class TracerPool:
+    """
+    This class runs the per-read part of the pipeline (HSP construction,
+    clustering, alignability and filtering) on batches of read groups, either
+    in this process or on a pool of worker processes.  Results come back in
+    input order, so writing them out sequentially gives exactly the same bin
+    files as a serial run.  At most maxPending batches are in flight at once,
+    which bounds memory use when reading is faster than the workers.  The
+    metrics of all workers are merged into self.metrics as batches come
+    back, along with the time spent reading input ("parse").  With
+    keepOpen, the workers (or the Tracer of a serial run) are kept for the
+    next call to run(), until close().  A serial pool can be given a Tracer
+    that is already loaded, to share it between pools.
+
+    Attributes:
+        configFile : string
+        processes : int
+        batchSize : int
+        maxPending : int
+        vectorized : boolean (use Tracer.processBatch())
+        metrics : Metrics
+    Instance Methods:
+        pool=TracerPool(configFile,processes=1,batchSize=1000,
+                        vectorized=False,tracer=None)
+        for results in pool.run(stream,keepOpen=False): # a StreamSamReads
+            # results has one (binName,readID,readSeq,targetID,outcome)
+            # or None per read group
+        pool.close() # after runs with keepOpen=True
+    Class Methods:
+        none
+    """
+
+    def __init__(self, configFile, processes=1, batchSize=1000,
+                 vectorized=False, tracer=None):
+        self.configFile = configFile
+        self.vectorized = vectorized
+        self.processes = processes
+        self.batchSize = batchSize
+        self.maxPending = 2 * processes
+        self.metrics = Metrics()
+        self.tracer = tracer
+        if tracer is not None:
+            tracer.metrics = self.metrics
+        self.pool = None
+
+    def batches(self, stream):
+        while True:
+            start = clock()
+            groups = stream.nextBatch(self.batchSize)
+            self.metrics.addTime("parse", clock() - start)
+            if len(groups) == 0:
+                break
+            yield groups
+
+    def collect(self, asyncResult):
+        (results, metrics) = asyncResult.get()
+        self.metrics.merge(metrics)
+        return results
+
+    def run(self, stream, keepOpen=False):
+        """
+        Generates one list of results per batch, in input order.
+        """
+        if self.processes <= 1:
+            if self.tracer is None:
+                self.tracer = Tracer(self.configFile)
+                self.tracer.loadAlignability()
+                self.tracer.metrics = self.metrics
+            for groups in self.batches(stream):
+                yield runBatch(self.tracer, groups, self.vectorized)
+            if not keepOpen:
+                self.tracer = None
+            return
+        if self.pool is None:
+            self.pool = multiprocessing.Pool(
+                self.processes, initWorker, (self.configFile, self.vectorized))
+        try:
+            pending = collections.deque()
+            for groups in self.batches(stream):
+                pending.append(self.pool.apply_async(processBatch, (groups,)))
+                if len(pending) >= self.maxPending:
+                    yield self.collect(pending.popleft())
+            while len(pending) > 0:
+                yield self.collect(pending.popleft())
+        except BaseException:
+            self.pool.terminate()
+            self.pool.join()
+            self.pool = None
+            raise
+        if not keepOpen:
+            self.close()
+
+    def close(self):
+        self.tracer = None
+        if self.pool is not None:
+            self.pool.close()
+            self.pool.join()
+            self.pool = None
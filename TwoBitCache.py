@@ -0,0 +1,122 @@
+# =========================================================================
+# This is OPEN SOURCE SOFTWARE governed by the Gnu General Public
+# License (GPL) version 3, as described at www.opensource.org.
+# Copyright (C)2016 William H. Majoros (martiandna@gmail.com).
+# Author: Siyan Liu
+# =========================================================================
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals, generators, nested_scopes, with_statement)
+
+import collections
+
+import numpy as np
+
+
+class TwoBitBlock:
+    """
+    This class holds the bases of one fixed-size block of a chromosome 2-bit
+    packed, four bases per byte, plus the positions of the bases that are not
+    A/C/G/T (as in the UCSC .2bit format, they are stored as A and restored
+    on unpacking).
+
+    Attributes:
+        length : int
+        packed : uint8 array
+        other : int32 array, sorted block-relative positions of non-ACGT bases
+    Instance Methods:
+        block=TwoBitBlock(codes) # uint8 array of codes, 4 for non-ACGT
+        codes=block.unpack(begin,end) # block-relative coordinates
+        n=block.numBytes()
+    Class Methods:
+        none
+    """
+
+    SHIFTS = np.array([6, 4, 2, 0], dtype=np.uint8)
+
+    def __init__(self, codes):
+        self.length = len(codes)
+        isOther = codes >= 4
+        self.other = np.flatnonzero(isOther).astype(np.int32)
+        codes = np.where(isOther, 0, codes).astype(np.uint8)
+        padded = np.zeros((self.length + 3) // 4 * 4, dtype=np.uint8)
+        padded[:self.length] = codes
+        self.packed = np.bitwise_or.reduce(
+            padded.reshape(-1, 4) << self.SHIFTS, axis=1).astype(np.uint8)
+
+    def unpack(self, begin, end):
+        first = begin // 4
+        last = (end + 3) // 4
+        codes = ((self.packed[first:last, None] >> self.SHIFTS) & 3).reshape(-1)
+        codes = codes[begin - first * 4:end - first * 4]
+        lo = np.searchsorted(self.other, begin, side="left")
+        hi = np.searchsorted(self.other, end, side="left")
+        codes[self.other[lo:hi] - begin] = 4
+        return codes
+
+    def numBytes(self):
+        return self.packed.nbytes + self.other.nbytes
+
+
+class TwoBitCache:
+    """
+    This class caches the 2-bit codes of a genome in fixed-size blocks, each
+    packed four bases per byte, in an LRU cache holding at most maxBytes.
+    Blocks are read on first use through a function returning the codes of a
+    region, so only the blocks touched are ever read and packed.
+
+    Attributes:
+        getLength : function(chrom) returning the length of chrom
+        readCodes : function(chrom,begin,end) returning a uint8 code array
+        blockSize : int
+        maxBytes : int
+        lru : OrderedDict mapping (chrom,blockIndex) to TwoBitBlock
+        lruBytes : int
+    Instance Methods:
+        cache=TwoBitCache(getLength,readCodes,blockSize=1000000,
+                          maxBytes=256000000)
+        codes=cache.getCodes(chrom,begin,end)
+    Private Methods:
+        block=self.getBlock(chrom,index)
+    Class Methods:
+        none
+    """
+
+    def __init__(self, getLength, readCodes, blockSize=1000000,
+                 maxBytes=256000000):
+        self.getLength = getLength
+        self.readCodes = readCodes
+        self.blockSize = blockSize
+        self.maxBytes = maxBytes
+        self.lru = collections.OrderedDict()
+        self.lruBytes = 0
+
+    def getBlock(self, chrom, index):
+        key = (chrom, index)
+        block = self.lru.pop(key, None)
+        if block is None:
+            begin = index * self.blockSize
+            block = TwoBitBlock(self.readCodes(chrom, begin,
+                                               begin + self.blockSize))
+            self.lruBytes += block.numBytes()
+        self.lru[key] = block
+        while self.lruBytes > self.maxBytes and len(self.lru) > 1:
+            (oldKey, old) = self.lru.popitem(last=False)
+            self.lruBytes -= old.numBytes()
+        return block
+
+    def getCodes(self, chrom, begin, end):
+        """
+        Returns the codes of [begin,end) of chrom, clipped to the sequence.
+        """
+        begin = max(0, begin)
+        end = min(end, self.getLength(chrom))
+        if end <= begin:
+            return np.zeros(0, dtype=np.uint8)
+        blockSize = self.blockSize
+        pieces = []
+        for index in range(begin // blockSize, (end - 1) // blockSize + 1):
+            blockBegin = index * blockSize
+            pieces.append(self.getBlock(chrom, index).unpack(
+                max(begin, blockBegin) - blockBegin,
+                min(end, blockBegin + blockSize) - blockBegin))
+        return pieces[0] if len(pieces) == 1 else np.concatenate(pieces)
@@ -0,0 +1,176 @@
+#!/usr/bin/env python
+# =========================================================================
+# This is OPEN SOURCE SOFTWARE governed by the Gnu General Public
+# License (GPL) version 3, as described at www.opensource.org.
+# Copyright (C)2016 William H. Majoros (martiandna@gmail.com).
+# Author: Siyan Liu
+# =========================================================================
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals, generators, nested_scopes, with_statement)
+import argparse
+import multiprocessing
+import os
+import sys
+
+from BinWriter import BinRouter
+from Metrics import Metrics, clock
+from OutcomeAggregator import OutcomeAggregator
+from StreamSamReads import StreamSamReads
+from Tracer import Tracer
+from TracerPool import TracerPool
+
+parser = argparse.ArgumentParser(
+    description="Bins the reads of many samples with one config: the config, "
+                "target sites and alignability map are loaded once and "
+                "shared by a pool of worker processes, each binning one "
+                "sample at a time into OUT_DIR/SAMPLE")
+parser.add_argument("config", help="TRACER config file")
+parser.add_argument("samples",
+                    help="sample sheet: one \"SAMPLE_ID PATH\" per line (tab "
+                         "or space separated; # starts a comment); PATH is a "
+                         "SAM, BAM or CRAM file grouped by read ID, relative "
+                         "to the sample sheet")
+parser.add_argument("outDir", help="directory for the per-sample bin files")
+parser.add_argument("--processes", type=int, default=1,
+                    help="number of samples binned at once (default: 1)")
+parser.add_argument("--batch-size", type=int, default=1000,
+                    help="read groups per batch")
+parser.add_argument("--vectorized", action="store_true",
+                    help="process each batch as a columnar HspBatch")
+parser.add_argument("--threads", type=int, default=1,
+                    help="BGZF decompression threads per BAM/CRAM input")
+parser.add_argument("--reference", default=None,
+                    help="reference FASTA, required for CRAM input")
+parser.add_argument("--compress", choices=("gzip", "bgzf"), default=None,
+                    help="compress the bin files (written as *.txt.gz)")
+parser.add_argument("--buffer-mb", type=int, default=4,
+                    help="output buffer per bin file, in megabytes")
+parser.add_argument("--summary", default=None,
+                    help="count reads per sample, target and editing outcome, "
+                         "and write the counts of all samples into this table")
+parser.add_argument("--max-outcomes", type=int, default=None,
+                    help="with --summary, count at most this many outcomes "
+                         "per sample exactly and estimate the rest")
+parser.add_argument("--no-bins", action="store_true",
+                    help="with --summary, do not write the per-read bin files")
+parser.add_argument("--report", default=None,
+                    help="write stage timings, throughput, filter "
+                         "rejections and peak memory over all samples as "
+                         "JSON to this file")
+
+# The loaded Tracer and the options, inherited by each worker process
+TRACER = None
+ARGS = None
+
+
+def loadSampleSheet(filename):
+    """
+    Returns an array of (sampleID,path) pairs, in file order.
+    """
+    samples = []
+    seen = set()
+    baseDir = os.path.dirname(os.path.abspath(filename))
+    with open(filename, "rt") as IN:
+        for line in IN:
+            fields = line.split("#")[0].split()
+            if len(fields) == 0:
+                continue
+            if len(fields) != 2:
+                raise Exception("Bad line in sample sheet: " + line.rstrip())
+            (sampleID, path) = fields
+            if sampleID in seen:
+                raise Exception("Sample " + sampleID + " is listed twice")
+            seen.add(sampleID)
+            samples.append((sampleID, os.path.join(baseDir, path)))
+    return samples
+
+
+def initWorker():
+    TRACER.reopenAlignability()
+
+
+def binSample(sample):
+    """
+    Bins one sample with the shared Tracer; returns the sample ID, the
+    number of reads binned and of duplicates removed, the aggregator (or
+    None) and the metrics of the sample.
+    """
+    (sampleID, inputFile) = sample
+    args = ARGS
+    tracer = TRACER
+    tracer.readsBinned = 0
+    pool = TracerPool(args.config, batchSize=args.batch_size,
+                      vectorized=args.vectorized, tracer=tracer)
+    metrics = pool.metrics
+    deduplicator = tracer.makeDeduplicator()
+    stream = StreamSamReads(inputFile, dedup=tracer.dedup,
+                            threads=args.threads, reference=args.reference,
+                            deduplicator=deduplicator)
+    aggregator = None if args.summary is None \
+        else OutcomeAggregator(maxOutcomes=args.max_outcomes)
+    bins = () if args.no_bins else Tracer.BINS
+    with BinRouter(os.path.join(args.outDir, sampleID), bins,
+                   compression=args.compress,
+                   bufferSize=args.buffer_mb << 20) as router:
+        for results in pool.run(stream):
+            start = clock()
+            for result in results:
+                if result is None:
+                    continue
+                (binName, readID, readSeq, targetID, outcome) = result
+                if aggregator is not None:
+                    aggregator.add(targetID, binName, outcome)
+                if args.no_bins:
+                    tracer.readsBinned += 1
+                else:
+                    tracer.binRead(readID, readSeq, router.getWriter(binName))
+            metrics.addTime("write", clock() - start)
+    duplicates = 0
+    if deduplicator is not None:
+        deduplicator.close()
+        duplicates = deduplicator.numDuplicates
+        metrics.count("duplicates", duplicates)
+    metrics.updatePeakMemory()
+    return (sampleID, tracer.readsBinned, duplicates, aggregator, metrics)
+
+
+def main():
+    global TRACER, ARGS
+    ARGS = args = parser.parse_args()
+    if args.no_bins and args.summary is None:
+        parser.error("--no-bins requires --summary")
+    if args.max_outcomes is not None and args.max_outcomes < 1:
+        parser.error("--max-outcomes must be at least 1")
+    samples = loadSampleSheet(args.samples)
+    if len(samples) == 0:
+        print("No samples in " + args.samples, file=sys.stderr)
+        sys.exit(1)
+    TRACER = Tracer(args.config)
+    TRACER.loadAlignability()
+    metrics = Metrics()
+    aggregators = []
+    if args.processes <= 1:
+        results = (binSample(sample) for sample in samples)
+    else:
+        context = multiprocessing.get_context("fork")
+        pool = context.Pool(min(args.processes, len(samples)), initWorker)
+        results = pool.imap(binSample, samples)
+    for (sampleID, readsBinned, duplicates, aggregator, sampleMetrics) \
+            in results:
+        metrics.merge(sampleMetrics)
+        if aggregator is not None:
+            aggregators.append((sampleID, aggregator))
+        print(sampleID + "\t" + str(readsBinned) + " reads binned\t" +
+              str(duplicates) + " duplicate fragments removed")
+        sys.stdout.flush()
+    if args.processes > 1:
+        pool.close()
+        pool.join()
+    if args.summary is not None:
+        OutcomeAggregator.writeSamples(args.summary, aggregators)
+    if args.report is not None:
+        metrics.writeReport(args.report)
+
+
+if __name__ == "__main__":
+    main()
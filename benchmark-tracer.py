@@ -0,0 +1,187 @@
+#!/usr/bin/env python
+# =========================================================================
+# This is OPEN SOURCE SOFTWARE governed by the Gnu General Public
+# License (GPL) version 3, as described at www.opensource.org.
+# Copyright (C)2016 William H. Majoros (martiandna@gmail.com).
+# Author: Siyan Liu
+# =========================================================================
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals, generators, nested_scopes, with_statement)
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import shutil
+import sys
+import tempfile
+
+from BinWriter import BinRouter
+from Metrics import clock, peakMemory
+from ReadSimulator import ReadSimulator
+from SamAnnotation import SamAnnotation
+from SamHspClusterer import SamHspClusterer
+from SamHspFactory import SamHspFactory
+from StreamSamReads import StreamSamReads
+from Tracer import Tracer
+from TracerPool import TracerPool
+
+parser = argparse.ArgumentParser(
+    description="Times each stage of the HSP pipeline (parsing, makeHSPs, "
+                "clustering, annotation) and end-to-end binning on simulated "
+                "libraries of several sizes, reports throughput and peak "
+                "memory, and saves or compares against a baseline")
+parser.add_argument("--sizes", default="1000,10000,100000",
+                    help="comma-separated numbers of simulated fragments")
+parser.add_argument("--repeat", type=int, default=3,
+                    help="runs per stage; the fastest is reported")
+parser.add_argument("--seed", type=int, default=1, help="simulation seed")
+parser.add_argument("--workdir", default=None,
+                    help="directory for the simulated libraries, kept between "
+                         "runs (default: a temporary directory)")
+parser.add_argument("--save", default=None,
+                    help="save the results as a JSON baseline")
+parser.add_argument("--baseline", default=None,
+                    help="compare against a baseline saved with --save")
+parser.add_argument("--tolerance", type=float, default=0.2,
+                    help="with --baseline, report stages slower by more than "
+                         "this fraction as regressions (default: 0.2)")
+
+STAGES = ("parse", "makeHSPs", "cluster", "annotate", "binning",
+          "binningVectorized")
+
+
+def bestOf(repeat, run):
+    """
+    Calls run() repeat times; returns the fastest time, in seconds, and what
+    run() returned.
+    """
+    best = None
+    for i in range(repeat):
+        start = clock()
+        value = run()
+        elapsed = clock() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return (best, value)
+
+
+def readGroups(samFile):
+    return list(StreamSamReads(samFile))
+
+
+def binAll(configFile, samFile, vectorized):
+    tracer = Tracer(configFile)
+    pool = TracerPool(configFile, vectorized=vectorized)
+    outDir = tempfile.mkdtemp(prefix="tracer-bench-")
+    try:
+        stream = StreamSamReads(samFile, dedup=tracer.dedup)
+        with BinRouter(outDir, Tracer.BINS) as router:
+            for results in pool.run(stream):
+                for result in results:
+                    if result is not None:
+                        (binName, readID, readSeq, targetID, outcome) = result
+                        tracer.binRead(readID, readSeq,
+                                       router.getWriter(binName))
+    finally:
+        shutil.rmtree(outDir, ignore_errors=True)
+
+
+def benchmarkLibrary(prefix, repeat):
+    """
+    Runs every stage on one simulated library; called in a fresh worker
+    process, so the peak memory is that of this library alone.
+    """
+    samFile = prefix + ".sam"
+    configFile = prefix + ".config"
+    times = {}
+    (times["parse"], groups) = bestOf(repeat, lambda: readGroups(samFile))
+    factory = SamHspFactory()
+    (times["makeHSPs"], HSPs) = bestOf(repeat, lambda: [
+        factory.makeHSPs(group.getReads()) for group in groups])
+    HSPs = [x for x in HSPs if len(x) > 0]
+    (times["cluster"], clusters) = bestOf(repeat, lambda: [
+        SamHspClusterer.cluster(x) for x in HSPs])
+    (times["annotate"], annotations) = bestOf(repeat, lambda: [
+        SamAnnotation(x).getFeatures() for x in clusters])
+    (times["binning"], ignored) = bestOf(
+        repeat, lambda: binAll(configFile, samFile, False))
+    (times["binningVectorized"], ignored) = bestOf(
+        repeat, lambda: binAll(configFile, samFile, True))
+    peak = peakMemory()
+    return {"reads": len(groups),
+            "stageSeconds": times,
+            "peakMemoryMB": None if peak is None
+            else round(peak / (1 << 20), 1)}
+
+
+def formatRow(fields, widths):
+    return "  ".join(str(x).rjust(w) for (x, w) in zip(fields, widths))
+
+
+def main():
+    args = parser.parse_args()
+    sizes = [int(x) for x in args.sizes.split(",")]
+    workdir = args.workdir
+    if workdir is None:
+        workdir = tempfile.mkdtemp(prefix="tracer-bench-")
+    elif not os.path.exists(workdir):
+        os.makedirs(workdir)
+    results = {}
+    try:
+        for size in sizes:
+            prefix = os.path.join(workdir, "sim" + str(size) + "-" +
+                                  str(args.seed))
+            if not os.path.exists(prefix + ".config"):
+                ReadSimulator(seed=args.seed).writeAll(prefix, size)
+            pool = multiprocessing.Pool(1, maxtasksperchild=1)
+            try:
+                results[str(size)] = pool.apply(benchmarkLibrary,
+                                                (prefix, args.repeat))
+            finally:
+                pool.terminate()
+                pool.join()
+    finally:
+        if args.workdir is None:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    baseline = None
+    if args.baseline is not None:
+        with open(args.baseline, "rt") as IN:
+            baseline = json.load(IN)["sizes"]
+    widths = (10, 18, 10, 12, 10)
+    print(formatRow(("fragments", "stage", "seconds", "reads/s", "change"),
+                    widths))
+    regressions = []
+    for size in sizes:
+        result = results[str(size)]
+        old = None if baseline is None else baseline.get(str(size))
+        for stage in STAGES:
+            seconds = result["stageSeconds"][stage]
+            change = ""
+            if old is not None and stage in old["stageSeconds"]:
+                ratio = seconds / old["stageSeconds"][stage]
+                change = "{:+.1%}".format(ratio - 1)
+                if ratio > 1 + args.tolerance:
+                    change += " !"
+                    regressions.append((size, stage))
+            print(formatRow((size, stage, round(seconds, 3),
+                             int(result["reads"] / seconds), change), widths))
+        print(formatRow((size, "peak memory MB", result["peakMemoryMB"], "",
+                         ""), widths))
+
+    if args.save is not None:
+        with open(args.save, "wt") as OUT:
+            json.dump({"python": platform.python_version(),
+                       "platform": platform.platform(),
+                       "seed": args.seed,
+                       "repeat": args.repeat,
+                       "sizes": results}, OUT, indent=2, sort_keys=True)
+            OUT.write("\n")
+    if len(regressions) > 0:
+        print(len(regressions), "stages slower than the baseline by more than",
+              "{:.0%}".format(args.tolerance), file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,220 @@
+#!/usr/bin/env python
+# =========================================================================
+# This is OPEN SOURCE SOFTWARE governed by the Gnu General Public
+# License (GPL) version 3, as described at www.opensource.org.
+# Copyright (C)2016 William H. Majoros (martiandna@gmail.com).
+# Author: Siyan Liu
+# =========================================================================
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals, generators, nested_scopes, with_statement)
+import argparse
+import os
+import sys
+
+from BinWriter import BinRouter
+from Checkpoint import Checkpoint, StreamSegment
+from OutcomeAggregator import OutcomeAggregator
+from Metrics import Metrics, clock
+from Pipeline import ReadAheadStream, WriterThread
+from StreamSamReads import StreamSamReads
+from Tracer import Tracer
+from TracerPool import TracerPool
+
+parser = argparse.ArgumentParser(
+    description="Bins the reads in a name-sorted SAM/BAM/CRAM file by editing "
+                "outcome, writing one bin file per outcome into OUT_DIR")
+parser.add_argument("config", help="TRACER config file")
+parser.add_argument("input", help="SAM, BAM or CRAM file, grouped by read ID")
+parser.add_argument("outDir", help="directory for the bin files")
+parser.add_argument("--processes", type=int, default=1,
+                    help="number of worker processes (default: 1, serial)")
+parser.add_argument("--batch-size", type=int, default=1000,
+                    help="read groups per batch sent to a worker")
+parser.add_argument("--vectorized", action="store_true",
+                    help="process each batch as a columnar HspBatch")
+parser.add_argument("--threads", type=int, default=1,
+                    help="BGZF decompression threads for BAM/CRAM input")
+parser.add_argument("--reference", default=None,
+                    help="reference FASTA, required for CRAM input")
+parser.add_argument("--regions", action="store_true",
+                    help="input is an indexed, coordinate-sorted BAM/CRAM: "
+                         "only fetch reads near the cut sites")
+parser.add_argument("--unsorted", action="store_true",
+                    help="input is not grouped by read ID (e.g., it is "
+                         "coordinate-sorted): group it here, spilling to disk "
+                         "beyond --group-memory-mb")
+parser.add_argument("--group-memory-mb", type=int, default=1024,
+                    help="with --unsorted, memory for grouping reads, in "
+                         "megabytes")
+parser.add_argument("--tmp-dir", default=None,
+                    help="with --unsorted, directory for the spilled runs "
+                         "(default: the system's temporary directory)")
+parser.add_argument("--compress", choices=("gzip", "bgzf"), default=None,
+                    help="compress the bin files (written as *.txt.gz)")
+parser.add_argument("--buffer-mb", type=int, default=4,
+                    help="output buffer per bin file, in megabytes")
+parser.add_argument("--pipeline", action="store_true",
+                    help="read input and write bins on separate threads, "
+                         "overlapping them with processing")
+parser.add_argument("--queue-depth", type=int, default=4,
+                    help="with --pipeline, batches buffered between stages")
+parser.add_argument("--summary", default=None,
+                    help="also count reads per target and editing outcome, "
+                         "and write the counts into this table")
+parser.add_argument("--max-outcomes", type=int, default=None,
+                    help="with --summary, count at most this many outcomes "
+                         "exactly and estimate the rest in fixed memory")
+parser.add_argument("--no-bins", action="store_true",
+                    help="with --summary, do not write the per-read bin files")
+parser.add_argument("--progress", type=float, default=None,
+                    help="print a progress line to stderr every this many "
+                         "seconds")
+parser.add_argument("--report", default=None,
+                    help="write stage timings, throughput, filter "
+                         "rejections and peak memory as JSON to this file")
+parser.add_argument("--checkpoint", default=None,
+                    help="directory for checkpoints; if it holds one from an "
+                         "interrupted run with the same settings, the run is "
+                         "resumed from there")
+parser.add_argument("--checkpoint-every", type=int, default=1000000,
+                    help="with --checkpoint, read groups between checkpoints")
+args = parser.parse_args()
+if args.no_bins and args.summary is None:
+    parser.error("--no-bins requires --summary")
+if args.max_outcomes is not None and args.max_outcomes < 1:
+    parser.error("--max-outcomes must be at least 1")
+if args.unsorted and args.regions:
+    parser.error("--unsorted and --regions cannot be combined")
+if args.checkpoint is not None and (args.unsorted or args.regions):
+    parser.error("--checkpoint needs input grouped by read ID, read in order")
+if args.checkpoint is not None and args.input.lower().endswith(".cram"):
+    parser.error("--checkpoint cannot resume CRAM input; use SAM or BAM")
+
+tracer = Tracer(args.config)
+deduplicator = tracer.makeDeduplicator()
+if args.regions:
+    from RegionSamReads import RegionSamReads
+    stream = RegionSamReads(args.input, tracer.getTargetWindows(),
+                            dedup=tracer.dedup, threads=args.threads,
+                            reference=args.reference,
+                            deduplicator=deduplicator)
+elif args.unsorted:
+    from NameGroupedReads import NameGroupedReads
+    stream = NameGroupedReads(args.input, dedup=tracer.dedup,
+                              threads=args.threads, reference=args.reference,
+                              deduplicator=deduplicator,
+                              maxBytes=args.group_memory_mb << 20,
+                              spillDir=args.tmp_dir)
+else:
+    stream = StreamSamReads(args.input, dedup=tracer.dedup,
+                            threads=args.threads, reference=args.reference,
+                            deduplicator=deduplicator)
+pool = TracerPool(args.config, processes=args.processes,
+                  batchSize=args.batch_size, vectorized=args.vectorized)
+aggregator = None if args.summary is None \
+    else OutcomeAggregator(maxOutcomes=args.max_outcomes)
+bins = () if args.no_bins else Tracer.BINS
+metrics = pool.metrics
+
+checkpoint = None
+resumeAt = None
+if args.checkpoint is not None:
+    checkpoint = Checkpoint(args.checkpoint, {
+        "input": os.path.abspath(args.input),
+        "inputSize": os.path.getsize(args.input),
+        "inputTime": os.path.getmtime(args.input),
+        "config": os.path.abspath(args.config),
+        "outDir": os.path.abspath(args.outDir),
+        "compress": args.compress,
+        "noBins": args.no_bins,
+        "summary": args.summary,
+        "maxOutcomes": args.max_outcomes,
+        "checkpointEvery": args.checkpoint_every})
+    state = checkpoint.load()
+    if state is not None:
+        stream.setState(state["stream"])
+        if deduplicator is not None:
+            deduplicator.loadState(state["dedupDir"], state["dedup"])
+        tracer.readsBinned = state["readsBinned"]
+        metrics.merge(state["metrics"])
+        aggregator = state["aggregator"]
+        resumeAt = state["bins"]
+        print("Resuming after", tracer.readsBinned, "reads binned",
+              file=sys.stderr)
+
+
+def writeResults(results):
+    start = clock()
+    for result in results:
+        if result is None:
+            continue
+        (binName, readID, readSeq, targetID, outcome) = result
+        if aggregator is not None:
+            aggregator.add(targetID, binName, outcome)
+        if args.no_bins:
+            tracer.readsBinned += 1
+        else:
+            tracer.binRead(readID, readSeq, router.getWriter(binName))
+    metrics.addTime("write", clock() - start)
+
+
+def showProgress():
+    if args.progress is not None and metrics.progressDue(args.progress):
+        print(metrics.progressLine(), file=sys.stderr)
+
+
+def binStream(stream):
+    """
+    Bins every read group of a stream; on return, all results are written.
+    """
+    if args.pipeline:
+        stream = ReadAheadStream(stream, args.batch_size, args.queue_depth)
+        try:
+            with WriterThread(writeResults, args.queue_depth) as writer:
+                for results in pool.run(stream, keepOpen=True):
+                    writer.put(results)
+                    showProgress()
+        finally:
+            stream.close()
+    else:
+        for results in pool.run(stream, keepOpen=True):
+            writeResults(results)
+            showProgress()
+
+
+def saveCheckpoint():
+    saved = Metrics()
+    saved.merge(metrics)
+    saved.peakMemory = {}
+    checkpoint.save({"stream": stream.getState(),
+                     "readsBinned": tracer.readsBinned,
+                     "metrics": saved,
+                     "aggregator": aggregator,
+                     "bins": router.checkpoint()}, deduplicator)
+
+
+with BinRouter(args.outDir, bins, compression=args.compress,
+               bufferSize=args.buffer_mb << 20, resumeAt=resumeAt) as router:
+    if checkpoint is None:
+        binStream(stream)
+    else:
+        while True:
+            segment = StreamSegment(stream, args.checkpoint_every)
+            binStream(segment)
+            if segment.atEnd:
+                break
+            saveCheckpoint()
+pool.close()
+if args.unsorted:
+    stream.close()
+if aggregator is not None:
+    aggregator.write(args.summary)
+if deduplicator is not None:
+    deduplicator.close()
+    metrics.count("duplicates", deduplicator.numDuplicates)
+    print(deduplicator.numDuplicates, "duplicate fragments removed")
+if args.report is not None:
+    metrics.writeReport(args.report)
+if checkpoint is not None:
+    checkpoint.remove()
+print(tracer.readsBinned, "reads binned")
@@ -0,0 +1,25 @@
+#!/usr/bin/env python
+# =========================================================================
+# This is OPEN SOURCE SOFTWARE governed by the Gnu General Public
+# License (GPL) version 3, as described at www.opensource.org.
+# Copyright (C)2016 William H. Majoros (martiandna@gmail.com).
+# Author: Siyan Liu
+# =========================================================================
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals, generators, nested_scopes, with_statement)
+import sys
+
+import pyBigWig
+
+import ProgramName
+from MappedAlignability import MappedAlignability
+
+if len(sys.argv) not in (3, 4):
+    exit(ProgramName.get() + " <in.bigWig> <out.alnmap> [uint8|float16]\n")
+(inFile, outFile) = sys.argv[1:3]
+dtype = sys.argv[3] if len(sys.argv) == 4 else "uint8"
+if dtype not in ("uint8", "float16"):
+    exit("dtype must be uint8 or float16")
+bigwig = pyBigWig.open(inFile)
+MappedAlignability.convert(bigwig, outFile, dtype)
+bigwig.close()
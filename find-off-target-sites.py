@@ -0,0 +1,42 @@
+#!/usr/bin/env python
+#=========================================================================
+# This is OPEN SOURCE SOFTWARE governed by the Gnu General Public
+# License (GPL) version 3, as described at www.opensource.org.
+# Author: William H. Majoros (bmajoros@alumni.duke.edu)
+#=========================================================================
+from __future__ import (absolute_import, division, print_function, 
+   unicode_literals, generators, nested_scopes, with_statement)
+from builtins import (bytes, dict, int, list, object, range, str, ascii,
+   chr, hex, input, next, oct, open, pow, round, super, filter, map, zip)
+# The above imports should allow this program to run in both Python 2 and
+# Python 3.  You might need to update your version of module "future".
+import argparse
+from IndexedFasta import IndexedFasta
+from TargetSiteFinder import Guide, TargetSite
+from OffTargetScanner import OffTargetScanner
+
+parser=argparse.ArgumentParser(
+    description="Finds every site (with PAM, on both strands) within a given "
+                "number of mismatches of a set of guides, and prints a table "
+                "of sites sorted by chromosome and position")
+parser.add_argument("genome",help="genome FASTA file (indexed if there is "
+                    "no .fai index yet)")
+parser.add_argument("guides",help="guide file: one \"ID SEQUENCE\" per line")
+parser.add_argument("--mismatches",type=int,default=3,
+                    help="maximum number of mismatches (default: 3)")
+parser.add_argument("--pam",default="NGG",help="PAM, in IUPAC codes "
+                    "(default: NGG; use \"\" for none)")
+parser.add_argument("--cut-offset",type=int,default=-3,
+                    help="cut position relative to the 3' end of the "
+                         "protospacer (default: -3)")
+parser.add_argument("--processes",type=int,default=1,
+                    help="number of worker processes, one chromosome at a "
+                         "time each (default: 1)")
+args=parser.parse_args()
+
+guides=Guide.load(args.guides)
+scanner=OffTargetScanner(guides,args.mismatches,args.pam,args.cut_offset)
+genome=IndexedFasta(args.genome)
+sites=scanner.scanGenome(genome,args.processes)
+print(TargetSite.HEADER)
+for site in sites: print(site.toString())
@@ -10,26 +10,48 @@ from builtins import (bytes, dict, int, list, object, range, str, ascii,
    chr, hex, input, next, oct, open, pow, round, super, filter, map, zip)
 # The above imports should allow this program to run in both Python 2 and
 # Python 3.  You might need to update your version of module "future".
+import argparse
 import sys
-import ProgramName
-from FastaReader import FastaReader
-from Translation import Translation
-
-V_50_9="CACCACTCACCTC"
-V_51_1="GACCATTTCCCAC"
-V_50_9=Translation.reverseComplement(V_50_9)
-V_51_1=Translation.reverseComplement(V_51_1)
-
-CHR_X="/home/bmajoros/Reference_Data/Genomes/hg19/chrX.fa"
-
-(defline,chrX)=FastaReader.firstSequence(CHR_X)
-for i in range(31140035,33229429):
-    if(V_50_9==chrX[i:(i+13)]): print("V_50_9\t",i)
-    if(V_51_1==chrX[i:(i+13)]): print("V_51_1\t",i+13)
-
-
-
-
-
-
-
+from IndexedFasta import IndexedFasta
+from TargetSiteFinder import Guide, TargetSite, TargetSiteFinder
+
+parser=argparse.ArgumentParser(
+    description="Finds every exact occurrence (with PAM, on both strands) of "
+                "a set of guides in a genome and prints a table of sites")
+parser.add_argument("genome",help="genome FASTA file (indexed if there is "
+                    "no .fai index yet)")
+parser.add_argument("guides",help="guide file: one \"ID SEQUENCE\" per line")
+parser.add_argument("--pam",default="NGG",help="PAM, in IUPAC codes "
+                    "(default: NGG; use \"\" for none)")
+parser.add_argument("--cut-offset",type=int,default=-3,
+                    help="cut position relative to the 3' end of the "
+                         "protospacer (default: -3)")
+parser.add_argument("--config",default=None,
+                    help="TRACER config file to write the cut sites into; "
+                         "only guides with exactly one site are used, and "
+                         "sites on several chromosomes go into a site table "
+                         "next to it")
+args=parser.parse_args()
+
+guides=Guide.load(args.guides)
+finder=TargetSiteFinder(guides,args.pam,args.cut_offset)
+sites=[]
+genome=IndexedFasta(args.genome)
+for chrom in genome.getChromNames():
+    sites.extend(finder.searchGenome(genome,chrom))
+print(TargetSite.HEADER)
+for site in sites: print(site.toString())
+
+if(args.config):
+    counts={}
+    for site in sites: counts[site.guideID]=counts.get(site.guideID,0)+1
+    for guide in guides:
+        n=counts.get(guide.ID,0)
+        if(n!=1): print(guide.ID,"has",n,"sites; not used",file=sys.stderr)
+    unique=[site for site in sites if counts[site.guideID]==1]
+    if(len(unique)==0):
+        print("No guide has exactly one site;",args.config,"not changed",
+              file=sys.stderr)
+        sys.exit(1)
+    tableFile=TargetSiteFinder.writeConfig(args.config,unique)
+    if(tableFile): print("Sites written to",tableFile,file=sys.stderr)
@@ -0,0 +1,37 @@
+#!/usr/bin/env python
+# =========================================================================
+# This is OPEN SOURCE SOFTWARE governed by the Gnu General Public
+# License (GPL) version 3, as described at www.opensource.org.
+# Copyright (C)2016 William H. Majoros (martiandna@gmail.com).
+# Author: Siyan Liu
+# =========================================================================
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals, generators, nested_scopes, with_statement)
+import argparse
+
+from ReadSimulator import ReadSimulator
+
+parser = argparse.ArgumentParser(
+    description="Simulates a name-grouped SAM file of CRISPR reads (deletions "
+                "between two cut sites, indels, intact sites, chimeras, "
+                "off-target, unmapped and duplicate reads) on a random "
+                "reference, and writes PREFIX.fa, PREFIX.alnmap, PREFIX.sam, "
+                "PREFIX.truth.tsv and a config file PREFIX.config")
+parser.add_argument("prefix", help="prefix of the output files")
+parser.add_argument("--reads", type=int, default=10000,
+                    help="number of fragments (default: 10000)")
+parser.add_argument("--seed", type=int, default=1,
+                    help="random seed (default: 1)")
+parser.add_argument("--ref-length", type=int, default=100000,
+                    help="length of each reference chromosome")
+parser.add_argument("--read-length", type=int, default=150,
+                    help="read length (default: 150)")
+parser.add_argument("--error-rate", type=float, default=0.002,
+                    help="substitution rate of sequencing errors")
+args = parser.parse_args()
+
+simulator = ReadSimulator(seed=args.seed, refLength=args.ref_length,
+                          readLength=args.read_length,
+                          errorRate=args.error_rate)
+simulator.writeAll(args.prefix, args.reads)
+print(args.reads, "fragments written to", args.prefix + ".sam")